@@ -0,0 +1,65 @@
+// Builds map overlays (legends, titles, lists) from the JSON specs that map_assets.py embeds, so each
+// generated map only carries its data and shares the markup and styling.
+(function () {
+    function element(tag, className, html) {
+        var node = document.createElement(tag);
+        if (className) node.className = className;
+        if (html !== undefined) node.innerHTML = html;
+        return node;
+    }
+
+    function formatValue(value) {
+        return typeof value === "number" ? value.toFixed(2) : value;
+    }
+
+    var renderers = {
+        text: function (spec) {
+            return element("div", "mbta-panel " + (spec.style || ""), spec.html);
+        },
+
+        gradient: function (spec) {
+            var panel = element("div", "mbta-panel mbta-gradient");
+            var box = panel.appendChild(element("div", "bar-box"));
+            var bar = box.appendChild(element("div", "bar"));
+            bar.style.background = "linear-gradient(to top, " + spec.colors.join(", ") + ")";
+            var low = spec.ticks[0], high = spec.ticks[spec.ticks.length - 1];
+            spec.ticks.forEach(function (value, i) {
+                var tick = box.appendChild(element("div", "tick", formatValue(value)));
+                var share = spec.positions ? spec.positions[i] : (high > low ? (value - low) / (high - low) : i / 2);
+                tick.style.bottom = (share * 100) + "%";
+            });
+            if (spec.caption) panel.appendChild(element("div", "caption", spec.caption));
+            return panel;
+        },
+
+        categories: function (spec) {
+            var panel = element("div", "mbta-panel " + (spec.style || ""), spec.title ? "<b>" + spec.title + "</b><br>" : "");
+            spec.items.forEach(function (item) {
+                var row = panel.appendChild(element("div"));
+                row.appendChild(element("span", "mbta-swatch")).style.backgroundColor = item[1];
+                row.appendChild(document.createTextNode(item[0]));
+            });
+            return panel;
+        },
+
+        list: function (spec) {
+            var panel = element("div", "mbta-panel mbta-top-right", "<h4>" + spec.title + "</h4>");
+            var list = panel.appendChild(element("ul"));
+            spec.items.forEach(function (item) {
+                list.appendChild(element("li", null, item[0] + ": <b>" + formatValue(item[1]) + "</b>"));
+            });
+            if (spec.more > 0) list.appendChild(element("li", null, "... and <b>" + spec.more + "</b> more stations"));
+            return panel;
+        }
+    };
+
+    document.addEventListener("DOMContentLoaded", function () {
+        var bottom = element("div", "mbta-bottom");
+        document.body.appendChild(bottom);
+        document.querySelectorAll("script.mbta-overlay").forEach(function (node) {
+            var spec = JSON.parse(node.textContent);
+            var panel = renderers[spec.type](spec);
+            (spec.slot === "bottom" ? bottom : document.body).appendChild(panel);
+        });
+    });
+})();
@@ -0,0 +1,34 @@
+import domirank
+
+from benchmarks.datasets import default_datasets, get_dataset
+from benchmarks.harness import benchmark
+
+
+# Sigma values tried by optimal_sigma (one worker process each)
+sigma_sweep = 16
+
+
+def valid_sigma(adjacency):
+    """ Half of the largest sigma for which DomiRank still converges. """
+    return -0.5 / domirank.find_eigenvalue(adjacency)
+
+
+@benchmark(params={"dataset": default_datasets})
+def domirank_centrality(dataset):
+    adjacency = get_dataset(dataset).adjacency()
+    sigma = valid_sigma(adjacency)
+    yield lambda: domirank.domirank(adjacency, sigma)
+
+
+@benchmark(params={"dataset": default_datasets}, repeat=3)
+def find_eigenvalue(dataset):
+    adjacency = get_dataset(dataset).adjacency()
+    yield lambda: domirank.find_eigenvalue(adjacency)
+
+
+@benchmark(params={"dataset": default_datasets}, repeat=3, max_time=60.0)
+def optimal_sigma(dataset):
+    """ Sigma sweep with attack simulation; the eigenvalue bound is computed once in setup. """
+    adjacency = get_dataset(dataset).adjacency()
+    end_value = domirank.find_eigenvalue(adjacency)
+    yield lambda: domirank.optimal_sigma(adjacency, endVal=end_value, iterationNo=sigma_sweep)
@@ -0,0 +1,82 @@
+import os
+
+from benchmarks.datasets import default_datasets, use_dataset
+from benchmarks.harness import benchmark, SkipBenchmark
+
+
+time_of_day = "AM_PEAK"
+top_k = 10
+
+# Features compared by the attractiveness overlay window
+overlay_features = ["Attractiveness", "DomiRank", "Betweenness"]
+
+
+def all_layers():
+    import visualizer
+    return list(visualizer.layer_files)
+
+
+@benchmark(params={"dataset": default_datasets})
+def without_features(dataset):
+    import visualizer
+    with use_dataset(dataset):
+        yield visualizer.generate_mbta_map_without_features
+
+
+@benchmark(params={"dataset": default_datasets, "centrality": ["No Centrality", "Betweenness"]})
+def with_centrality(dataset, centrality):
+    import visualizer
+    with use_dataset(dataset):
+        yield lambda: visualizer.generate_mbta_map_with_centrality(centrality, top_k)
+
+
+@benchmark(params={"dataset": default_datasets, "heatmap": [False, True], "layers": [False, True]})
+def threat_feature(dataset, heatmap, layers):
+    import visualizer
+    active_layers = all_layers() if layers else None
+    with use_dataset(dataset):
+        yield lambda: visualizer.generate_threat_feature_map(time_of_day, "Crime_Index", top_k, active_layers, heatmap)
+
+
+@benchmark(params={"dataset": default_datasets, "heatmap": [False, True], "layers": [False, True]})
+def basemap(dataset, heatmap, layers):
+    import visualizer
+    active_layers = all_layers() if layers else None
+    with use_dataset(dataset):
+        yield lambda: visualizer.generate_basemap_feature(time_of_day, active_layers, heatmap)
+
+
+@benchmark(params={"dataset": default_datasets})
+def attractiveness(dataset):
+    import visualizer
+    with use_dataset(dataset):
+        yield lambda: visualizer.generate_attractiveness_map(time_of_day)
+
+
+@benchmark(params={"dataset": default_datasets, "common": [False, True]})
+def overlay(dataset, common):
+    import visualizer
+    feature = overlay_features if common else overlay_features[0]
+    with use_dataset(dataset):
+        yield lambda: visualizer.generate_overlay_singular_map(time_of_day, feature, top_k, common)
+
+
+@benchmark(params={"cached": [False, True]})
+def gtd(cached):
+    """ GTD map from the preprocessed store; uncached runs drop the layer cache and the rendered file first. """
+    from page_3_threat_features.gtd_explorer import get_explorer, make_filters
+    from page_3_threat_features.gtd_window import generate_gtd_map, gtd_map_path
+
+    explorer = get_explorer()
+    if explorer is None:
+        raise SkipBenchmark("GTD data not found")
+    path = gtd_map_path(explorer, make_filters())
+
+    def run():
+        if not cached:
+            explorer.layer_cache.clear()
+            if os.path.exists(path):
+                os.remove(path)
+        generate_gtd_map(open_browser=False)
+
+    yield run
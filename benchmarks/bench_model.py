@@ -0,0 +1,45 @@
+import shutil
+import tempfile
+
+import torch
+
+from benchmarks.datasets import default_datasets, get_dataset
+from benchmarks.harness import benchmark
+from page_3_threat_features.GCN.inference import build_feature_tensor, load_model, simulate_change
+
+
+@benchmark(params={"dataset": default_datasets})
+def gcn_lstm_forward(dataset):
+    """ One GCN_LSTM.forward over all 9 windows with the pretrained weights. """
+    data = get_dataset(dataset)
+    model = load_model()
+    features, edge_index = build_feature_tensor(data.tables()), data.edge_index()
+
+    def run():
+        with torch.no_grad():
+            model(features, edge_index)
+
+    yield run
+
+
+@benchmark(params={"dataset": default_datasets, "model": ["cold", "warm"]})
+def simulate(dataset, model):
+    """
+    Headless what-if simulation (AttractivenessFeaturesApp.simulate_change without Qt) on a scratch
+    copy of the Feature_Label tables. "cold" loads the weights inside every call (the first simulation after
+    a start or a model switch); "warm" reuses one loaded model, like the registry's warm copy in the app.
+    """
+    data = get_dataset(dataset)
+    playground = tempfile.mkdtemp(prefix="mbta_playground_")
+    shutil.copytree(data.feature_folder, playground, dirs_exist_ok=True)
+    warm_model = load_model() if model == "warm" else None
+    station = data.nodes_df["stop_name"].iloc[0]
+
+    def run():
+        simulate_change(playground, "AM_PEAK", station, "Defense_Posture", "High",
+                        model=warm_model if warm_model is not None else load_model(), edge_index=data.edge_index())
+
+    try:
+        yield run
+    finally:
+        shutil.rmtree(playground, ignore_errors=True)
@@ -0,0 +1,10 @@
+import subprocess
+import sys
+
+from benchmarks.harness import benchmark
+
+
+@benchmark(repeat=3, max_time=120.0)
+def import_visualizer():
+    """ Cold `import visualizer` in a fresh interpreter (graph build, centralities, global min/max). """
+    yield lambda: subprocess.run([sys.executable, "-c", "import visualizer"], check=True, capture_output=True)
@@ -0,0 +1,114 @@
+import contextlib
+import os
+import shutil
+import tempfile
+
+import networkx as nx
+import pandas as pd
+
+from page_3_threat_features.feature_store import time_windows, feature_label_path
+from page_3_threat_features.GCN.inference import load_edge_index
+from synthetic_network import generate_network
+
+
+data_folder = "MBTA_graph_data"
+feature_folder = "page_3_threat_features/Feature_Label"
+crime_folder = "page_3_threat_features/Crime_Data"
+layer_folder = "page_3_threat_features/Layer_Information"
+edge_index_path = "page_3_threat_features/GCN/edge_index.csv"
+
+synthetic_seed = 7
+
+# Datasets swept by default; override with run_benchmarks --scales
+default_datasets = ["mbta", "synthetic_1000", "synthetic_10000"]
+
+
+class Dataset:
+    """ A station network plus the folders holding its Feature_Label tables, crime extracts and facility layers. """
+
+    def __init__(self, name, nodes_path, edges_path, feature_folder, crime_folder, layer_folder, edge_index_path,
+                 root=None):
+        self.name = name
+        self.nodes_df = pd.read_csv(nodes_path)
+        self.edges_df = pd.read_csv(edges_path)
+        self.feature_folder = feature_folder
+        self.crime_folder = crime_folder
+        self.layer_folder = layer_folder
+        self.edge_index_path = edge_index_path
+        self.root = root
+
+    def graph(self):
+        G = nx.Graph()
+        for row in self.nodes_df.itertuples():
+            G.add_node(row.ID, stop_name=row.stop_name, pos=(row.Lat, row.Lon))
+        G.add_edges_from(zip(self.edges_df["Source"], self.edges_df["Target"]))
+        return G
+
+    def adjacency(self):
+        return nx.to_scipy_sparse_array(self.graph(), format="csr")
+
+    def edge_index(self):
+        return load_edge_index(self.edge_index_path)
+
+    def tables(self):
+        return {time_of_day: pd.read_csv(feature_label_path(time_of_day, self.feature_folder))
+                for time_of_day in time_windows}
+
+
+def mbta_dataset():
+    return Dataset("mbta", os.path.join(data_folder, "Node_CSV.csv"), os.path.join(data_folder, "Edge_CSV.csv"),
+                   feature_folder, crime_folder, layer_folder, edge_index_path)
+
+
+_datasets = {}
+
+
+def get_dataset(name):
+    """ "mbta" for the real network or "synthetic_<n>" for a generated one (built once per process). """
+    if name not in _datasets:
+        if name == "mbta":
+            _datasets[name] = mbta_dataset()
+        else:
+            root = tempfile.mkdtemp(prefix=f"mbta_{name}_")
+            paths = generate_network(int(name.split("_")[1]), root, seed=synthetic_seed)
+            _datasets[name] = Dataset(name, paths["nodes"], paths["edges"], paths["feature_folder"],
+                                      paths["crime_folder"], paths["layer_folder"], paths["edge_index"], root)
+    return _datasets[name]
+
+
+def cleanup_datasets():
+    for dataset in _datasets.values():
+        if dataset.root is not None:
+            shutil.rmtree(dataset.root, ignore_errors=True)
+    _datasets.clear()
+
+
+@contextlib.contextmanager
+def use_dataset(name, playground=None):
+    """
+    Points the visualizer's module-level data (network, Feature_Label folders, crime and facility
+    folders) at a dataset for the duration of the block. Maps are written to a scratch folder.
+    """
+    import visualizer
+
+    dataset = get_dataset(name)
+    names = ["nodes_df", "edges_df", "G", "threat_folder", "temp_folder", "crime_folder", "layer_folder",
+             "output_folder", "overlay_output_folder"]
+    saved = {attribute: getattr(visualizer, attribute) for attribute in names}
+    output_folder = tempfile.mkdtemp(prefix="mbta_maps_")
+    try:
+        if name != "mbta":
+            visualizer.nodes_df = dataset.nodes_df
+            visualizer.edges_df = dataset.edges_df
+            visualizer.G = dataset.graph()
+            visualizer.threat_folder = dataset.feature_folder
+            visualizer.crime_folder = dataset.crime_folder
+            visualizer.layer_folder = dataset.layer_folder
+        visualizer.temp_folder = playground or dataset.feature_folder
+        visualizer.output_folder = output_folder
+        visualizer.overlay_output_folder = output_folder
+        yield dataset
+    finally:
+        for attribute, value in saved.items():
+            setattr(visualizer, attribute, value)
+        shutil.rmtree(output_folder, ignore_errors=True)
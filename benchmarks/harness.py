@@ -0,0 +1,131 @@
+import contextlib
+import glob
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+
+results_folder = "benchmarks/results"
+
+# A benchmark regresses when its median grows by more than this fraction and by at least min_regression_s
+regression_threshold = 0.2
+min_regression_s = 0.005
+
+registry = []
+
+
+class SkipBenchmark(Exception):
+    """ Raised during setup when a benchmark cannot run here (e.g. missing data). """
+
+
+def benchmark(params=None, repeat=5, max_time=10.0):
+    """
+    Registers a benchmark. The decorated function is a generator taking the parameters as keyword
+    arguments: it does its setup, yields the zero-argument callable to time, and tears down afterwards.
+    `params` maps parameter names to the values to sweep (full cross product).
+    """
+    def register(function):
+        registry.append({
+            "name": f"{function.__module__.split('.')[-1].replace('bench_', '')}.{function.__name__}",
+            "function": function,
+            "params": params or {},
+            "repeat": repeat,
+            "max_time": max_time,
+        })
+        return function
+    return register
+
+
+def expand(entry, overrides=None):
+    """ Yields (case_name, kwargs) for every parameter combination. """
+    params = dict(entry["params"])
+    for key, values in (overrides or {}).items():
+        if key in params:
+            params[key] = values
+    keys = list(params)
+    for combination in itertools.product(*(params[key] for key in keys)):
+        kwargs = dict(zip(keys, combination))
+        suffix = ",".join(f"{key}={value}" for key, value in kwargs.items())
+        yield (f"{entry['name']}[{suffix}]" if suffix else entry["name"]), kwargs
+
+
+def time_case(entry, kwargs, verbose=False):
+    """ Runs setup once, then times the callable up to `repeat` times or until `max_time` is spent. """
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        generator = entry["function"](**kwargs)
+        try:
+            run = next(generator)
+            timings = []
+            started = time.perf_counter()
+            while len(timings) < entry["repeat"]:
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+                if time.perf_counter() - started > entry["max_time"]:
+                    break
+        finally:
+            generator.close()
+
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "runs": len(timings),
+    }
+
+
+def machine_id():
+    return f"{platform.node()}-{platform.machine()}-py{platform.python_version()}"
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(results, folder=results_folder):
+    """ Stores a run as <folder>/<machine>/<timestamp>_<commit>.json and returns the path. """
+    machine_folder = os.path.join(folder, machine_id())
+    os.makedirs(machine_folder, exist_ok=True)
+    commit = git_commit()
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(machine_folder, f"{stamp}_{commit}.json")
+    with open(path, "w") as f:
+        json.dump({"machine": machine_id(), "commit": commit, "timestamp": stamp, "results": results}, f, indent=2)
+    return path
+
+
+def latest_results(folder=results_folder, exclude=None):
+    """ Most recent stored run on this machine, or None. """
+    paths = sorted(glob.glob(os.path.join(folder, machine_id(), "*.json")))
+    paths = [path for path in paths if path != exclude]
+    if not paths:
+        return None
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=regression_threshold):
+    """ Returns [(case, baseline_median, median, ratio)] for cases that got slower than the threshold allows. """
+    regressions = []
+    for case, stats in results.items():
+        previous = baseline["results"].get(case)
+        if previous is None:
+            continue
+        ratio = stats["median"] / previous["median"] if previous["median"] > 0 else float("inf")
+        if ratio > 1 + threshold and stats["median"] - previous["median"] > min_regression_s:
+            regressions.append((case, previous["median"], stats["median"], ratio))
+    return regressions
@@ -0,0 +1,76 @@
+import argparse
+import fnmatch
+import importlib
+import sys
+import traceback
+
+from benchmarks.datasets import cleanup_datasets
+from benchmarks.harness import (
+    registry, expand, time_case, save_results, latest_results, compare, results_folder, regression_threshold,
+    SkipBenchmark
+)
+
+
+benchmark_modules = ["bench_startup", "bench_maps", "bench_model", "bench_domirank"]
+
+
+def run(patterns=None, datasets=None, verbose=False):
+    """ Runs every registered benchmark case matching the glob patterns; returns {case: stats}. """
+    for module in benchmark_modules:
+        importlib.import_module(f"benchmarks.{module}")
+
+    overrides = {"dataset": datasets} if datasets else None
+    results = {}
+    for entry in registry:
+        for case, kwargs in expand(entry, overrides):
+            if patterns and not any(fnmatch.fnmatch(case, pattern) for pattern in patterns):
+                continue
+            try:
+                stats = time_case(entry, kwargs, verbose)
+            except SkipBenchmark as reason:
+                print(f"{case:<70} skipped ({reason})")
+                continue
+            except Exception:
+                print(f"{case:<70} failed")
+                traceback.print_exc()
+                continue
+            results[case] = stats
+            print(f"{case:<70} {stats['median'] * 1000:>10.1f} ms  (min {stats['min'] * 1000:.1f}, n={stats['runs']})")
+    cleanup_datasets()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time startup, map generation, simulation and DomiRank.")
+    parser.add_argument("-k", "--filter", nargs="*", help="Glob patterns on case names, e.g. 'maps.*' '*mbta*'")
+    parser.add_argument("--scales", nargs="*", type=int,
+                        help="Synthetic network sizes to run next to the real MBTA data (default: 1000 10000)")
+    parser.add_argument("--no-mbta", action="store_true", help="Only run the synthetic datasets")
+    parser.add_argument("--threshold", type=float, default=regression_threshold,
+                        help="Relative slowdown of the median that counts as a regression")
+    parser.add_argument("--results", default=results_folder)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show output printed by the benchmarked code")
+    args = parser.parse_args()
+
+    datasets = None
+    if args.scales is not None or args.no_mbta:
+        scales = args.scales if args.scales is not None else [1000, 10000]
+        datasets = ([] if args.no_mbta else ["mbta"]) + [f"synthetic_{n}" for n in scales]
+
+    results = run(args.filter, datasets, args.verbose)
+
+    baseline = latest_results(args.results)
+    if not args.no_save:
+        print(f"Results saved to {save_results(results, args.results)}")
+
+    if baseline is None:
+        print("No earlier results on this machine; this run is the baseline.")
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.threshold)
+    print(f"Compared with {baseline['commit']} ({baseline['timestamp']}): {len(regressions)} regression(s)")
+    for case, before, after, ratio in regressions:
+        print(f"  REGRESSION {case}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms ({ratio:.2f}x)")
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
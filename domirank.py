@@ -1,6 +1,7 @@
 import copy
 import numpy as np
 import networkx as nx
+import scipy as sp
 import time
 
 
@@ -55,6 +56,42 @@ def find_eigenvalue(G, minVal=0, maxVal=1, maxDepth=100, dt=0.1, epsilon=1e-5, m
     return -1 / finalVal
 
 
+def generate_attack(centrality, node_map=False):
+    """ Orders nodes by decreasing centrality; returns the node labels in attack order. """
+    if node_map == False:
+        node_map = range(len(centrality))
+    else:
+        node_map = list(node_map.keys())
+    zipped = dict(zip(node_map, centrality))
+    attackStrategy = sorted(zipped, key=zipped.get, reverse=True)
+    return attackStrategy
+
+
+def network_attack_sampled(G, attackStrategy, sampling=0):
+    """
+    Removes nodes in attack order and tracks the relative size of the largest connected component,
+    sampled every `sampling` removals (default: ~100 samples). Returns (component sizes, fraction removed).
+    """
+    if isinstance(G, nx.Graph):
+        G = nx.to_scipy_sparse_array(G)
+    GAdj = sp.sparse.csr_array(G)
+    N = GAdj.shape[0]
+    if sampling == 0:
+        sampling = int(N / 100) if N > 100 else 1
+
+    initialComponent = np.bincount(sp.sparse.csgraph.connected_components(GAdj, directed=False)[1]).max()
+    alive = np.ones(N)
+    largestComponents, removedFractions = [], []
+    for i in range(0, N, sampling):
+        alive[attackStrategy[:i]] = 0
+        mask = sp.sparse.diags_array(alive)
+        _, labels = sp.sparse.csgraph.connected_components(mask @ GAdj @ mask, directed=False)
+        sizes = np.bincount(labels[alive > 0]) if alive.any() else np.zeros(1)
+        largestComponents.append(sizes.max() / initialComponent)
+        removedFractions.append(i / N)
+    return np.array(largestComponents), np.array(removedFractions)
+
+
 def process_iteration(q, i, sigma, spArray, maxIter, checkStep, dt, epsilon, sampling):
     tf, domiDist = domirank(spArray, sigma, dt=dt, epsilon=epsilon, maxIter=maxIter, checkStep=checkStep)
     domiAttack = generate_attack(domiDist)
@@ -125,12 +162,13 @@ def simulate_failure_domirank(G, sigma, alpha=0.85, beta=0.1, theta=1.0):
     return failure_performance, seq_removed_domirank
 
 
-# Assuming agg_G and sigma are defined and calculate_network_performance and plot_functionality_ratio are defined functions
-start_time = time.time()
-failure_performance_domirank, seq_removed_domirank = simulate_failure_domirank(agg_G, sigma)
-end_time = time.time()
-time_taken_domirank = end_time - start_time
+if __name__ == "__main__":
+    # Assuming agg_G and sigma are defined and calculate_network_performance and plot_functionality_ratio are defined functions
+    start_time = time.time()
+    failure_performance_domirank, seq_removed_domirank = simulate_failure_domirank(agg_G, sigma)
+    end_time = time.time()
+    time_taken_domirank = end_time - start_time
 
-plot_functionality_ratio(failure_performance_domirank)
+    plot_functionality_ratio(failure_performance_domirank)
 
-print(f'Time taken for DomiRank-based failure: {time_taken_domirank} seconds')
+    print(f'Time taken for DomiRank-based failure: {time_taken_domirank} seconds')
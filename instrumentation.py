@@ -0,0 +1,202 @@
+import atexit
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+
+# Opt-in: unset = off. "1" keeps spans in memory (latency readout only); a path ending in .json writes a
+# Chrome trace (chrome://tracing, Perfetto), any other path writes one JSON object per line.
+trace_env = "MBTA_TRACE"
+trace_setting = os.environ.get(trace_env, "").strip()
+enabled = trace_setting not in ("", "0")
+
+recent_spans = collections.deque(maxlen=500)
+
+_listeners = []
+_local = threading.local()
+_lock = threading.Lock()
+_origin = time.perf_counter()
+_trace_file = None
+_chrome_format = False
+_first_event = True
+
+
+class _NullSpan:
+    """ Returned by span() when instrumentation is off; does nothing. """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+
+    def set(self, **attrs):
+        """ Attaches attributes (row counts, file names...) to the span. """
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _local.stack.pop()
+        record = {
+            "name": self.name,
+            "start_ms": round((self.start - _origin) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            "depth": len(_local.stack),
+            "parent": self.parent.name if self.parent else None,
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+            "children": [(child["name"], child["duration_ms"]) for child in self.children],
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self.parent is not None:
+            self.parent.children.append(record)
+        _finish(record)
+        return False
+
+
+def span(name, **attrs):
+    """ Context manager timing a block: `with span("read_csv", file=path): ...`. """
+    if not enabled:
+        return _null_span
+    return _Span(name, attrs)
+
+
+def traced(name=None):
+    """
+    Decorator timing every call of a function as a span (named after the function by default).
+    Usable as @traced or @traced("name"). When instrumentation is off the function is returned unchanged.
+    The wrapper forwards every argument, so connect a traced Qt slot through a lambda that drops the
+    signal's arguments (PyQt cannot match the wrapper's signature against the slot's).
+    """
+    def decorate(function):
+        if not enabled:
+            return function
+        label = name if isinstance(name, str) else function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Span(label, {}):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorate(name) if callable(name) else decorate
+
+
+def add_listener(callback):
+    """ Calls callback(record) for every finished span. """
+    _listeners.append(callback)
+
+
+def remove_listener(callback):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+
+def _finish(record):
+    recent_spans.append(record)
+    if _trace_file is not None:
+        _export(record)
+    for callback in list(_listeners):
+        callback(record)
+
+
+def _export(record):
+    global _first_event
+    if _chrome_format:
+        event = {"name": record["name"], "ph": "X", "pid": os.getpid(), "tid": record["thread"],
+                 "ts": round(record["start_ms"] * 1000), "dur": round(record["duration_ms"] * 1000),
+                 "args": record["attrs"]}
+        line = ("" if _first_event else ",\n") + json.dumps(event, default=str)
+    else:
+        line = json.dumps({key: value for key, value in record.items() if key != "children"}, default=str) + "\n"
+    with _lock:
+        _trace_file.write(line)
+        _trace_file.flush()
+        _first_event = False
+
+
+def _close_trace():
+    if _trace_file is not None and not _trace_file.closed:
+        if _chrome_format:
+            _trace_file.write("\n]\n")
+        _trace_file.close()
+
+
+def format_span(record):
+    """ One-line summary of a span and its direct children (repeated children summed), e.g. for a status bar. """
+    totals, counts = {}, {}
+    for child, duration in record["children"]:
+        totals[child] = totals.get(child, 0) + duration
+        counts[child] = counts.get(child, 0) + 1
+    parts = [f"{child}{f' x{counts[child]}' if counts[child] > 1 else ''} {total:.0f} ms"
+             for child, total in totals.items()]
+    other = record["duration_ms"] - sum(totals.values())
+    if parts:
+        parts.append(f"other {other:.0f} ms")
+        return f"{record['name']}: {record['duration_ms']:.0f} ms ({', '.join(parts)})"
+    return f"{record['name']}: {record['duration_ms']:.0f} ms"
+
+
+def attach_latency_readout(layout):
+    """
+    Adds a small label to a Qt layout that shows the latest top-level span with its breakdown.
+    Returns the label, or None when instrumentation is off.
+    """
+    if not enabled:
+        return None
+    from PyQt6.QtWidgets import QLabel
+
+    label = QLabel("Latency: -")
+    label.setStyleSheet("color: #555; font-size: 11px;")
+    layout.addWidget(label)
+
+    def show(record):
+        if record["depth"] != 0:
+            return
+        try:
+            label.setText(f"Latency — {format_span(record)}")
+        except RuntimeError:  # The page was closed
+            remove_listener(show)
+
+    # Show what already ran while the page was being built (e.g. the initial map)
+    for record in reversed(recent_spans):
+        if record["depth"] == 0:
+            show(record)
+            break
+    add_listener(show)
+    return label
+
+
+if enabled and trace_setting != "1":
+    os.makedirs(os.path.dirname(trace_setting) or ".", exist_ok=True)
+    _trace_file = open(trace_setting, "w")
+    _chrome_format = trace_setting.endswith(".json")
+    if _chrome_format:
+        _trace_file.write("[\n")
+    atexit.register(_close_trace)
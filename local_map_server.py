@@ -0,0 +1,188 @@
+import collections
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import map_assets
+from instrumentation import span
+from tile_cache import get_tile_store
+
+
+# Pages load their maps from this in-process server instead of QWebEngineView.setHtml, which is capped at
+# 2 MB and re-parses every embedded resource. Maps and the shared assets are served compressed with ETags,
+# basemap tiles from the tile cache.
+default_host = "127.0.0.1"
+compressed_types = ("text/", "application/javascript", "application/json", "image/svg+xml")
+compressed_cache_size = 64  # Gzipped bodies kept per (file, ETag)
+min_compressed_size = 1024
+
+# Generated maps are overwritten in place, so the browser revalidates them (a 304 while unchanged);
+# the shared assets only change with a new build and may be reused for an hour.
+map_cache_control = "no-cache"
+asset_cache_control = "public, max-age=3600"
+tile_cache_control = "public, max-age=604800"
+
+
+class LocalMapServer:
+    """
+    HTTP server on a background thread serving registered folders under /<root>/...: the shared asset folder
+    as /assets and every folder a map was served from under a short name derived from its path, plus the
+    cached basemap tiles as /tiles/<z>/<x>/<y>.png.
+    """
+
+    def __init__(self, host=default_host, port=0):
+        self.roots = {"assets": os.path.abspath(map_assets.asset_folder)}
+        self.compressed = collections.OrderedDict()  # (path, etag) -> gzipped body
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="local_map_server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_folder(self, folder):
+        folder = os.path.abspath(folder)
+        root = hashlib.sha1(folder.encode()).hexdigest()[:8]
+        with self.lock:
+            self.roots.setdefault(root, folder)
+        return root
+
+    def map_url(self, path):
+        """ URL of a file, serving its folder if it is not served yet. """
+        root = self.serve_folder(os.path.dirname(path))
+        return f"{self.url}/{root}/{urllib.parse.quote(os.path.basename(path))}"
+
+    def resolve(self, url_path):
+        """ File for a request path, or None if it is outside the served folders. """
+        root, _, relative = urllib.parse.unquote(url_path.split("?", 1)[0]).lstrip("/").partition("/")
+        folder = self.roots.get(root)
+        if folder is None or not relative:
+            return None, None
+        path = os.path.realpath(os.path.join(folder, relative))
+        if os.path.commonpath([path, os.path.realpath(folder)]) != os.path.realpath(folder):
+            return None, None
+        return (root, path) if os.path.isfile(path) else (None, None)
+
+    def gzipped(self, path, etag, body):
+        key = (path, etag)
+        with self.lock:
+            if key in self.compressed:
+                self.compressed.move_to_end(key)
+                return self.compressed[key]
+        compressed = gzip.compress(body, compresslevel=6)
+        with self.lock:
+            self.compressed[key] = compressed
+            if len(self.compressed) > compressed_cache_size:
+                self.compressed.popitem(last=False)
+        return compressed
+
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.respond(with_body=True)
+
+        def do_HEAD(self):
+            self.respond(with_body=False)
+
+        def respond(self, with_body):
+            if self.path.startswith("/tiles/"):
+                self.respond_tile(with_body)
+                return
+            root, path = server.resolve(self.path)
+            if path is None:
+                self.send_error(404)
+                return
+            stat = os.stat(path)
+            etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            cache_control = asset_cache_control if root == "assets" else map_cache_control
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", cache_control)
+                self.end_headers()
+                return
+
+            with span("serve_map_file", path=os.path.basename(path)):
+                with open(path, "rb") as f:
+                    body = f.read()
+                content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                encoding = None
+                if content_type.startswith(compressed_types) and len(body) >= min_compressed_size \
+                        and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body, encoding = server.gzipped(path, etag, body), "gzip"
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type + ("; charset=utf-8" if content_type.startswith("text/") else ""))
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache_control)
+            self.send_header("Vary", "Accept-Encoding")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.end_headers()
+            if with_body:
+                self.wfile.write(body)
+
+        def respond_tile(self, with_body):
+            try:
+                z, x, y = (int(part) for part in self.path[len("/tiles/"):].removesuffix(".png").split("/"))
+            except ValueError:
+                self.send_error(404)
+                return
+            data = get_tile_store().tile(z, x, y)
+            if data is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", tile_cache_control)
+            self.end_headers()
+            if with_body:
+                self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # Requests are traced with spans instead
+
+    return Handler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def get_map_server():
+    """
+    The shared server, started on first use. Maps generated after this point link the assets and basemap
+    tiles as /assets and /tiles on the server that serves them, so pages call it before their first map.
+    The links are root-relative, so the maps do not depend on this run's port.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = LocalMapServer().start()
+            map_assets.asset_base_url = "/assets"
+            map_assets.tile_url = "/tiles/{z}/{x}/{y}.png"
+    return _server
+
+
+def map_url(path):
+    """ URL under which the pages' web views load a generated map. """
+    return get_map_server().map_url(path)
@@ -205,9 +205,6 @@ from PyQt6.QtGui import QPixmap, QPainter, QFont, QGuiApplication
 from PyQt6.QtCore import Qt
 
 
-from page_3_threat_features.attractiveness_features import AttractivenessFeaturesApp
-from page_3_threat_features.gtd_window import generate_gtd_map
-from page_3_threat_features.threat_features import ThreatFeaturesApp
 
 
 # class MainApp(QWidget):
@@ -342,13 +339,46 @@ from page_3_threat_features.threat_features import ThreatFeaturesApp
 
 
 import sys
+import threading
 from PyQt6.QtWidgets import QApplication, QPushButton, QWidget
 from PyQt6.QtGui import QPixmap, QPainter, QFont, QGuiApplication
-from PyQt6.QtCore import Qt
-
-from page_3_threat_features.attractiveness_features import AttractivenessFeaturesApp
-from page_3_threat_features.gtd_window import generate_gtd_map
-from page_3_threat_features.threat_features import ThreatFeaturesApp
+from PyQt6.QtCore import Qt, QTimer
+
+from instrumentation import span
+
+# The page modules are imported when their button is clicked: the attractiveness page pulls in torch and
+# torch_geometric, and the threat page imports visualizer, which builds the graph and its centralities.
+
+
+def warm_up():
+    """
+    Loads what the pages need while the front page is shown: the Feature_Label statistics and rankings,
+    the graph with its centralities (importing visualizer) and the active GCN-LSTM with one forward pass.
+    A page opened before warm-up finishes simply waits for the import it needs.
+    """
+    try:
+        with span("warm_up_data"):
+            from page_3_threat_features.feature_stats import get_feature_stats
+            from page_3_threat_features.ranking_index import warm_up as warm_up_rankings
+            get_feature_stats().refresh()
+            warm_up_rankings()
+        with span("warm_up_centrality"):
+            import visualizer  # noqa: F401 (the import builds the graph and its centralities)
+        with span("warm_up_model"):
+            from page_3_threat_features.GCN.inference import (
+                active_model, load_edge_index, build_feature_tensor, predict_attractiveness
+            )
+            from page_3_threat_features.feature_store import load_all_windows
+            predict_attractiveness(active_model(), build_feature_tensor(load_all_windows()), load_edge_index())
+    except Exception as error:
+        # The page that needs the failing part reports the error when it is opened
+        print(f"Warm-up failed: {error}")
+
+
+def start_warm_up():
+    thread = threading.Thread(target=warm_up, name="warm_up", daemon=True)
+    thread.start()
+    return thread
 
 
 class MainApp(QWidget):
@@ -460,14 +490,17 @@ class MainApp(QWidget):
 
 
     def open_threat_features(self):
+        from page_3_threat_features.threat_features import ThreatFeaturesApp
         self.threat_window = ThreatFeaturesApp()
         self.threat_window.show()
 
     def open_attractiveness_features(self):
+        from page_3_threat_features.attractiveness_features import AttractivenessFeaturesApp
         self.attractiveness_window = AttractivenessFeaturesApp()
         self.attractiveness_window.show()
 
     def open_gtd_maps(self):
+        from page_3_threat_features.gtd_window import generate_gtd_map
         generate_gtd_map()
 
     def init_date_label(self, display_date, date_x, date_y):
@@ -489,4 +522,5 @@ if __name__ == "__main__":
 
     window = MainApp(image_path=image_path, image_scale=image_scale, display_date="Proof-of-Concept Demonstration Version 1.0: April 2025", date_x=0.73, date_y=0.90)
     window.show()
+    QTimer.singleShot(0, start_warm_up)  # Once the event loop runs, i.e. after the front page is painted
     sys.exit(app.exec())
@@ -0,0 +1,282 @@
+import argparse
+import base64
+import json
+import os
+import re
+import urllib.parse
+import urllib.request
+
+import folium
+import numpy as np
+from folium.plugins import FastMarkerCluster
+from folium.template import Template
+
+from instrumentation import span
+
+
+# Shared files referenced by every generated map instead of being embedded in it
+asset_folder = "assets"
+vendor_folder = os.path.join(asset_folder, "vendor")  # Local copies of the Leaflet/folium CDN files (--fetch)
+shared_css = "mbta_maps.css"
+shared_js = "mbta_maps.js"
+icon_sheet = "icons.css"
+
+# URL prefix the maps use for the asset folder; None = a path relative to each map file, so a map keeps
+# working when it is opened from disk. The local map server and the HTTP service set "/assets".
+asset_base_url = None
+
+# Embed the shared stylesheets and script in every map instead of linking them, for maps that are copied
+# around on their own (render_maps.py). CDN links are left as they are.
+inline_assets = False
+
+# URL template of the basemap tiles; None = CartoDB positron from the network. The local map server and the
+# HTTP service set their /tiles endpoint, backed by the tile cache (tile_cache.py).
+tile_url = None
+tile_attribution = ('&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors '
+                    '&copy; <a href="https://carto.com/attributions">CARTO</a>')
+
+# Facility icons, packed into one stylesheet (icons.css) and referenced by class
+facility_icons = {
+    "Police Dept": "access_measures_logos/police.png",
+    "Fire Dept": "access_measures_logos/fire.png",
+    "Hospitals": "access_measures_logos/hospital.png",
+}
+
+gradient_colors = ["green", "yellow", "red"]
+
+# Facility clusters: individual icons from this zoom on, clusters (with counts) below it
+facility_cluster_options = {"disableClusteringAtZoom": 15, "maxClusterRadius": 50, "showCoverageOnHover": False,
+                            "chunkedLoading": True, "spiderfyOnMaxZoom": False}
+
+_link_pattern = re.compile(r'(src|href)="(https?://[^"]+)"')
+_css_url_pattern = re.compile(r"url\(\s*['\"]?([^'\")]+)['\"]?\s*\)")
+
+
+def link_settings():
+    """ How maps currently link the assets and tiles; baked into the HTML, so part of rendered-map cache keys. """
+    return {"asset_base_url": asset_base_url, "tile_url": tile_url, "inline_assets": inline_assets}
+
+
+def asset_url(relative_path, map_path):
+    """ URL of a file in the asset folder as linked from the map saved at map_path. """
+    if asset_base_url is not None:
+        return f"{asset_base_url.rstrip('/')}/{relative_path}"
+    target = os.path.abspath(os.path.join(asset_folder, relative_path))
+    return os.path.relpath(target, os.path.dirname(os.path.abspath(map_path))).replace(os.sep, "/")
+
+
+def icon_class(layer_name):
+    return "mbta-icon-" + layer_name.split()[0].lower()
+
+
+def build_icon_sheet(path=os.path.join(asset_folder, icon_sheet)):
+    """ Writes icons.css (one class per facility icon, images inlined) unless it is newer than the icons. """
+    sources = [icon for icon in facility_icons.values() if os.path.exists(icon)]
+    if os.path.exists(path) and all(os.path.getmtime(path) >= os.path.getmtime(icon) for icon in sources):
+        return path
+    rules = []
+    for layer_name, icon in facility_icons.items():
+        if not os.path.exists(icon):
+            print(f"File not found: {icon}")
+            continue
+        with open(icon, "rb") as f:
+            data = base64.b64encode(f.read()).decode()
+        rules.append(f".{icon_class(layer_name)} {{ background-image: url(data:image/png;base64,{data}); }}")
+    with open(path, "w") as f:
+        f.write("\n".join(rules) + "\n")
+    return path
+
+
+class FacilityCluster(FastMarkerCluster):
+    """
+    Clustered point layer built in the browser from one coordinate array: all markers share one icon and
+    are added to the cluster group in a single (chunked) addLayers call instead of one by one.
+    The array is embedded as the pre-serialized JSON in `data_json`.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                {{ this.callback }}
+
+                var data = {{ this.data_json }};
+                var cluster = L.markerClusterGroup({{ this.options|tojavascript }});
+                cluster.addLayers(data.map(callback));
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}"""
+    )
+
+
+def add_facility_cluster(mbta_map, layer_name, coordinates, size=20):
+    """
+    Adds a facility layer as one clustered layer using the shared icon sheet.
+    `coordinates` is an (n, 2) lat/lon array or an already serialized JSON array of [lat, lon] pairs.
+    """
+    icon = json.dumps({"className": f"mbta-icon {icon_class(layer_name)}", "iconSize": [size, size],
+                       "iconAnchor": [size // 2, size // 2]})
+    callback = f"""(function () {{
+                    var icon = L.divIcon({icon});
+                    return function (row) {{
+                        return L.marker([row[0], row[1]], {{icon: icon}}).bindTooltip({json.dumps(layer_name)});
+                    }};
+                }})()"""
+    cluster = FacilityCluster([], callback=callback, name=layer_name, **facility_cluster_options)
+    if isinstance(coordinates, str):
+        cluster.data_json = coordinates
+    else:
+        cluster.data_json = json.dumps(np.round(np.asarray(coordinates, dtype=float), 5).tolist())
+    cluster.add_to(mbta_map)
+
+
+def create_base_map(center_lat, center_lon, zoom_start=12):
+    """ Empty map with the dashboard's standard tiles; vector layers are drawn on one canvas. """
+    if tile_url is None:
+        return folium.Map(location=[center_lat, center_lon], zoom_start=zoom_start, tiles="CartoDB positron",
+                          prefer_canvas=True)
+    mbta_map = folium.Map(location=[center_lat, center_lon], zoom_start=zoom_start, tiles=None, prefer_canvas=True)
+    folium.TileLayer(tiles=tile_url, attr=tile_attribution, name="CartoDB positron", max_zoom=20).add_to(mbta_map)
+    return mbta_map
+
+
+# ---------- Overlays ----------
+
+def add_overlay(mbta_map, spec):
+    """ Embeds an overlay spec; mbta_maps.js renders it (see the renderers there). """
+    payload = json.dumps(spec).replace("</", "<\\/")
+    mbta_map.get_root().html.add_child(
+        folium.Element(f'<script type="application/json" class="mbta-overlay">{payload}</script>'))
+
+
+def add_title(mbta_map, html, centered=False):
+    add_overlay(mbta_map, {"type": "text", "html": html, "style": "mbta-title" + (" centered" if centered else "")})
+
+
+def add_description(mbta_map, html, slot="bottom", style="mbta-description"):
+    add_overlay(mbta_map, {"type": "text", "html": html, "slot": slot, "style": style})
+
+
+def add_gradient_legend(mbta_map, min_val, median_val, max_val, caption="Normalized Values", colors=gradient_colors):
+    """ Vertical colour bar with min / median / max ticks. """
+    add_overlay(mbta_map, {"type": "gradient", "slot": "bottom", "colors": list(colors), "caption": caption,
+                           "ticks": [float(min_val), float(median_val), float(max_val)], "positions": [0, 0.5, 1]})
+
+
+def add_category_legend(mbta_map, colors, title="Legend", slot="bottom", style=""):
+    """ Colour swatches for categories, `colors` maps label -> colour (in display order). """
+    add_overlay(mbta_map, {"type": "categories", "slot": slot, "title": title, "style": style,
+                           "items": [[label, color] for label, color in colors.items()]})
+
+
+def add_ranked_list(mbta_map, title, items, more=0):
+    """ Top-right list of (name, value) pairs, e.g. the top-K stations. """
+    add_overlay(mbta_map, {"type": "list", "title": title, "more": more,
+                           "items": [[name, float(value)] for name, value in items]})
+
+
+# ---------- Saving ----------
+
+def vendor_path(url):
+    """ Local mirror path of a CDN URL (host and path kept, so relative references inside CSS still resolve). """
+    parts = urllib.parse.urlsplit(url)
+    return os.path.join(vendor_folder, parts.netloc, parts.path.lstrip("/"))
+
+
+def localize_links(html, map_path):
+    """ Points CDN script/stylesheet links at the local vendor copies that exist. """
+    def replace(match):
+        path = vendor_path(match.group(2))
+        if not os.path.exists(path):
+            return match.group(0)
+        return f'{match.group(1)}="{asset_url(os.path.relpath(path, asset_folder).replace(os.sep, "/"), map_path)}"'
+    return _link_pattern.sub(replace, html)
+
+
+def read_asset(name):
+    with open(os.path.join(asset_folder, name), encoding="utf-8") as f:
+        return f.read().replace("</", "<\\/")
+
+
+def save_map(mbta_map, map_path):
+    """ Saves a map that links (or embeds) the shared stylesheet, overlay script and icon sheet, and links the local vendor files. """
+    build_icon_sheet()
+    root = mbta_map.get_root()
+    for name in (shared_css, icon_sheet):
+        if inline_assets:
+            root.header.add_child(folium.Element(f"<style>{read_asset(name)}</style>"), name=name)
+        else:
+            root.header.add_child(folium.CssLink(asset_url(name, map_path)), name=name)
+    if inline_assets:
+        root.header.add_child(folium.Element(f"<script>{read_asset(shared_js)}</script>"), name=shared_js)
+    else:
+        root.header.add_child(folium.JavascriptLink(asset_url(shared_js, map_path)), name=shared_js)
+    with span("render"):
+        html = root.render() if inline_assets else localize_links(root.render(), map_path)
+    with open(map_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return map_path
+
+
+# ---------- Vendor bundle ----------
+
+def vendor_urls():
+    """ CDN files used by the generated maps, collected from a map with every plugin the dashboard uses. """
+    from folium.plugins import HeatMap
+    import branca.colormap as cm
+
+    sample = create_base_map(0, 0)
+    HeatMap([[0, 0]]).add_to(sample)
+    add_facility_cluster(sample, "Police Dept", [[0, 0]])
+    folium.GeoJson({"type": "FeatureCollection", "features": []},
+                   tooltip=folium.GeoJsonTooltip(fields=[])).add_to(sample)
+    sample.add_child(cm.LinearColormap(gradient_colors, vmin=0, vmax=1))
+    return sorted({match.group(2) for match in _link_pattern.finditer(sample.get_root().render())})
+
+
+def download(url):
+    path = vendor_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with urllib.request.urlopen(url, timeout=30) as response:
+        data = response.read()
+    with open(path, "wb") as f:
+        f.write(data)
+    return path, data
+
+
+def fetch_vendor_assets(force=False):
+    """ Downloads the CDN files (and the images/fonts their CSS references) into assets/vendor. """
+    fetched = []
+    for url in vendor_urls():
+        if os.path.exists(vendor_path(url)) and not force:
+            continue
+        try:
+            path, data = download(url)
+        except OSError as error:
+            print(f"Could not fetch {url}: {error}")
+            continue
+        fetched.append(path)
+        if url.endswith(".css"):
+            for reference in set(_css_url_pattern.findall(data.decode("utf-8", "ignore"))):
+                if reference.startswith("data:"):
+                    continue
+                try:
+                    fetched.append(download(urllib.parse.urljoin(url, reference).split("#")[0].split("?")[0])[0])
+                except OSError as error:
+                    print(f"Could not fetch {reference} for {url}: {error}")
+    return fetched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the shared map assets (icon sheet, local CDN copies).")
+    parser.add_argument("--fetch", action="store_true", help="Download the Leaflet/folium CDN files for offline use")
+    parser.add_argument("--force", action="store_true", help="Re-download files that already exist")
+    args = parser.parse_args()
+
+    print(f"Icon sheet: {build_icon_sheet()}")
+    if args.fetch:
+        fetched = fetch_vendor_assets(args.force)
+        print(f"Fetched {len(fetched)} files into {vendor_folder}")
+    missing = [url for url in vendor_urls() if not os.path.exists(vendor_path(url))]
+    print(f"{len(missing)} CDN files not available locally" + (" (run with --fetch)" if missing else ""))
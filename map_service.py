@@ -0,0 +1,627 @@
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+from aiohttp import web
+
+from map_assets import asset_folder, build_icon_sheet
+from tile_cache import get_tile_store
+from page_3_threat_features.feature_store import time_windows, feature_folder, load_all_windows
+from page_3_threat_features.ranking_index import ascending_features, get_ranking_index
+from page_3_threat_features.GCN.model_registry import get_registry
+from page_3_threat_features.GCN.defense_optimizer import DefenseOptimizer, station_headroom, modes as optimizer_modes
+from page_3_threat_features.base_attractiveness import (
+    score_inputs, default_weights, weight_vector, random_weights, get_base_scores
+)
+from page_3_threat_features.temporal_analytics import metrics as temporal_metrics, get_temporal_analytics
+from page_3_threat_features.GCN.inference import (
+    load_edge_index, build_feature_tensor, predict_batch, apply_change, get_sensitivity,
+    rank_sensitivity, predict_uncertainty, continuous_features, categorical_features, category_levels, continuous_step
+)
+
+
+default_host = "127.0.0.1"
+default_port = 8080
+
+# Rendered maps and JSON responses kept per data version
+cache_size = 256
+render_workers = min(4, os.cpu_count() or 1)
+max_scenarios = 256
+max_sweep_weights = 100000
+max_uncertainty_draws = 20000  # Scenarios x MC dropout samples per /simulate request
+max_compared_models = 4  # Model versions per /simulate request
+
+centralities = ["No Centrality", "Domirank", "Degree", "Betweenness", "Eigen Vector", "Closeness"]
+
+
+# ---------- Map rendering (runs in worker processes) ----------
+
+def _init_render_worker(folder):
+    """ Imports the visualizer once per worker and gives each worker its own output folder. """
+    import map_assets
+    import visualizer
+    map_assets.asset_base_url = "/assets"  # Served by the service itself
+    map_assets.tile_url = "/tiles/{z}/{x}/{y}.png"
+    output_folder = tempfile.mkdtemp(prefix="mbta_service_maps_")
+    visualizer.output_folder = output_folder
+    visualizer.overlay_output_folder = output_folder
+    # Serve the service's tables, not the Qt playground copy
+    visualizer.threat_folder = folder
+    visualizer.temp_folder = folder
+
+
+def _render_map(function_name, args):
+    """ Calls a visualizer generate_* function and returns the HTML, or None if it produced no map. """
+    import visualizer
+    map_path = getattr(visualizer, function_name)(*args)
+    if not map_path:
+        return None
+    with open(map_path) as f:
+        return f.read()
+
+
+# ---------- Caching ----------
+
+class ResponseCache:
+    """ LRU cache that also coalesces concurrent requests for the same key into one computation. """
+
+    def __init__(self, size=cache_size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.pending = {}
+
+    def clear(self):
+        self.entries.clear()
+
+    async def get_or_compute(self, key, compute):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if key in self.pending:
+            return await asyncio.shield(self.pending[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            value = await compute()
+        except Exception as error:
+            future.set_exception(error)
+            future.exception()  # Mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            self.pending.pop(key, None)
+        future.set_result(value)
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return value
+
+
+def data_fingerprint(folder):
+    """ Changes whenever a Feature_Label table is modified. """
+    stats = sorted((name, os.path.getmtime(os.path.join(folder, name)), os.path.getsize(os.path.join(folder, name)))
+                   for name in os.listdir(folder) if name.endswith(".csv"))
+    return hashlib.sha1(json.dumps(stats).encode()).hexdigest()[:12]
+
+
+class BadRequest(Exception):
+    pass
+
+
+def query_value(request, name, default=None, choices=None, cast=str, minimum=None):
+    value = request.query.get(name)
+    if value is None or value == "":
+        if default is None:
+            raise BadRequest(f"Missing query parameter '{name}'")
+        return default
+    try:
+        value = cast(value)
+    except ValueError:
+        raise BadRequest(f"Invalid value for '{name}': {value}")
+    if choices is not None and value not in choices:
+        raise BadRequest(f"'{name}' must be one of {sorted(choices)}")
+    if minimum is not None and value < minimum:
+        raise BadRequest(f"'{name}' must be at least {minimum}")
+    return value
+
+
+def query_list(request, name):
+    value = request.query.get(name, "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def query_flag(request, name):
+    return request.query.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+# ---------- Service ----------
+
+class MapService:
+    """
+    Shared backend for the dashboard: map rendering in a process pool, warm GCN-LSTM versions for what-if
+    simulation, and cached feature / top-K queries. Everything cached is keyed by the data fingerprint
+    and the active model version.
+    """
+
+    def __init__(self, folder=feature_folder, workers=render_workers):
+        self.folder = folder
+        self.workers = workers
+        self.cache = ResponseCache()
+        self.registry = get_registry()
+        self.edge_index = None
+        self.tables = None
+        self.fingerprint = None
+        self.baseline = None
+        self.render_pool = None
+        self.model_pool = None
+
+    async def start(self, app):
+        self.render_pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                               initializer=_init_render_worker, initargs=(self.folder,))
+        self.model_pool = ThreadPoolExecutor(1)  # torch already parallelizes one forward pass
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.model_pool, self.registry.model)  # Warm up the active version
+        self.edge_index = await loop.run_in_executor(self.model_pool, load_edge_index)
+        self.refresh()
+
+    async def stop(self, app):
+        self.render_pool.shutdown(cancel_futures=True)
+        self.model_pool.shutdown()
+
+    def refresh(self):
+        """ Reloads the tables and drops cached responses when the Feature_Label data changed. """
+        fingerprint = data_fingerprint(self.folder)
+        if fingerprint != self.fingerprint:
+            self.tables = load_all_windows(self.folder)
+            self.station_names = set(self.tables[time_windows[0]]["Station_Name"])
+            self.baseline = None
+            self.cache.clear()
+            self.fingerprint = fingerprint
+
+    @property
+    def model(self):
+        """ The active model version; swapped through /models/activate without restarting. """
+        return self.registry.model()
+
+    def cache_key(self, request):
+        return (request.path, tuple(sorted(request.query.items())), self.fingerprint, self.registry.active_version())
+
+    async def cached(self, request, compute):
+        self.refresh()
+        return await self.cache.get_or_compute(self.cache_key(request), compute)
+
+    async def render(self, request, function_name, *args):
+        loop = asyncio.get_running_loop()
+        html = await self.cached(request, lambda: loop.run_in_executor(self.render_pool, _render_map, function_name, args))
+        if html is None:
+            raise web.HTTPNotFound(text="No map for this selection")
+        return web.Response(text=html, content_type="text/html")
+
+    # ----- Maps -----
+
+    async def threat_map(self, request):
+        time_of_day = query_value(request, "time_of_day", choices=time_windows)
+        feature = query_value(request, "feature", choices=self.feature_names())
+        top_k = query_value(request, "top_k", 0, cast=int) or None
+        return await self.render(request, "generate_threat_feature_map", time_of_day, feature, top_k,
+                                 query_list(request, "layers"), query_flag(request, "heatmap"))
+
+    async def basemap(self, request):
+        time_of_day = query_value(request, "time_of_day", choices=time_windows)
+        return await self.render(request, "generate_basemap_feature", time_of_day,
+                                 query_list(request, "layers"), query_flag(request, "heatmap"))
+
+    async def centrality_map(self, request):
+        centrality = query_value(request, "centrality", "No Centrality", choices=centralities)
+        top_k = query_value(request, "top_k", len(self.tables[time_windows[0]]), cast=int)
+        return await self.render(request, "generate_mbta_map_with_centrality", centrality, top_k)
+
+    async def attractiveness_map(self, request):
+        time_of_day = query_value(request, "time_of_day", choices=time_windows)
+        return await self.render(request, "generate_attractiveness_map", time_of_day)
+
+    async def overlay_map(self, request):
+        time_of_day = query_value(request, "time_of_day", choices=time_windows)
+        features = query_list(request, "features")
+        if not features or any(feature not in self.feature_names() for feature in features):
+            raise BadRequest(f"'features' must be a comma-separated list from {self.feature_names()}")
+        top_k = query_value(request, "top_k", 10, cast=int)
+        common = query_flag(request, "common")
+        return await self.render(request, "generate_overlay_singular_map", time_of_day,
+                                 features if common else features[0], top_k, common)
+
+    async def temporal_map(self, request):
+        feature = query_value(request, "feature", "Attractiveness", choices=self.temporal_features())
+        metric = query_value(request, "metric", choices=temporal_metrics)
+        time_of_day = query_value(request, "time_of_day", time_windows[-1], choices=time_windows)
+        top_k = query_value(request, "top_k", 0, cast=int) or None
+        return await self.render(request, "generate_temporal_map", feature, metric, time_of_day, top_k)
+
+    # ----- Feature queries -----
+
+    def feature_names(self):
+        return [column for column in self.tables[time_windows[0]].columns
+                if column not in ("ID", "Station_Name", "Lat", "Lon")]
+
+    async def features(self, request):
+        """ Feature slice: selected columns (default all) for selected stations (default all), per window. """
+        windows = query_list(request, "time_of_day") or time_windows
+        columns = query_list(request, "columns") or self.feature_names()
+        ids = query_list(request, "ids")
+        if any(window not in time_windows for window in windows):
+            raise BadRequest(f"'time_of_day' must be from {time_windows}")
+        if any(column not in self.feature_names() for column in columns):
+            raise BadRequest(f"Unknown column; available: {self.feature_names()}")
+
+        async def compute():
+            result = {}
+            for window in windows:
+                df = self.tables[window]
+                if ids:
+                    df = df[df["ID"].astype(str).isin(ids)]
+                result[window] = json.loads(df[["ID", "Station_Name"] + columns].to_json(orient="records"))
+            return result
+
+        return web.json_response(await self.cached(request, compute))
+
+    async def top_k(self, request):
+        time_of_day = query_value(request, "time_of_day", choices=time_windows)
+        feature = query_value(request, "feature", choices=self.numeric_features())
+        k = query_value(request, "k", 10, cast=int, minimum=1)
+
+        async def compute():
+            df = self.tables[time_of_day]
+            ranked = df.iloc[get_ranking_index(self.folder).top_k(time_of_day, feature, k)]
+            return {"time_of_day": time_of_day, "feature": feature, "ascending": feature in ascending_features,
+                    "stations": json.loads(ranked[["ID", "Station_Name", "Lat", "Lon", feature]].to_json(orient="records"))}
+
+        return web.json_response(await self.cached(request, compute))
+
+    async def temporal(self, request):
+        """ Stations whose rank in a feature moves the most between two windows, plus the most volatile ones. """
+        feature = query_value(request, "feature", "Attractiveness", choices=self.temporal_features())
+        from_window = query_value(request, "from", "LATE_EVENING", choices=time_windows)
+        to_window = query_value(request, "to", "NIGHT", choices=time_windows)
+        k = query_value(request, "k", 10, cast=int, minimum=1)
+        rising = not query_flag(request, "falling")
+
+        async def compute():
+            analytics = get_temporal_analytics(self.folder)
+            movers = analytics.biggest_movers(feature, from_window, to_window, k, rising)
+            volatile = analytics.most_volatile(feature, k)[["ID", "Station_Name", "mean", "std", "volatility",
+                                                            "peak_window", "trough_window", "rank_range"]]
+            return {"feature": feature, "from": from_window, "to": to_window,
+                    "movers": json.loads(movers.to_json(orient="records")),
+                    "most_volatile": json.loads(volatile.to_json(orient="records")),
+                    "peak_counts": analytics.peak_counts(feature)}
+
+        return web.json_response(await self.cached(request, compute))
+
+    def temporal_features(self):
+        return get_temporal_analytics(self.folder).features
+
+    def numeric_features(self):
+        df = self.tables[time_windows[0]]
+        return [column for column in self.feature_names() if pd.api.types.is_numeric_dtype(df[column])]
+
+    # ----- What-if simulation -----
+
+    def parse_scenarios(self, body):
+        scenarios = body.get("scenarios") if isinstance(body, dict) else None
+        if not isinstance(scenarios, list) or not scenarios:
+            raise BadRequest("Body must be {\"scenarios\": [{\"changes\": [{\"station\", \"feature\", \"value\"}]}]}")
+        if len(scenarios) > max_scenarios:
+            raise BadRequest(f"At most {max_scenarios} scenarios per request")
+
+        parsed = []
+        for scenario in scenarios:
+            changes = scenario.get("changes", [scenario]) if isinstance(scenario, dict) else None
+            if not changes:
+                raise BadRequest("Every scenario needs at least one change")
+            checked = []
+            for change in changes:
+                station, feature, value = change.get("station"), change.get("feature"), change.get("value")
+                if station not in self.station_names:
+                    raise BadRequest(f"Unknown station: {station}")
+                if feature in categorical_features:
+                    if value not in category_levels:
+                        raise BadRequest(f"{feature} must be one of {category_levels}")
+                elif feature in continuous_features:
+                    try:
+                        value = float(value)
+                    except (TypeError, ValueError):
+                        raise BadRequest(f"{feature} needs a numeric value")
+                else:
+                    raise BadRequest(f"Feature must be one of {continuous_features + categorical_features}")
+                checked.append({"station": station, "feature": feature, "value": value})
+            parsed.append(checked)
+        return parsed
+
+    def run_scenarios(self, scenarios, include_all, samples=0, model=None):
+        """
+        One batched forward pass for the baseline and every scenario; with `samples`, also MC dropout
+        std and 90% interval for the changed stations. `model` defaults to the active version.
+        """
+        model = model if model is not None else self.model
+        tensors = [build_feature_tensor(self.tables)]
+        for changes in scenarios:
+            tables = self.tables
+            for change in changes:
+                tables = apply_change(tables, change["station"], change["feature"], change["value"])
+            tensors.append(build_feature_tensor(tables))
+        predictions = predict_batch(model, tensors, self.edge_index)
+
+        stations = self.tables[time_windows[0]].sort_values(by="ID")["Station_Name"].tolist()
+        row = {name: index for index, name in enumerate(stations)}
+        baseline = predictions[0]
+        results = []
+        for index, (changes, predicted) in enumerate(zip(scenarios, predictions[1:]), 1):
+            touched = {change["station"] for change in changes}
+            result = {
+                "changes": changes,
+                "stations": {name: predicted[row[name]].tolist() for name in touched},
+                "network_mean": predicted.mean(axis=0).tolist(),
+                "network_mean_delta": (predicted - baseline).mean(axis=0).tolist(),
+            }
+            if samples:
+                estimate = predict_uncertainty(model, tensors[index], self.edge_index, samples)
+                result["uncertainty"] = {name: {key: estimate[key][row[name]].tolist() for key in ("std", "low", "high")}
+                                         for name in touched}
+            if include_all:
+                result["all_stations"] = dict(zip(stations, predicted.tolist()))
+            results.append(result)
+        return {"time_windows": time_windows, "baseline_network_mean": baseline.mean(axis=0).tolist(),
+                "scenarios": results}
+
+    async def simulate(self, request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise BadRequest("Body must be JSON")
+        self.refresh()
+        scenarios = self.parse_scenarios(body)
+        include_all = bool(body.get("include_all", False))
+        try:
+            samples = int(body.get("uncertainty_samples", 0))
+        except (TypeError, ValueError):
+            raise BadRequest("'uncertainty_samples' must be an integer")
+        if samples < 0 or samples * len(scenarios) > max_uncertainty_draws:
+            raise BadRequest(f"At most {max_uncertainty_draws} scenarios x uncertainty_samples per request")
+        versions = body.get("models")
+        if versions is not None:
+            if not isinstance(versions, list) or not 0 < len(versions) <= max_compared_models \
+                    or any(version not in self.registry.versions() for version in versions):
+                raise BadRequest(f"'models' must list 1..{max_compared_models} of {self.registry.versions()}")
+        key = ("simulate", json.dumps(scenarios, sort_keys=True), include_all, samples, self.fingerprint,
+               tuple(versions) if versions else self.registry.active_version())
+
+        def run():
+            if not versions:
+                return self.run_scenarios(scenarios, include_all, samples)
+            # A/B comparison: the same scenarios on every requested version
+            return {"models": {version: self.run_scenarios(scenarios, include_all, samples, self.registry.load(version))
+                               for version in versions}}
+
+        loop = asyncio.get_running_loop()
+        result = await self.cache.get_or_compute(key, lambda: loop.run_in_executor(self.model_pool, run))
+        return web.json_response(result)
+
+    async def sensitivity(self, request):
+        """ Edits ranked by their estimated effect on Attractiveness (gradients of the warm model). """
+        time_of_day = query_value(request, "time_of_day", choices=time_windows)
+        scope = query_value(request, "scope", "own_effect", choices=["own_effect", "network_effect"])
+        features = query_list(request, "features")
+        k = query_value(request, "k", 20, cast=int, minimum=1)
+
+        async def compute():
+            loop = asyncio.get_running_loop()
+            table = await loop.run_in_executor(self.model_pool, get_sensitivity, self.folder, self.model, self.edge_index)
+            if features:
+                table = table[table["feature"].isin(features)]
+            ranked = rank_sensitivity(table, time_of_day, scope, k)
+            return {"time_of_day": time_of_day, "scope": scope, "continuous_step": continuous_step,
+                    "edits": json.loads(ranked.to_json(orient="records"))}
+
+        return web.json_response(await self.cached(request, compute))
+
+    async def optimize_defense(self, request):
+        """ Where {"budget": n, "mode": "celf" | "ilp"} extra patrol units minimize total attractiveness. """
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise BadRequest("Body must be JSON")
+        if not isinstance(body, dict):
+            raise BadRequest("Body must be a JSON object")
+        try:
+            budget = int(body.get("budget", 10))
+        except (TypeError, ValueError):
+            raise BadRequest("'budget' must be an integer")
+        mode = body.get("mode", "celf")
+        self.refresh()
+        # Every unit raises one station by one level, so the budget is bounded by the levels left below High
+        max_budget = int(station_headroom(self.tables).sum())
+        if not 0 < budget <= max_budget or mode not in optimizer_modes:
+            raise BadRequest(f"'budget' must be 1..{max_budget} and 'mode' one of {optimizer_modes}")
+
+        def run():
+            optimizer = DefenseOptimizer(self.tables, self.model, self.edge_index)
+            allocation, curve = optimizer.optimize(budget, mode)
+            if allocation is None:
+                raise BadRequest("Optimization failed")
+            return {"budget": budget, "mode": mode, "selected": curve.attrs["selected"],
+                    "approximation": curve.attrs["approximation"], "baseline": curve.attrs["baseline"],
+                    "evaluations": curve.attrs["evaluations"], "seconds": round(curve.attrs["seconds"], 3),
+                    "allocation": json.loads(allocation.to_json(orient="records")),
+                    "curve": json.loads(curve.to_json(orient="records"))}
+
+        key = ("optimize_defense", budget, mode, self.fingerprint, self.registry.active_version())
+        loop = asyncio.get_running_loop()
+        return web.json_response(await self.cache.get_or_compute(key, lambda: loop.run_in_executor(self.model_pool, run)))
+
+    # ----- Base attractiveness re-weighting -----
+
+    def parse_weights(self, values):
+        try:
+            weights = weight_vector({name: float(value) for name, value in values.items()}
+                                    if isinstance(values, dict) else values)
+        except (TypeError, ValueError) as error:
+            raise BadRequest(f"Invalid weights ({error}); inputs: {score_inputs}")
+        return weights
+
+    async def base_scores(self, request):
+        """ Base attractiveness of every station in a window for the given weights (default: documented weights). """
+        time_of_day = query_value(request, "time_of_day", choices=time_windows)
+        weights = self.parse_weights(dict(default_weights, **{name: request.query[name] for name in score_inputs
+                                                                if name in request.query}))
+        k = query_value(request, "k", 0, cast=int) or None
+
+        async def compute():
+            table = get_base_scores().score_table(weights)[["Station_ID", "Station_Name", time_of_day]]
+            table = table.sort_values(time_of_day, ascending=False, kind="stable").head(k)
+            return {"time_of_day": time_of_day, "weights": dict(zip(score_inputs, weights.tolist())),
+                    "stations": json.loads(table.rename(columns={time_of_day: "score"}).to_json(orient="records"))}
+
+        return web.json_response(await self.cached(request, compute))
+
+    async def base_score_sweep(self, request):
+        """
+        Ranking robustness over many weightings: body {"weights": [[...], ...]} (inputs in `score_inputs` order)
+        or {"random": n, "concentration": c} for n weightings around the documented weights.
+        """
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise BadRequest("Body must be JSON")
+        if not isinstance(body, dict):
+            raise BadRequest("Body must be a JSON object")
+        if "weights" in body:
+            weight_matrix = self.parse_weights(body["weights"])
+            if weight_matrix.ndim != 2:
+                raise BadRequest("'weights' must be a list of weight vectors")
+        else:
+            try:
+                weight_matrix = random_weights(int(body.get("random", 1000)), float(body.get("concentration", 50.0)))
+            except (TypeError, ValueError) as error:
+                raise BadRequest(f"Invalid sweep parameters: {error}")
+        if not 0 < len(weight_matrix) <= max_sweep_weights:
+            raise BadRequest(f"Between 1 and {max_sweep_weights} weight vectors per sweep")
+        try:
+            k = int(body.get("k", 10))
+        except (TypeError, ValueError):
+            raise BadRequest("'k' must be an integer")
+
+        def run():
+            engine = get_base_scores()
+            summary = engine.sweep_summary(weight_matrix, k)
+            return {"vectors": len(weight_matrix), "k": k, "windows": {
+                time_of_day: [{"Station_ID": int(station_id), "Station_Name": name,
+                               **{key: float(values[column, row]) for key, values in summary.items()}}
+                              for row, (station_id, name) in enumerate(zip(engine.stations["Station_ID"],
+                                                                           engine.stations["Station_Name"]))]
+                for column, time_of_day in enumerate(engine.windows)}}
+
+        result = await asyncio.get_running_loop().run_in_executor(self.model_pool, run)
+        return web.json_response(result)
+
+    # ----- Model versions -----
+
+    async def models(self, request):
+        """ Registered model versions with their metadata, and the active one. """
+        def describe(version):
+            metadata = self.registry.metadata(version)
+            metrics = metadata.get("metrics", {})
+            return {key: value for key, value in {**metadata, "metrics": {key: metrics[key] for key in metrics
+                                                                         if key != "cross_validation"}}.items()
+                    if key != "feature_hashes"}
+
+        versions = await asyncio.get_running_loop().run_in_executor(
+            self.model_pool, lambda: [describe(version) for version in self.registry.versions()])
+        return web.json_response({"active": self.registry.active_version(), "versions": versions})
+
+    async def activate_model(self, request):
+        """ Hot-swaps the model: {"version": ...}. In-flight requests finish on the model they started with. """
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise BadRequest("Body must be JSON")
+        version = body.get("version") if isinstance(body, dict) else None
+        if version not in self.registry.versions():
+            raise BadRequest(f"'version' must be one of {self.registry.versions()}")
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.model_pool, self.registry.activate, version)
+        except (ValueError, OSError, RuntimeError) as error:
+            raise BadRequest(f"Could not load model {version}: {error}")
+        return web.json_response({"active": version})
+
+    async def tile(self, request):
+        """ Basemap tile from the tile cache (downloaded and kept on a miss while online). """
+        z, x, y = (int(request.match_info[name]) for name in ("z", "x", "y"))
+        data = await asyncio.get_running_loop().run_in_executor(None, get_tile_store().tile, z, x, y)
+        if data is None:
+            raise web.HTTPNotFound(text="Tile not available")
+        return web.Response(body=data, content_type="image/png",
+                            headers={"Cache-Control": "public, max-age=604800"})
+
+    async def health(self, request):
+        self.refresh()
+        return web.json_response({"status": "ok", "stations": len(self.tables[time_windows[0]]),
+                                  "time_windows": time_windows, "features": self.feature_names(),
+                                  "data_version": self.fingerprint, "model_version": self.registry.active_version(),
+                                  "render_workers": self.workers})
+
+
+@web.middleware
+async def error_middleware(request, handler):
+    try:
+        return await handler(request)
+    except BadRequest as error:
+        return web.json_response({"error": str(error)}, status=400)
+
+
+def create_app(folder=feature_folder, workers=render_workers):
+    build_icon_sheet()
+    service = MapService(folder, workers)
+    app = web.Application(middlewares=[error_middleware])
+    app["service"] = service
+    app.on_startup.append(service.start)
+    app.on_cleanup.append(service.stop)
+    app.add_routes([
+        web.get("/health", service.health),
+        web.get("/maps/threat", service.threat_map),
+        web.get("/maps/basemap", service.basemap),
+        web.get("/maps/centrality", service.centrality_map),
+        web.get("/maps/attractiveness", service.attractiveness_map),
+        web.get("/maps/overlay", service.overlay_map),
+        web.get("/maps/temporal", service.temporal_map),
+        web.get("/features", service.features),
+        web.get("/topk", service.top_k),
+        web.get("/temporal", service.temporal),
+        web.post("/simulate", service.simulate),
+        web.get("/sensitivity", service.sensitivity),
+        web.post("/optimize/defense", service.optimize_defense),
+        web.get("/models", service.models),
+        web.post("/models/activate", service.activate_model),
+        web.get("/base_scores", service.base_scores),
+        web.post("/base_scores/sweep", service.base_score_sweep),
+        web.get(r"/tiles/{z:\d+}/{x:\d+}/{y:\d+}.png", service.tile),
+        web.static("/assets", asset_folder),
+    ])
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP service for maps, features and what-if simulation.")
+    parser.add_argument("--host", default=default_host)
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--workers", type=int, default=render_workers, help="Map rendering processes")
+    parser.add_argument("--feature-folder", default=feature_folder)
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.feature_folder, args.workers), host=args.host, port=args.port)
@@ -2,23 +2,29 @@ import sys
 from PyQt6.QtWidgets import QApplication, QVBoxLayout, QWidget
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtGui import QKeyEvent
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QUrl
 from visualizer import generate_mbta_map_without_features
+from local_map_server import get_map_server, map_url
+from instrumentation import span, attach_latency_readout
 
 class MBTAMapApp(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("MBTA Map Viewer (No Features)")
         self.setGeometry(100, 100, 900, 600)
+        get_map_server()  # Started before the first map, so the maps link their assets through it
 
         # Generate the MBTA Map without additional features
-        map_path = generate_mbta_map_without_features()
+        with span("MBTAMapApp.load_map"):
+            map_path = generate_mbta_map_without_features()
 
-        layout = QVBoxLayout()
-        self.browser = QWebEngineView()
-        self.browser.setHtml(open(map_path).read())
+            layout = QVBoxLayout()
+            self.browser = QWebEngineView()
+            with span("load"):
+                self.browser.load(QUrl(map_url(map_path)))
 
         layout.addWidget(self.browser)
+        attach_latency_readout(layout)
         self.setLayout(layout)
 
 
@@ -1,14 +1,17 @@
 import sys
 from PyQt6.QtWidgets import QApplication, QVBoxLayout, QWidget, QComboBox, QHBoxLayout, QSpinBox, QLabel
 from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtCore import QSize
+from PyQt6.QtCore import QSize, QUrl
 from visualizer import generate_mbta_map_with_centrality, nodes_df
+from local_map_server import get_map_server, map_url
+from instrumentation import span, traced, attach_latency_readout
 
 class MapFeaturesApp(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("MBTA Map with Centrality Features")
         self.setGeometry(100, 100, 900, 600)
+        get_map_server()  # Started before the first map, so the maps link their assets through it
 
         layout = QVBoxLayout()
 
@@ -17,14 +20,14 @@ class MapFeaturesApp(QWidget):
         self.centrality_dropdown.addItems([
             "No Centrality", "Domirank", "Degree", "Betweenness", "Eigen Vector", "Closeness"
         ])
-        self.centrality_dropdown.currentTextChanged.connect(self.update_map)
+        self.centrality_dropdown.currentTextChanged.connect(lambda *_: self.update_map())
 
         # Top K Selector
         self.top_k_selector = QSpinBox()
         self.top_k_selector.setMinimum(0)
         self.top_k_selector.setMaximum(len(nodes_df))  # Max = total nodes
         self.top_k_selector.setValue(len(nodes_df))  # Default: All nodes are colored
-        self.top_k_selector.valueChanged.connect(self.update_map)
+        self.top_k_selector.valueChanged.connect(lambda *_: self.update_map())
 
         # Fix Dropdown Width
         self.centrality_dropdown.setFixedSize(QSize(120, 25))
@@ -49,8 +52,10 @@ class MapFeaturesApp(QWidget):
 
         layout.addLayout(control_layout)
         layout.addWidget(self.browser)
+        attach_latency_readout(layout)
         self.setLayout(layout)
 
+    @traced
     def update_map(self):
         selected_centrality = self.centrality_dropdown.currentText()
         top_k = self.top_k_selector.value()
@@ -60,7 +65,8 @@ class MapFeaturesApp(QWidget):
 
         # Generate updated map based on selection
         map_path = generate_mbta_map_with_centrality(selected_centrality, top_k)
-        self.browser.setHtml(open(map_path).read())
+        with span("load"):
+            self.browser.load(QUrl(map_url(map_path)))
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
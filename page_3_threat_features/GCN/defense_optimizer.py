@@ -0,0 +1,208 @@
+import argparse
+import heapq
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from instrumentation import span, traced
+from page_3_threat_features.GCN.inference import (
+    load_model, load_edge_index, build_feature_tensor, stack_scenarios, model_feature_columns
+)
+from page_3_threat_features.feature_store import time_windows, feature_folder, load_all_windows
+
+
+# One patrol unit raises a station's Defense_Posture by one level (in every window)
+posture_levels = ["Low", "Medium", "High"]
+posture_columns = [model_feature_columns.index(f"Defense_Posture_{level}") for level in posture_levels]
+
+batch_size = 64  # Scenarios per forward pass
+lazy_batch_size = 8  # Stale candidates re-evaluated together in a CELF round
+modes = ["celf", "ilp"]
+
+
+def station_headroom(tables):
+    """ Units each station can take until it is High in every window, straight from the tables (no model). """
+    levels = build_feature_tensor(tables)[:, :, posture_columns].argmax(dim=2)
+    return (len(posture_levels) - 1) - levels.min(dim=0).values.numpy()
+
+
+class DefenseOptimizer:
+    """
+    Chooses where extra patrol units go to minimize the total predicted Attractiveness (all stations,
+    all windows). Scenarios are evaluated on a warm model in batches of disjoint-union graphs.
+    """
+
+    def __init__(self, tables, model=None, edge_index=None):
+        self.model = model if model is not None else load_model()
+        self.edge_index = edge_index if edge_index is not None else load_edge_index()
+        self.features = build_feature_tensor(tables)
+        stations = tables[time_windows[0]].sort_values(by="ID")
+        self.ids = stations["ID"].to_numpy()
+        self.names = stations["Station_Name"].to_numpy()
+        # Current level index per window and station (0 = Low, 1 = Medium, 2 = High)
+        self.levels = self.features[:, :, posture_columns].argmax(dim=2)
+        self.evaluations = 0
+        self.baseline = self.evaluate([np.zeros(len(self.ids), dtype=int)])[0]
+
+    def headroom(self, units):
+        """ Units each station can still take: levels left until High in its lowest window. """
+        return (len(posture_levels) - 1) - self.levels.min(dim=0).values.numpy() - units
+
+    def scenario(self, units):
+        """ Feature tensor with `units` (per station) extra Defense_Posture levels. """
+        levels = (self.levels + torch.as_tensor(units)[None, :]).clamp(max=len(posture_levels) - 1)
+        features = self.features.clone()
+        features[:, :, posture_columns] = torch.nn.functional.one_hot(levels, len(posture_levels)).float()
+        return features
+
+    def evaluate(self, allocations):
+        """ Total predicted Attractiveness of every allocation (array of units per station). """
+        totals = []
+        with torch.no_grad():
+            for start in range(0, len(allocations), batch_size):
+                chunk = [self.scenario(units) for units in allocations[start:start + batch_size]]
+                features, edges = stack_scenarios(chunk, self.edge_index)
+                predictions = self.model(features, edges)[:, :, 0]
+                totals.extend(predictions.reshape(len(chunk), -1).sum(dim=1).tolist())
+        self.evaluations += len(allocations)
+        return np.array(totals)
+
+    @traced
+    def celf(self, budget):
+        """
+        Lazy greedy: a candidate's last marginal gain is an upper bound on its next one (exact for
+        diminishing returns, a heuristic for the model), so only candidates that reach the top of the
+        queue are re-evaluated, and the stale ones near the top are re-evaluated together in one batch.
+        Returns (units per station, [(station index, marginal gain, total)] per unit placed).
+        """
+        units = np.zeros(len(self.ids), dtype=int)
+        total = self.baseline
+        candidates = np.flatnonzero(self.headroom(units) > 0)
+        gains = total - self.evaluate([units + np.eye(len(units), dtype=int)[station] for station in candidates])
+        queue = [(-gain, int(station), 0) for gain, station in zip(gains, candidates)]  # (-gain, station, round)
+        heapq.heapify(queue)
+
+        steps = []
+        for step in range(budget):
+            while queue and queue[0][2] != step:
+                stale = []
+                while queue and queue[0][2] != step and len(stale) < lazy_batch_size:
+                    stale.append(heapq.heappop(queue)[1])
+                gains = total - self.evaluate([units + np.eye(len(units), dtype=int)[station] for station in stale])
+                for gain, station in zip(gains, stale):
+                    heapq.heappush(queue, (-gain, station, step))
+            if not queue:
+                break
+            negative_gain, station, _ = heapq.heappop(queue)
+            units[station] += 1
+            total += negative_gain
+            steps.append((station, -negative_gain, total))
+            if self.headroom(units)[station] > 0:
+                heapq.heappush(queue, (negative_gain, station, -1))  # Next level: stale, bounded by this gain
+        return units, steps
+
+    @traced
+    def ilp(self, budget):
+        """
+        Knapsack allocation under an additive approximation: the gain of giving each station 1 or 2 units is
+        evaluated on its own, then a multiple-choice knapsack (one option per station, total units <= budget)
+        is solved with scipy's MILP solver. It is exact only if the stations' gains add up, which the model's
+        do not, so the chosen allocation is re-evaluated jointly on the model.
+        """
+        from scipy.optimize import milp, LinearConstraint, Bounds
+
+        headroom = self.headroom(np.zeros(len(self.ids), dtype=int))
+        options = [(station, amount) for station in range(len(self.ids)) for amount in range(1, headroom[station] + 1)]
+        allocations = []
+        for station, amount in options:
+            units = np.zeros(len(self.ids), dtype=int)
+            units[station] = amount
+            allocations.append(units)
+        gains = self.baseline - self.evaluate(allocations)
+
+        one_per_station = np.zeros((len(self.ids), len(options)))
+        for index, (station, _) in enumerate(options):
+            one_per_station[station, index] = 1
+        cost = np.array([[amount for _, amount in options]], dtype=float)
+        result = milp(-gains, integrality=np.ones(len(options)), bounds=Bounds(0, 1),
+                      constraints=[LinearConstraint(one_per_station, 0, 1), LinearConstraint(cost, 0, budget)])
+        if not result.success:
+            print(f"ILP failed: {result.message}")
+            return None, []
+
+        units = np.zeros(len(self.ids), dtype=int)
+        chosen = [options[index] for index in np.flatnonzero(result.x > 0.5)]
+        # Order the chosen stations by their individual gain per unit for the gain curve
+        chosen.sort(key=lambda option: -gains[options.index(option)] / option[1])
+        steps, total = [], self.baseline
+        for station, amount in chosen:
+            for _ in range(amount):
+                units[station] += 1
+                new_total = self.evaluate([units])[0]
+                steps.append((station, total - new_total, new_total))
+                total = new_total
+        return units, steps
+
+    def optimize(self, budget, mode="celf"):
+        """
+        Places up to `budget` patrol units. Returns (allocation, curve) DataFrames: the stations that
+        received units with their old and new Defense_Posture, and the marginal gain / total per unit placed.
+        """
+        start = time.perf_counter()
+        self.evaluations = 0
+        with span("optimize_defense", budget=budget, mode=mode):
+            units, steps = self.celf(budget) if mode == "celf" else self.ilp(budget)
+            selected = mode
+            if mode == "ilp":
+                # Joint refinement: the knapsack ignores how the stations' gains interact, so the greedy
+                # allocation is kept instead whenever it scores lower on the model itself
+                greedy_units, greedy_steps = self.celf(budget)
+                if units is None or final_total(greedy_steps, self.baseline) < final_total(steps, self.baseline):
+                    units, steps, selected = greedy_units, greedy_steps, "celf"
+        if units is None:
+            return None, None
+
+        current = self.levels.min(dim=0).values.numpy()
+        allocation = pd.DataFrame({"ID": self.ids, "Station_Name": self.names, "units": units,
+                                   "Defense_Posture": np.array(posture_levels)[current],
+                                   "New_Defense_Posture": np.array(posture_levels)[np.minimum(current + units, 2)]})
+        allocation = allocation[allocation["units"] > 0].reset_index(drop=True)
+        curve = pd.DataFrame([{"unit": index + 1, "ID": self.ids[station], "Station_Name": self.names[station],
+                               "marginal_gain": gain, "total_attractiveness": total}
+                              for index, (station, gain, total) in enumerate(steps)])
+        curve.attrs.update(baseline=self.baseline, evaluations=self.evaluations, seconds=time.perf_counter() - start,
+                           selected=selected, approximation=mode == "ilp" and selected == "ilp")
+        return allocation, curve
+
+
+def final_total(steps, baseline):
+    """ Total predicted attractiveness after the last unit placed. """
+    return steps[-1][2] if steps else baseline
+
+
+def optimize_defense(folder=feature_folder, budget=10, mode="celf", model=None, edge_index=None):
+    """ Runs the optimizer on the Feature_Label tables in `folder`. """
+    tables = load_all_windows(folder)
+    if len(tables) != len(time_windows):
+        print(f"The optimizer needs all {len(time_windows)} Feature_Label tables in {folder}")
+        return None, None
+    return DefenseOptimizer(tables, model, edge_index).optimize(budget, mode)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Where should N extra patrol units go to minimize attractiveness?")
+    parser.add_argument("--budget", type=int, default=10, help="Patrol units (one unit = one Defense_Posture level)")
+    parser.add_argument("--mode", choices=modes, default="celf")
+    parser.add_argument("--feature-folder", default=feature_folder)
+    args = parser.parse_args()
+
+    allocation, curve = optimize_defense(args.feature_folder, args.budget, args.mode)
+    if allocation is not None:
+        print(allocation.to_string(index=False))
+        print()
+        print(curve.to_string(index=False))
+        print(f"\nTotal attractiveness {curve.attrs['baseline']:.4f} -> {curve['total_attractiveness'].iloc[-1]:.4f} "
+              f"({curve.attrs['evaluations']} scenarios evaluated in {curve.attrs['seconds']:.1f} s, "
+              f"{curve.attrs['selected']} allocation)")
@@ -18,7 +18,32 @@ class GCNLayer(nn.Module):
         return x
 
 
+def independent_node_groups(edge_index, num_nodes, hops=1):
+    """
+    Greedy colouring of the graph: groups of nodes that are more than `hops` edges apart, so no node of a
+    group lies in the receptive field of another one.
+    """
+    neighbours = [set() for _ in range(num_nodes)]
+    for source, target in edge_index.t().tolist():
+        if source != target:
+            neighbours[source].add(target)
+            neighbours[target].add(source)
+    reach = neighbours
+    for _ in range(hops - 1):
+        reach = [set().union(nodes, *(neighbours[node] for node in nodes)) - {start} for start, nodes in enumerate(reach)]
+    colors = {}
+    for node in sorted(range(num_nodes), key=lambda node: -len(reach[node])):
+        used = {colors[other] for other in reach[node] if other in colors}
+        colors[node] = next(color for color in range(num_nodes) if color not in used)
+    groups = [[] for _ in range(max(colors.values()) + 1)]
+    for node, color in colors.items():
+        groups[color].append(node)
+    return groups
+
+
 class GCN_LSTM(nn.Module):
+    receptive_hops = 1  # One GCN layer: a node's prediction depends on its direct neighbours only
+
     def __init__(self, input_dim, hidden_dim, output_dim, time_steps=9, gcn_dropout=0.5, lstm_dropout=0.5):
         super(GCN_LSTM, self).__init__()
         self.time_steps = time_steps
@@ -42,6 +67,57 @@ class GCN_LSTM(nn.Module):
         predictions = self.fc(lstm_out)
         return predictions
 
+    def sensitivity(self, x_seq, edge_index):
+        """
+        Gradients of the predictions w.r.t. every input, from one batched backward pass.
+        Returns two tensors shaped [time_steps (output), time_steps (input), num_nodes, input_dim]:
+        - own[t, t', s, f]: d prediction[s, t] / d x_seq[t', s, f]
+        - network[t, t', s, f]: d sum of all predictions in window t / d x_seq[t', s, f]
+        The own gradients of a whole group of mutually out-of-reach nodes come from a single
+        cotangent, so the batch holds time_steps * (1 + number of groups) vectors, not one per node.
+        """
+        num_nodes = x_seq.shape[1]
+        groups = independent_node_groups(edge_index, num_nodes, self.receptive_hops)
+        masks = torch.zeros(len(groups), num_nodes)
+        for index, group in enumerate(groups):
+            masks[index, group] = 1.0
+
+        x = x_seq.detach().clone().requires_grad_(True)
+        with torch.enable_grad():
+            predictions = self(x, edge_index)[:, :, 0]  # [num_nodes, time_steps]
+            eye = torch.eye(self.time_steps)
+            network_vectors = eye[:, None, :].expand(self.time_steps, num_nodes, self.time_steps)
+            own_vectors = masks[:, None, :, None] * eye[None, :, None, :]  # [groups, time_steps, num_nodes, time_steps]
+            cotangents = torch.cat([network_vectors, own_vectors.reshape(-1, num_nodes, self.time_steps)])
+            gradients, = torch.autograd.grad(predictions, x, cotangents, is_grads_batched=True)
+
+        network = gradients[:self.time_steps]
+        own = gradients[self.time_steps:].reshape(len(groups), self.time_steps, *x.shape)
+        own = (own * masks[:, None, None, :, None]).sum(dim=0)  # Keep each node's own group only
+        return own, network
+
+    def mc_dropout(self, x_seq, edge_index, samples=100, seed=None):
+        """
+        Monte Carlo dropout: `samples` stochastic predictions with dropout active, from one forward pass
+        over `samples` disjoint copies of the graph (every copy draws its own dropout masks).
+        Returns [samples, num_nodes, time_steps, output_dim].
+        """
+        num_nodes = x_seq.shape[1]
+        x = x_seq.repeat(1, samples, 1)
+        offsets = torch.arange(samples).repeat_interleave(edge_index.shape[1]) * num_nodes
+        edges = edge_index.repeat(1, samples) + offsets
+
+        was_training = self.training
+        self.train()
+        try:
+            with torch.no_grad(), torch.random.fork_rng(enabled=seed is not None):
+                if seed is not None:
+                    torch.manual_seed(seed)
+                predictions = self(x, edges)
+        finally:
+            self.train(was_training)
+        return predictions.reshape(samples, num_nodes, *predictions.shape[1:])
+
 
 if __name__ == "__main__":
     input_dim = 12
@@ -0,0 +1,296 @@
+import os
+
+import numpy as np
+import pandas as pd
+import torch
+
+from instrumentation import span, traced
+from page_3_threat_features.GCN.gcn_lstm import GCN_LSTM
+from page_3_threat_features.feature_store import time_windows, feature_folder, feature_label_path, load_all_windows
+
+
+gcn_folder = "page_3_threat_features/GCN"
+weights_path = os.path.join(gcn_folder, "GCN_LSTM_weights.pth")
+edge_index_path = os.path.join(gcn_folder, "edge_index.csv")
+
+# Model input columns, in the order the pretrained weights expect
+continuous_features = [
+    "D_nearest_police", "D_nearest_fire", "D_nearest_hospital",
+    "Population_Density", "Average_Ridership", "Crime_Index"
+]
+categorical_features = ["Threat_Level", "Defense_Posture"]
+category_levels = ["High", "Low", "Medium"]  # Same order as pd.get_dummies
+
+model_feature_columns = continuous_features + [
+    f"{feature}_{level}" for feature in categorical_features for level in category_levels
+]
+
+# Monte Carlo dropout: stochastic passes and the reported interval
+uncertainty_samples = 100
+uncertainty_quantiles = (0.05, 0.95)
+
+# Sensitivity of continuous features is reported for a raise of this size (the features are scaled to [0, 1])
+continuous_step = 0.1
+
+
+@traced
+def load_edge_index(path=edge_index_path):
+    """ Loads the graph structure as a (2, num_edges) LongTensor. """
+    # Indices are stored in float notation ("1.0e+00"), which an integer parse turns into -1
+    edge_index = np.genfromtxt(path, delimiter=",", dtype=float).astype(int)
+    if edge_index.shape[0] != 2:
+        edge_index = edge_index.T  # Transpose if needed
+    return torch.tensor(edge_index, dtype=torch.long)
+
+
+@traced
+def load_model(input_dim=len(model_feature_columns), path=weights_path, hidden_dim=64, gcn_dropout=0.5, lstm_dropout=0):
+    """ Loads the pretrained GCN-LSTM on CPU in eval mode. """
+    model = GCN_LSTM(input_dim=input_dim, hidden_dim=hidden_dim, output_dim=1, time_steps=len(time_windows),
+                     gcn_dropout=gcn_dropout, lstm_dropout=lstm_dropout)
+    model.load_state_dict(torch.load(path, map_location=torch.device("cpu")))
+    model.eval()
+    return model
+
+
+def active_model():
+    """ The warm model of the registry's active version. """
+    from page_3_threat_features.GCN.model_registry import get_registry  # The registry builds on this module
+    return get_registry().model()
+
+
+def encode_features(df):
+    """ One-hot encodes the categorical features and returns the model input matrix ordered by station ID. """
+    df = df.sort_values(by="ID")
+    encoded = df[continuous_features].astype(float)
+    for feature in categorical_features:
+        levels = pd.Categorical(df[feature], categories=category_levels)
+        dummies = pd.get_dummies(levels, prefix=feature).astype(float)
+        dummies.index = df.index
+        encoded = encoded.join(dummies)
+    return encoded[model_feature_columns].to_numpy(dtype=np.float32)
+
+
+@traced
+def build_feature_tensor(tables):
+    """ Stacks the per-window tables ({time_of_day: DataFrame}) into a (9, num_nodes, num_features) tensor. """
+    return torch.tensor(np.stack([encode_features(tables[time_of_day]) for time_of_day in time_windows]))
+
+
+@traced
+def predict_attractiveness(model, features_tensor, edge_index):
+    """ Runs one forward pass and returns predictions shaped (num_nodes, 9). """
+    with torch.no_grad():
+        return model(features_tensor, edge_index)[:, :, 0].numpy()
+
+
+def stack_scenarios(feature_tensors, edge_index):
+    """
+    Batches scenarios as one disjoint-union graph: scenario b's nodes are shifted by b * num_nodes.
+    GCN propagation never crosses components, so each block equals a separate forward pass.
+    """
+    num_nodes = feature_tensors[0].shape[1]
+    features = torch.cat(feature_tensors, dim=1)  # (9, batch * num_nodes, num_features)
+    offsets = torch.arange(len(feature_tensors)).repeat_interleave(edge_index.shape[1]) * num_nodes
+    return features, edge_index.repeat(1, len(feature_tensors)) + offsets
+
+
+@traced
+def predict_batch(model, feature_tensors, edge_index):
+    """ Predicts several scenarios in one forward pass; returns an array shaped (batch, num_nodes, 9). """
+    features, batched_edges = stack_scenarios(feature_tensors, edge_index)
+    predictions = predict_attractiveness(model, features, batched_edges)
+    return predictions.reshape(len(feature_tensors), feature_tensors[0].shape[1], -1)
+
+
+@traced
+def predict_uncertainty(model, features_tensor, edge_index, samples=uncertainty_samples,
+                        quantiles=uncertainty_quantiles, seed=0):
+    """
+    MC dropout estimate of the predictions: {"mean", "std", "low", "high"} arrays shaped (num_nodes, 9),
+    `low` / `high` being the `quantiles` of the sampled predictions.
+    """
+    draws = model.mc_dropout(features_tensor, edge_index, samples, seed)[..., 0].numpy()
+    low, high = np.quantile(draws, quantiles, axis=0)
+    return {"mean": draws.mean(axis=0), "std": draws.std(axis=0), "low": low, "high": high}
+
+
+def apply_change(tables, station_name, feature, new_value):
+    """ Returns copies of the per-window tables with the feature changed for the station in every window. """
+    changed = {}
+    for time_of_day, df in tables.items():
+        df = df.copy()
+        df.loc[df["Station_Name"] == station_name, feature] = new_value
+        changed[time_of_day] = df
+    return changed
+
+
+@traced
+def simulate_change(folder, time_of_day, station_name, feature, new_value, model=None, edge_index=None):
+    """
+    Headless what-if simulation on the Feature_Label tables in `folder`:
+    sets `feature` to `new_value` for the station, re-predicts Attractiveness for all 9 windows
+    and writes the results back. Returns the (num_nodes, 9) predictions, or None if a table is missing.
+    """
+    file_path = feature_label_path(time_of_day, folder)
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}")
+        return None
+
+    # Apply the manual change to the selected window and save it
+    df = pd.read_csv(file_path)
+    df.loc[df["Station_Name"] == station_name, feature] = new_value
+    df.to_csv(file_path, index=False)
+
+    tables = {}
+    with span("load_tables"):
+        for time in time_windows:
+            df = pd.read_csv(feature_label_path(time, folder))
+            # The change is applied to every window's model input
+            df.loc[df["Station_Name"] == station_name, feature] = new_value
+            tables[time] = df
+
+    model = model if model is not None else active_model()
+    edge_index = edge_index if edge_index is not None else load_edge_index()
+    predictions = predict_attractiveness(model, build_feature_tensor(tables), edge_index)
+    write_predictions(folder, predictions)
+    return predictions
+
+
+def write_predictions(folder, predictions):
+    """ Writes (num_nodes, 9) predictions into the Attractiveness column of every table in `folder`. """
+    with span("write_tables"):
+        for i, time in enumerate(time_windows):
+            csv_path = feature_label_path(time, folder)
+            df = pd.read_csv(csv_path)
+            df["Attractiveness"] = predictions[:, i]
+            df.to_csv(csv_path, index=False)
+
+
+@traced
+def repredict(folder, model=None, edge_index=None):
+    """
+    Re-predicts Attractiveness of the tables in `folder` as they are (e.g. after switching the model).
+    Returns the (num_nodes, 9) predictions, or None if a table is missing.
+    """
+    tables = load_all_windows(folder)
+    if len(tables) != len(time_windows):
+        print(f"Prediction needs all {len(time_windows)} Feature_Label tables in {folder}")
+        return None
+    model = model if model is not None else active_model()
+    edge_index = edge_index if edge_index is not None else load_edge_index()
+    predictions = predict_attractiveness(model, build_feature_tensor(tables), edge_index)
+    write_predictions(folder, predictions)
+    return predictions
+
+
+@traced
+def sensitivity_table(model, tables, edge_index):
+    """
+    Estimated change of Attractiveness for every (station, window, edit), from the model's gradients
+    (GCN_LSTM.sensitivity). An edit applies to every window, as in simulate_change, and is either raising a
+    continuous feature by `continuous_step` or switching a categorical feature to another level (linearized).
+    `own_effect` is the change at the edited station, `network_effect` the change summed over all stations.
+    """
+    features_tensor = build_feature_tensor(tables)
+    own, network = model.sensitivity(features_tensor, edge_index)
+    x = features_tensor.numpy()
+    first = tables[time_windows[0]].sort_values(by="ID")
+
+    effects = {}
+    for name, gradients in (("own_effect", own.numpy()), ("network_effect", network.numpy())):
+        summed = gradients.sum(axis=1)  # Edit applied in every input window: [windows, stations, inputs]
+        columns = [summed[:, :, :len(continuous_features)] * continuous_step]
+        for index, feature in enumerate(categorical_features):
+            block = slice(len(continuous_features) + index * len(category_levels),
+                          len(continuous_features) + (index + 1) * len(category_levels))
+            # Switching to a level: + gradient of the new level, - gradient of the current level (per input window)
+            current = (gradients[:, :, :, block] * x[None, :, :, block]).sum(axis=(1, 3))
+            columns.append(summed[:, :, block] - current[:, :, None])
+        effects[name] = np.concatenate(columns, axis=2)
+    edits = [(feature, None) for feature in continuous_features] + \
+            [(feature, level) for feature in categorical_features for level in category_levels]
+
+    windows, stations, edit_index = np.meshgrid(np.arange(len(time_windows)), np.arange(len(first)),
+                                                np.arange(len(edits)), indexing="ij")
+    table = pd.DataFrame({
+        "ID": first["ID"].to_numpy()[stations.ravel()],
+        "Station_Name": first["Station_Name"].to_numpy()[stations.ravel()],
+        "time_of_day": np.array(time_windows)[windows.ravel()],
+        "feature": np.array([feature for feature, _ in edits])[edit_index.ravel()],
+        "level": np.array([level for _, level in edits], dtype=object)[edit_index.ravel()],
+        "own_effect": effects["own_effect"].ravel(),
+        "network_effect": effects["network_effect"].ravel(),
+    })
+    # Drop level switches to the level a station already has in every window
+    keep = np.ones(len(table), dtype=bool)
+    for feature in categorical_features:
+        levels = pd.concat([tables[time_of_day].set_index("ID")[feature] for time_of_day in time_windows], axis=1)
+        constant_level = levels.iloc[:, 0].where(levels.nunique(axis=1) == 1)
+        keep &= ~((table["feature"] == feature) & (table["ID"].map(constant_level) == table["level"])).to_numpy()
+    return table[keep].reset_index(drop=True)
+
+
+def rank_sensitivity(table, time_of_day=None, scope="own_effect", k=None):
+    """ Edits sorted by the size of their effect (largest first), optionally for one window. """
+    if time_of_day is not None:
+        table = table[table["time_of_day"] == time_of_day]
+    order = table[scope].abs().sort_values(ascending=False, kind="stable").index
+    return table.loc[order[:k]].reset_index(drop=True)
+
+
+_sensitivities = {}
+
+
+def get_sensitivity(folder=feature_folder, model=None, edge_index=None):
+    """ Sensitivity table of a Feature_Label folder, recomputed when one of its tables or the model changes. """
+    paths = [feature_label_path(time_of_day, folder) for time_of_day in time_windows]
+    signature = tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+                      for path in paths)
+    model = model if model is not None else active_model()
+    cached = _sensitivities.get(folder)
+    if cached is None or cached[0] != signature or cached[1] is not model:
+        tables = load_all_windows(folder)
+        if len(tables) != len(time_windows):
+            print(f"Sensitivity needs all {len(time_windows)} Feature_Label tables in {folder}")
+            return None
+        edge_index = edge_index if edge_index is not None else load_edge_index()
+        cached = _sensitivities[folder] = (signature, model, sensitivity_table(model, tables, edge_index))
+    return cached[2]
+
+
+def uncertainty_table(model, tables, edge_index, samples=uncertainty_samples):
+    """ One row per (station, window): deterministic prediction and the MC dropout mean, std and interval. """
+    features_tensor = build_feature_tensor(tables)
+    estimate = predict_uncertainty(model, features_tensor, edge_index, samples)
+    predicted = predict_attractiveness(model, features_tensor, edge_index)
+    stations = tables[time_windows[0]].sort_values(by="ID")
+    windows, rows = np.meshgrid(np.arange(len(time_windows)), np.arange(len(stations)), indexing="ij")
+    table = pd.DataFrame({"ID": stations["ID"].to_numpy()[rows.ravel()],
+                          "Station_Name": stations["Station_Name"].to_numpy()[rows.ravel()],
+                          "time_of_day": np.array(time_windows)[windows.ravel()],
+                          "prediction": predicted.T.ravel()})
+    for name, values in estimate.items():
+        table[name] = values.T.ravel()
+    return table
+
+
+_uncertainties = {}
+
+
+def get_uncertainty(folder=feature_folder, samples=uncertainty_samples, model=None, edge_index=None):
+    """ Uncertainty table of a Feature_Label folder, recomputed when one of its tables or the model changes. """
+    paths = [feature_label_path(time_of_day, folder) for time_of_day in time_windows]
+    signature = tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+                      for path in paths)
+    model = model if model is not None else active_model()
+    cached = _uncertainties.get((folder, samples))
+    if cached is None or cached[0] != signature or cached[1] is not model:
+        tables = load_all_windows(folder)
+        if len(tables) != len(time_windows):
+            print(f"Uncertainty needs all {len(time_windows)} Feature_Label tables in {folder}")
+            return None
+        edge_index = edge_index if edge_index is not None else load_edge_index()
+        cached = _uncertainties[(folder, samples)] = (signature, model,
+                                                      uncertainty_table(model, tables, edge_index, samples))
+    return cached[2]
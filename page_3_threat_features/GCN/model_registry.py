@@ -0,0 +1,182 @@
+import argparse
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import torch
+
+from instrumentation import span
+from page_3_threat_features.GCN.inference import (
+    gcn_folder, weights_path, load_model, load_edge_index, build_feature_tensor, predict_attractiveness,
+    model_feature_columns
+)
+from page_3_threat_features.feature_stats import content_hash
+from page_3_threat_features.feature_store import time_windows, feature_folder, load_all_windows
+
+
+# Every version is a folder <registry_folder>/<version> with GCN_LSTM_weights.pth and model.json
+registry_folder = os.path.join(gcn_folder, "models")
+active_file = "active.json"  # {"version": ...}, read by every process using the registry
+shipped_version = "shipped"  # The pretrained weights next to the model code
+warm_models = 3  # Loaded models kept in memory
+
+
+def data_hash(feature_hashes):
+    """ One hash for a set of per-window content hashes. """
+    return hashlib.sha1(json.dumps(feature_hashes, sort_keys=True).encode()).hexdigest()
+
+
+class ModelRegistry:
+    """
+    Versions of the GCN-LSTM weights with their metadata (input size, feature column order, training data
+    hash, metrics). Models load lazily and the most recently used ones stay warm, so switching between
+    versions costs one load at most. The active version lives in `active_file`: `activate` replaces it
+    atomically and every caller of `model()` (in any process) gets the new version on its next call.
+    """
+
+    def __init__(self, folder=registry_folder, capacity=warm_models):
+        self.folder = folder
+        self.capacity = capacity
+        self.models = collections.OrderedDict()  # version -> model, least recently used first
+        self.lock = threading.Lock()
+        self._active = (None, shipped_version)  # (active file mtime, version)
+
+    def version_path(self, version, name="GCN_LSTM_weights.pth"):
+        return weights_path if version == shipped_version else os.path.join(self.folder, version, name)
+
+    def versions(self):
+        """ Registered versions, oldest first (version names sort by creation time). """
+        registered = []
+        if os.path.isdir(self.folder):
+            registered = sorted(version for version in os.listdir(self.folder)
+                                if os.path.exists(os.path.join(self.folder, version, "model.json")))
+        return [shipped_version] + registered
+
+    def metadata(self, version):
+        if version == shipped_version:
+            return {"version": shipped_version, "input_dim": len(model_feature_columns), "hidden_dim": 64,
+                    "gcn_dropout": 0.5, "features": model_feature_columns,
+                    "data_hash": content_hash(os.path.join(gcn_folder, "Original_Features.pth"))}
+        path = self.version_path(version, "model.json")
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown model version {version}; registered: {self.versions()}")
+        with open(path) as f:
+            return json.load(f)
+
+    def register(self, state_dict, metadata, version=None):
+        """
+        Stores new weights and their metadata as one version. The version folder is written under a
+        temporary name and renamed, so a half-written version is never listed. Returns the version name.
+        """
+        if metadata.get("features") != model_feature_columns:
+            raise ValueError(f"Models must use the feature columns {model_feature_columns}")
+        version = version or time.strftime("%Y%m%d-%H%M%S")
+        candidate, suffix = version, 1
+        while os.path.exists(os.path.join(self.folder, candidate)):
+            candidate, suffix = f"{version}-{suffix}", suffix + 1
+        metadata = {**metadata, "version": candidate, "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+        staging = os.path.join(self.folder, f".{candidate}.tmp")
+        os.makedirs(staging)
+        torch.save(state_dict, os.path.join(staging, "GCN_LSTM_weights.pth"))
+        with open(os.path.join(staging, "model.json"), "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.rename(staging, os.path.join(self.folder, candidate))
+        return candidate
+
+    def load(self, version):
+        """ The model of a version, from memory if it is still warm. """
+        with self.lock:
+            if version in self.models:
+                self.models.move_to_end(version)
+                return self.models[version]
+            metadata = self.metadata(version)
+            if metadata["features"] != model_feature_columns:
+                raise ValueError(f"Model {version} expects the features {metadata['features']}, "
+                                 f"the feature store provides {model_feature_columns}")
+            with span("load_model_version", version=version):
+                model = load_model(metadata["input_dim"], self.version_path(version), metadata["hidden_dim"],
+                                   metadata["gcn_dropout"])
+            self.models[version] = model
+            if len(self.models) > self.capacity:
+                self.models.popitem(last=False)
+            return model
+
+    def active_version(self):
+        path = os.path.join(self.folder, active_file)
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        if mtime != self._active[0]:
+            version = shipped_version
+            if mtime is not None:
+                with open(path) as f:
+                    version = json.load(f)["version"]
+            if version not in self.versions():
+                print(f"Active model {version} is not registered, using {shipped_version}")
+                version = shipped_version
+            self._active = (mtime, version)
+        return self._active[1]
+
+    def activate(self, version):
+        """ Makes `version` the active model. It is loaded first, so a broken version is never activated. """
+        self.load(version)
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, active_file)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"version": version}, f)
+        os.replace(path + ".tmp", path)
+        self._active = (None, version)
+        return version
+
+    def model(self, version=None):
+        """ The model of `version` (default: the active version). """
+        return self.load(version or self.active_version())
+
+    def compare(self, versions, features_tensor, edge_index):
+        """ Predictions of several versions on the same input: {version: (num_nodes, 9) array}. """
+        return {version: predict_attractiveness(self.load(version), features_tensor, edge_index)
+                for version in versions}
+
+
+_registries = {}
+
+
+def get_registry(folder=registry_folder):
+    """ Shared registry for a models folder. """
+    if folder not in _registries:
+        _registries[folder] = ModelRegistry(folder)
+    return _registries[folder]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List, activate and compare GCN-LSTM model versions.")
+    parser.add_argument("--folder", default=registry_folder)
+    parser.add_argument("--activate", metavar="VERSION")
+    parser.add_argument("--compare", nargs="+", metavar="VERSION", help="Predict the Feature_Label tables with each")
+    parser.add_argument("--feature-folder", default=feature_folder)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    registry = get_registry(args.folder)
+    if args.activate:
+        print(f"Activated {registry.activate(args.activate)}")
+    active = registry.active_version()
+    for version in registry.versions():
+        metadata = registry.metadata(version)
+        mse = metadata.get("metrics", {}).get("all_stations", {}).get("mse")
+        print(f"{'*' if version == active else ' '} {version:20s} hidden_dim={metadata['hidden_dim']:<4} "
+              f"data={metadata['data_hash'][:10]}" + (f" mse={mse:.5f}" if mse is not None else ""))
+
+    if args.compare:
+        tables = load_all_windows(args.feature_folder)
+        ids = tables[time_windows[0]].sort_values(by="ID")["ID"].to_numpy()
+        predictions = registry.compare(args.compare, build_feature_tensor(tables), load_edge_index())
+        reference = predictions[args.compare[0]]
+        for version, predicted in predictions.items():
+            overlap = np.mean([len(set(ids[np.argsort(-predicted[:, w])[:args.k]]) &
+                                   set(ids[np.argsort(-reference[:, w])[:args.k]])) for w in range(len(time_windows))])
+            print(f"{version}: mean |Δ| vs {args.compare[0]} {np.abs(predicted - reference).mean():.4f}, "
+                  f"mean top-{args.k} overlap {overlap:.1f}")
@@ -0,0 +1,243 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from instrumentation import span, traced
+from page_3_threat_features.GCN.gcn_lstm import GCN_LSTM
+from page_3_threat_features.GCN.inference import (
+    weights_path, load_model, load_edge_index, build_feature_tensor, model_feature_columns
+)
+from page_3_threat_features.GCN.model_registry import registry_folder, data_hash, get_registry
+from page_3_threat_features.feature_stats import content_hash
+from page_3_threat_features.feature_store import time_windows, feature_folder, feature_label_path, load_all_windows
+
+
+target_column = "Attractiveness"
+
+default_params = {"hidden_dim": 64, "lr": 0.01, "weight_decay": 5e-4, "gcn_dropout": 0.5, "lstm_dropout": 0.0}
+max_epochs = 500
+patience = 30  # Epochs without a better validation loss before training stops
+validation_share = 0.15  # Stations held out of the training stations for early stopping
+
+
+class TrainingData:
+    """
+    The model inputs (9, num_nodes, num_features) and Attractiveness targets (num_nodes, 9) built from the
+    Feature_Label tables, stations ordered by ID like `build_feature_tensor`. The content hash of every
+    table is kept so a set of weights can be traced back to the data it was trained on.
+    """
+
+    def __init__(self, folder=feature_folder, edge_index=None):
+        tables = load_all_windows(folder)
+        missing = [time_of_day for time_of_day in time_windows if time_of_day not in tables]
+        if missing:
+            raise ValueError(f"Training needs all {len(time_windows)} Feature_Label tables, missing {missing}")
+        self.folder = folder
+        self.features = build_feature_tensor(tables)
+        self.targets = torch.tensor(np.stack([tables[time_of_day].sort_values(by="ID")[target_column].to_numpy()
+                                              for time_of_day in time_windows], axis=1), dtype=torch.float32)
+        self.ids = tables[time_windows[0]].sort_values(by="ID")["ID"].to_numpy()
+        self.edge_index = edge_index if edge_index is not None else load_edge_index()
+        self.hashes = {time_of_day: content_hash(feature_label_path(time_of_day, folder)) for time_of_day in time_windows}
+
+    @property
+    def num_nodes(self):
+        return self.features.shape[1]
+
+    def folds(self, k, seed=0):
+        """ k (train, test) station index splits; the same seed always gives the same folds. """
+        order = np.random.default_rng(seed).permutation(self.num_nodes)
+        parts = np.array_split(order, k)
+        return [(np.sort(np.concatenate(parts[:i] + parts[i + 1:])), np.sort(parts[i])) for i in range(k)]
+
+
+def split_validation(train, seed=0):
+    """ Splits training stations into (fit, validation) for early stopping. """
+    shuffled = np.random.default_rng(seed).permutation(train)
+    size = max(1, int(round(len(train) * validation_share)))
+    return np.sort(shuffled[size:]), np.sort(shuffled[:size])
+
+
+def build_model(params):
+    """
+    A fresh GCN_LSTM whose GCN layer caches its normalized adjacency: the graph never changes during
+    training, so the symmetric normalization runs once instead of in every window of every epoch.
+    """
+    model = GCN_LSTM(input_dim=len(model_feature_columns), hidden_dim=params["hidden_dim"], output_dim=1,
+                     time_steps=len(time_windows), gcn_dropout=params["gcn_dropout"],
+                     lstm_dropout=params["lstm_dropout"])
+    model.gcn.conv.cached = True
+    return model
+
+
+def regression_metrics(predictions, targets):
+    error = predictions - targets
+    variance = ((targets - targets.mean()) ** 2).mean()
+    return {"mse": float((error ** 2).mean()), "mae": float(error.abs().mean()),
+            "r2": float(1 - (error ** 2).mean() / variance) if variance > 0 else float("nan")}
+
+
+def fit(data, train, validation, params=default_params, epochs=max_epochs, seed=0):
+    """
+    Full-batch training on the `train` stations (every epoch is one forward pass over the whole graph, the
+    loss only covers the training stations) with early stopping on the `validation` stations.
+    Returns (model with the best validation weights, {"epochs", "best_epoch", "validation"}).
+    """
+    torch.manual_seed(seed)
+    model = build_model(params)
+    optimizer = torch.optim.Adam(model.parameters(), lr=params["lr"], weight_decay=params["weight_decay"])
+    train = torch.as_tensor(train)
+    validation = torch.as_tensor(validation)
+
+    best_loss, best_epoch, best_state = float("inf"), 0, None
+    for epoch in range(1, epochs + 1):
+        model.train()
+        optimizer.zero_grad()
+        loss = torch.nn.functional.mse_loss(model(data.features, data.edge_index)[train, :, 0], data.targets[train])
+        loss.backward()
+        optimizer.step()
+
+        model.eval()
+        with torch.no_grad():
+            validation_loss = torch.nn.functional.mse_loss(
+                model(data.features, data.edge_index)[validation, :, 0], data.targets[validation]).item()
+        if validation_loss < best_loss:
+            best_loss, best_epoch = validation_loss, epoch
+            best_state = {name: value.clone() for name, value in model.state_dict().items()}
+        elif epoch - best_epoch >= patience:
+            break
+
+    model.load_state_dict(best_state)
+    model.eval()
+    return model, {"epochs": epoch, "best_epoch": best_epoch, "validation": {"mse": best_loss}}
+
+
+def evaluate(model, data, stations):
+    with torch.no_grad():
+        predictions = model(data.features, data.edge_index)[stations, :, 0]
+    return regression_metrics(predictions, data.targets[stations])
+
+
+_data = None
+
+
+def _init_worker(folder, threads):
+    """ Pool initializer: each worker builds the training data once and uses its share of the cores. """
+    global _data
+    torch.set_num_threads(threads)
+    _data = TrainingData(folder)
+
+
+def run_fold(params, train, test, epochs, seed):
+    """ Trains on one cross-validation fold and scores the held-out stations. """
+    fit_stations, validation = split_validation(train, seed)
+    start = time.perf_counter()
+    model, history = fit(_data, fit_stations, validation, params, epochs, seed)
+    return {**history, "test": evaluate(model, _data, test), "seconds": time.perf_counter() - start}
+
+
+def thread_split(workers):
+    """ (workers, threads per worker) that together use every core once. """
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers, cores))
+    return workers, max(1, cores // workers)
+
+
+@traced
+def cross_validate(trials, folder=feature_folder, k=5, epochs=max_epochs, seed=0, workers=4):
+    """
+    Runs every (trial, fold) pair as one job on a process pool. `trials` is a list of parameter dicts.
+    Returns one result per trial: its parameters, the per-fold results and the mean test metrics.
+    """
+    data = TrainingData(folder)
+    folds = data.folds(k, seed)
+    jobs = [(index, fold) for index in range(len(trials)) for fold in range(k)]
+    workers, threads = thread_split(min(workers, len(jobs)))
+    with span("cross_validate", trials=len(trials), folds=k, workers=workers):
+        context = multiprocessing.get_context("spawn")  # torch does not survive a fork with live threads
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(folder, threads)) as pool:
+            futures = [pool.submit(run_fold, trials[index], *folds[fold], epochs, seed + fold)
+                       for index, fold in jobs]
+            results = [future.result() for future in futures]
+
+    summary = []
+    for index, params in enumerate(trials):
+        fold_results = [result for (trial, _), result in zip(jobs, results) if trial == index]
+        mean = {name: float(np.mean([result["test"][name] for result in fold_results]))
+                for name in fold_results[0]["test"]}
+        summary.append({"params": params, "folds": fold_results, "test": mean})
+    return summary
+
+
+@traced
+def train(folder=feature_folder, params=default_params, epochs=max_epochs, seed=0, cv_results=None,
+          registry_folder=registry_folder):
+    """
+    Trains the final model on all stations (early stopping on a held-out share of them) and registers it
+    as a new model version, with its parameters, metrics and training data hash. Returns the version.
+    """
+    torch.set_num_threads(os.cpu_count() or 1)
+    data = TrainingData(folder)
+    start = time.perf_counter()
+    fit_stations, validation = split_validation(np.arange(data.num_nodes), seed)
+    model, history = fit(data, fit_stations, validation, params, epochs, seed)
+    all_stations = torch.arange(data.num_nodes)
+
+    metrics = {**history, "all_stations": evaluate(model, data, all_stations), "seconds": time.perf_counter() - start}
+    if os.path.exists(weights_path):
+        metrics["shipped_model"] = evaluate(load_model(), data, all_stations)
+    if cv_results is not None:
+        metrics["cross_validation"] = cv_results
+    metadata = {"input_dim": len(model_feature_columns), "hidden_dim": params["hidden_dim"],
+                "gcn_dropout": params["gcn_dropout"], "features": model_feature_columns,
+                "data_hash": data_hash(data.hashes), "feature_folder": folder, "feature_hashes": data.hashes,
+                "params": params, "seed": seed, "max_epochs": epochs, "patience": patience, "metrics": metrics}
+
+    model.gcn.conv.cached = False
+    return get_registry(registry_folder).register(model.state_dict(), metadata)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain the GCN-LSTM on the current Feature_Label tables.")
+    parser.add_argument("--feature-folder", default=feature_folder)
+    parser.add_argument("--registry", default=registry_folder)
+    parser.add_argument("--hidden-dim", type=int, nargs="+", default=[default_params["hidden_dim"]])
+    parser.add_argument("--lr", type=float, nargs="+", default=[default_params["lr"]])
+    parser.add_argument("--weight-decay", type=float, nargs="+", default=[default_params["weight_decay"]])
+    parser.add_argument("--gcn-dropout", type=float, nargs="+", default=[default_params["gcn_dropout"]])
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds (0 to skip cross-validation)")
+    parser.add_argument("--epochs", type=int, default=max_epochs)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--activate", action="store_true", help="Make the new version the active model")
+    args = parser.parse_args()
+
+    # Every combination of the listed values is one trial
+    trials = [{**default_params, "hidden_dim": hidden_dim, "lr": lr, "weight_decay": weight_decay,
+               "gcn_dropout": gcn_dropout}
+              for hidden_dim, lr, weight_decay, gcn_dropout
+              in itertools.product(args.hidden_dim, args.lr, args.weight_decay, args.gcn_dropout)]
+
+    cv_results, best = None, trials[0]
+    if args.folds > 1:
+        cv_results = cross_validate(trials, args.feature_folder, args.folds, args.epochs, args.seed, args.workers)
+        for result in cv_results:
+            print(f"{result['params']}: test MSE {result['test']['mse']:.5f}, R² {result['test']['r2']:.3f}")
+        best = min(cv_results, key=lambda result: result["test"]["mse"])["params"]
+        print(f"Best trial: {best}")
+
+    registry = get_registry(args.registry)
+    version = train(args.feature_folder, best, args.epochs, args.seed, cv_results, args.registry)
+    if args.activate:
+        registry.activate(version)
+    metrics = registry.metadata(version)["metrics"]
+    print(f"Registered {version}{' (active)' if args.activate else ''}: MSE {metrics['all_stations']['mse']:.5f} (shipped model "
+          f"{metrics.get('shipped_model', {}).get('mse', float('nan')):.5f}), stopped after {metrics['epochs']} "
+          f"epochs in {metrics['seconds']:.1f} s")
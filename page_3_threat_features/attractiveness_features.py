@@ -2,32 +2,42 @@ import sys
 import os
 import shutil
 
-import numpy as np
-import pandas as pd
-import torch
 from PyQt6.QtWidgets import (
     QApplication, QVBoxLayout, QWidget, QComboBox, QLabel,
     QHBoxLayout, QPushButton, QGridLayout, QSpinBox
 )
 from PyQt6.QtWebEngineWidgets import QWebEngineView
-import torch
-from numpy import genfromtxt
-
-from page_3_threat_features.GCN.gcn_lstm import GCN_LSTM
-from visualizer import generate_attractiveness_map, nodes_df, generate_overlay_singular_map
+from PyQt6.QtCore import QUrl
+
+from page_3_threat_features.GCN.inference import simulate_change, repredict
+from page_3_threat_features.GCN.model_registry import get_registry
+from local_map_server import get_map_server, map_url
+from instrumentation import span, traced, attach_latency_readout
+from visualizer import (
+    generate_attractiveness_map, nodes_df, generate_overlay_singular_map, generate_temporal_map, generate_sensitivity_map,
+    generate_uncertainty_map
+)
 
 
 
 class AttractivenessFeaturesApp(QWidget):
+    # View name -> temporal map metric (None = map of the selected time window)
+    views = {"Time Window": None, "Volatility": "volatility", "Peak Window": "peak_window",
+             "Rank Change (vs. previous window)": "rank_change",
+             "Sensitivity (selected feature & level)": "sensitivity",
+             "Uncertainty (MC Dropout)": "uncertainty"}
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Rail Station Attractiveness Prediction")
         self.setGeometry(100, 40, 1200, 800)
+        get_map_server()  # Started before the first map, so the maps link their assets through it
 
         # Create temp playground directory if not exists
         self.source_folder = "page_3_threat_features/Feature_Label"
         self.temp_folder = "page_3_threat_features/temp_playground"
         self.gcn_folder = "page_3_threat_features/GCN"
+        self.model = None  # Model version picked on this page; None = the registry's active version
         self.create_temp_playground()
 
         self.setup_ui()
@@ -53,7 +63,12 @@ class AttractivenessFeaturesApp(QWidget):
         self.time_of_day_dropdown = QComboBox()
         self.time_of_day_dropdown.addItems(time_of_day_options)
         self.time_of_day_dropdown.setCurrentText("VERY_EARLY_MORNING")  # Default
-        self.time_of_day_dropdown.currentTextChanged.connect(self.update_map)
+        self.time_of_day_dropdown.currentTextChanged.connect(lambda *_: self.update_map())
+
+        # View Dropdown: the selected window, or attractiveness compared across all windows
+        self.view_dropdown = QComboBox()
+        self.view_dropdown.addItems(list(self.views))
+        self.view_dropdown.currentTextChanged.connect(lambda *_: self.update_map())
 
         # Station Dropdown
         self.station_dropdown = QComboBox()
@@ -64,15 +79,23 @@ class AttractivenessFeaturesApp(QWidget):
         self.feature_dropdown.addItems(["Threat_Level", "Defense_Posture"])
         self.feature_dropdown.setCurrentText("Defense_Posture")  # Default
         self.feature_dropdown.currentTextChanged.connect(self.update_feature_level_dropdown)
+        self.feature_dropdown.currentTextChanged.connect(self.update_sensitivity_map)
 
         # Feature Level Dropdown (Defaults to "Low")
         self.feature_level_dropdown = QComboBox()
         self.feature_level_dropdown.addItems(["High", "Medium", "Low"])
         self.feature_level_dropdown.setCurrentText("Low")
+        self.feature_level_dropdown.currentTextChanged.connect(self.update_sensitivity_map)
+
+        # Model Dropdown: registered weight versions, switched without restarting
+        self.model_dropdown = QComboBox()
+        self.model_dropdown.addItems(get_registry().versions())
+        self.model_dropdown.setCurrentText(get_registry().active_version())
+        self.model_dropdown.currentTextChanged.connect(self.switch_model)
 
         # Simulate Button
         self.simulate_button = QPushButton("Simulate")
-        self.simulate_button.clicked.connect(self.simulate_change)
+        self.simulate_button.clicked.connect(lambda *_: self.simulate_change())
 
         # Overlay Features Button
         self.overlay_button = QPushButton("Overlay Features")
@@ -88,11 +111,15 @@ class AttractivenessFeaturesApp(QWidget):
         top_layout = QHBoxLayout()
         top_layout.addWidget(QLabel("Select Time of Day:"))
         top_layout.addWidget(self.time_of_day_dropdown)
+        top_layout.addWidget(QLabel("View:"))
+        top_layout.addWidget(self.view_dropdown)
         top_layout.addWidget(QLabel("Select Station:"))
         top_layout.addWidget(self.station_dropdown)
         top_layout.addWidget(QLabel("Select Feature:"))
         top_layout.addWidget(self.feature_dropdown)
         top_layout.addWidget(self.feature_level_dropdown)
+        top_layout.addWidget(QLabel("Model:"))
+        top_layout.addWidget(self.model_dropdown)
         top_layout.addWidget(self.simulate_button)
         top_layout.addWidget(self.reset_button)
         top_layout.addStretch()
@@ -100,6 +127,7 @@ class AttractivenessFeaturesApp(QWidget):
 
         layout.addLayout(top_layout)
         layout.addWidget(self.browser)
+        attach_latency_readout(layout)
 
         self.setLayout(layout)
         self.update_map()  # Initialize the map on startup
@@ -109,12 +137,29 @@ class AttractivenessFeaturesApp(QWidget):
         selected_feature = self.feature_dropdown.currentText()
         self.feature_level_dropdown.setVisible(selected_feature in ["Threat_Level", "Defense_Posture"])
 
+    def update_sensitivity_map(self):
+        """ The sensitivity view follows the feature / level selection. """
+        if self.views[self.view_dropdown.currentText()] == "sensitivity":
+            self.update_map()
+
+    @traced
     def update_map(self):
         """ Loads the map based on the selected parameters. """
         time_of_day = self.time_of_day_dropdown.currentText()
-        map_html_path = generate_attractiveness_map(time_of_day)
+        metric = self.views[self.view_dropdown.currentText()]
+        if metric is None:
+            map_html_path = generate_attractiveness_map(time_of_day)
+        elif metric == "sensitivity":
+            # Where would setting the selected feature to the selected level change attractiveness most
+            map_html_path = generate_sensitivity_map(time_of_day, self.feature_dropdown.currentText(),
+                                                     self.feature_level_dropdown.currentText(), model=self.model)
+        elif metric == "uncertainty":
+            map_html_path = generate_uncertainty_map(time_of_day, model=self.model)
+        else:
+            map_html_path = generate_temporal_map("Attractiveness", metric, time_of_day, 10)
         if map_html_path:
-            self.browser.setHtml(open(map_html_path).read())
+            with span("load"):
+                self.browser.load(QUrl(map_url(map_html_path)))
 
     # def simulate_change(self):
     #     """ Modifies the selected feature's value for the selected station and updates the temp dataset with GCN-LSTM predictions. """
@@ -186,101 +231,39 @@ class AttractivenessFeaturesApp(QWidget):
     #     # ✅ 8. Refresh the Map with the New Data
     #     self.update_map()
 
+    @traced
     def simulate_change(self):
         """ Modifies the selected feature's value for the selected station, runs the GCN-LSTM model,
             and updates 'Attractiveness' in temp files for all 9 time windows. """
-
-        time_windows = [
-            "VERY_EARLY_MORNING", "EARLY_AM", "AM_PEAK", "MIDDAY_BASE",
-            "MIDDAY_SCHOOL", "PM_PEAK", "EVENING", "LATE_EVENING", "NIGHT"
-        ]
-
         time_of_day = self.time_of_day_dropdown.currentText()
         station_name = self.station_dropdown.currentText()
         feature = self.feature_dropdown.currentText()
         new_value = self.feature_level_dropdown.currentText()
 
-        csv_file = f"Feature_Label_{time_of_day}.csv"
-        file_path = os.path.join(self.temp_folder, csv_file)
-
-        if not os.path.exists(file_path):
-            print(f"File not found: {file_path}")
+        predictions = simulate_change(self.temp_folder, time_of_day, station_name, feature, new_value, self.model)
+        if predictions is None:
             return
 
-        # 🔹 Step 1: Load the CSV file from temp_playground
-        df = pd.read_csv(file_path)
-
-        # 🔹 Step 2: Apply the manual change
-        df.loc[df["Station_Name"] == station_name, feature] = new_value
-
-        # 🔹 Step 3: Save the updated dataframe back to temp_playground
-        df.to_csv(file_path, index=False)
-
-        # 🔹 Step 4: Reload the updated dataset before running the model
-        df = pd.read_csv(file_path)
-
-        # ✅ Load Edge Index
-        edge_index = np.genfromtxt(os.path.join(self.gcn_folder, "edge_index.csv"), delimiter=',', dtype=int)
-        # Ensure edge_index is a 2-row tensor (2, num_edges)
-        if edge_index.shape[0] != 2:
-            edge_index = edge_index.T  # Transpose if needed
-
-        # Convert to PyTorch tensor (2, num_edges)
-        edge_index = torch.tensor(edge_index, dtype=torch.long)
-
-        # ✅ Load Original Features
-        features = []
-        for time in time_windows:
-            csv_path = os.path.join(self.temp_folder, f"Feature_Label_{time}.csv")
-            df = pd.read_csv(csv_path)
-
-            # Apply the change for the selected station and feature
-            df.loc[df["Station_Name"] == station_name, feature] = new_value
-
-            # Convert Threat_Level and Defense_Posture to One-Hot Encoding dynamically
-            categorical_features = ["Threat_Level", "Defense_Posture"]
-            df = pd.get_dummies(df, columns=categorical_features)
-
-            # Final selected features for prediction
-            all_feature_columns = [
-                                      "D_nearest_police", "D_nearest_fire", "D_nearest_hospital",
-                                      "Population_Density", "Average_Ridership", "Crime_Index"
-                                  ] + [col for col in df.columns if
-                                       "Threat_Level_" in col or "Defense_Posture_" in col]  # Dynamically get one-hot columns
-
-            # Ensure correct column order and convert to numeric
-            df = df[["ID"] + all_feature_columns].copy()
-            df[all_feature_columns] = df[all_feature_columns].astype(float)
-            df.sort_values(by="ID", inplace=True)  # Ensure consistent order
-            features.append(torch.tensor(df[all_feature_columns].values, dtype=torch.float32))
-
-        # ✅ Stack tensors to shape (9, num_nodes, num_features)
-        features_tensor = torch.stack(features)  # Shape: (9, num_nodes, num_features)
-
-        # ✅ Load Pretrained GCN-LSTM Model
-        model_path = os.path.join(self.gcn_folder, "GCN_LSTM_weights.pth")
-        model = GCN_LSTM(input_dim=features_tensor.shape[2], hidden_dim=64, output_dim=1, time_steps=9, gcn_dropout=0.5,
-                         lstm_dropout=0)
-        model.load_state_dict(torch.load(model_path, map_location=torch.device("cpu")))
-        model.eval()
-
-        # ✅ Run Predictions
-        with torch.no_grad():
-            attractiveness_predictions = model(features_tensor, edge_index)  # Shape: (9, num_nodes, 1)
-
-        # ✅ Update Attractiveness in all CSV files
-        for i, time in enumerate(time_windows):
-            csv_path = os.path.join(self.temp_folder, f"Feature_Label_{time}.csv")
-            df = pd.read_csv(csv_path)
-            # Extract predictions for the correct time step
-            df["Attractiveness"] = attractiveness_predictions[:, i, 0].numpy()  # Extracts predictions for time step i
-            df.to_csv(csv_path, index=False)  # Save updated CSV
-
         print("Updated Attractiveness values for all time slots.")
 
         # ✅ Refresh UI
         self.update_map()
 
+    @traced
+    def switch_model(self, version):
+        """
+        Re-predicts the playground (edits included) with another model version. The version is only used by
+        this page; the active version shared with the service changes through the registry CLI or /models/activate.
+        """
+        try:
+            model = get_registry().load(version)
+        except (KeyError, ValueError) as error:
+            print(f"Could not load model {version}: {error}")
+            return
+        self.model = model
+        if repredict(self.temp_folder, self.model) is not None:
+            self.update_map()
+
     def reset_temp_playground(self):
         """ Restores the temp playground to its original state. """
         self.create_temp_playground()  # Re-copy the original files
@@ -321,7 +304,7 @@ class OverlayMapWindow(QWidget):
         self.top_k_selector.setValue(len(nodes_df))  # Default: Show all nodes
 
         self.generate_button = QPushButton("Generate Overlay Maps")
-        self.generate_button.clicked.connect(self.generate_overlay_maps)
+        self.generate_button.clicked.connect(lambda *_: self.generate_overlay_maps())
 
         # Dropdown Layout
         dropdown_layout = QHBoxLayout()
@@ -345,8 +328,10 @@ class OverlayMapWindow(QWidget):
             grid_layout.addWidget(view, i // 2, i % 2)
 
         layout.addLayout(grid_layout)
+        attach_latency_readout(layout)
         self.setLayout(layout)
 
+    @traced
     def generate_overlay_maps(self):
         """ Generates overlay maps and loads them into the window. """
         features = [dropdown.currentText() for dropdown in self.feature_dropdowns]
@@ -364,8 +349,9 @@ class OverlayMapWindow(QWidget):
         # Update the UI with the new maps
         all_maps = map_paths + [common_map_path]  # Combine individual maps with the common overlay
 
-        for i, view in enumerate(self.map_views):
-            view.setHtml(open(all_maps[i]).read())  # Load the generated HTML maps
+        with span("load"):
+            for i, view in enumerate(self.map_views):
+                view.load(QUrl(map_url(all_maps[i])))  # Load the generated HTML maps
 
 
 
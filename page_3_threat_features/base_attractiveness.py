@@ -0,0 +1,204 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from page_3_threat_features.feature_store import time_windows
+
+
+base_score_folder = "page_3_threat_features/Base_Attractiveness_Scores"
+
+# Inputs of the base score, in the column order of the Base_Attractiveness_Score tables
+score_inputs = ["Passenger_Volume", "Nearest_Police_Distance", "Nearest_Fire_Distance", "Nearest_Hospital_Distance",
+                "Betweenness Centrality", "Crime_Index"]
+
+# Weights the shipped scores were computed with (see Documentation_Base_Attractiveness_Score.pdf)
+default_weights = {"Passenger_Volume": 0.158, "Nearest_Police_Distance": 0.408, "Nearest_Fire_Distance": 0.242,
+                   "Nearest_Hospital_Distance": 0.028, "Betweenness Centrality": 0.061, "Crime_Index": 0.103}
+
+sweep_chunk = 1024  # Weight vectors scored at once in a sweep
+
+
+def base_score_path(time_of_day, folder=base_score_folder):
+    return os.path.join(folder, f"Base_Attractiveness_Score_{time_of_day}.csv")
+
+
+def score_column(time_of_day):
+    return f"Base_Attractiveness_Score_{time_of_day}"
+
+
+def weight_vector(weights=None):
+    """ Weights as an array in `score_inputs` order; a dict may leave out inputs (weight 0). """
+    if weights is None:
+        weights = default_weights
+    if isinstance(weights, dict):
+        unknown = set(weights) - set(score_inputs)
+        if unknown:
+            raise ValueError(f"Unknown score inputs {sorted(unknown)}, expected {score_inputs}")
+        return np.array([weights.get(name, 0.0) for name in score_inputs], dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    if weights.shape[-1] != len(score_inputs):
+        raise ValueError(f"Expected {len(score_inputs)} weights ({score_inputs}), got {weights.shape[-1]}")
+    return weights
+
+
+def random_weights(n, concentration=50.0, seed=0, around=None):
+    """
+    n weight vectors (summing to 1) drawn from a Dirichlet centred on `around` (default weights);
+    a lower concentration spreads them further.
+    """
+    center = weight_vector(around)
+    center = center / center.sum()
+    return np.random.default_rng(seed).dirichlet(np.maximum(center * concentration, 1e-3), size=n)
+
+
+class BaseAttractivenessScores:
+    """
+    The score inputs of every window as one (windows x stations x inputs) array, so the base score of
+    all stations and windows is a single matrix product with the weight vector, and a sweep over many
+    weight vectors a single einsum per chunk. The inputs are re-read when a table changes.
+    """
+
+    def __init__(self, folder=base_score_folder):
+        self.folder = folder
+        self._signature = None
+        self.windows = []
+        self.stations = None
+        self.inputs = None
+        self.shipped = None
+
+    def signature(self):
+        paths = [base_score_path(time_of_day, self.folder) for time_of_day in time_windows]
+        return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+                     for path in paths)
+
+    def load(self):
+        signature = self.signature()
+        if signature == self._signature:
+            return self
+        with span("load_base_scores", folder=self.folder):
+            tables = {}
+            for time_of_day in time_windows:
+                path = base_score_path(time_of_day, self.folder)
+                if not os.path.exists(path):
+                    print(f"File not found: {path}")
+                    continue
+                tables[time_of_day] = pd.read_csv(path)
+            self.windows = list(tables)
+            first = tables[self.windows[0]]
+            self.stations = first[["Station_ID", "Station_Name", "Lat", "Lon"]].reset_index(drop=True)
+            # Align every window on the station order of the first one
+            rows = {time_of_day: pd.Index(df["Station_ID"]).get_indexer(self.stations["Station_ID"])
+                    for time_of_day, df in tables.items()}
+            self.inputs = np.stack([tables[w][score_inputs].to_numpy(dtype=float)[rows[w]] for w in self.windows])
+            self.shipped = np.stack([tables[w][score_column(w)].to_numpy(dtype=float)[rows[w]] for w in self.windows])
+        self._signature = signature
+        return self
+
+    def scores(self, weights=None):
+        """ (windows x stations) base scores for one weight vector. """
+        self.load()
+        return self.inputs @ weight_vector(weights)
+
+    def score_table(self, weights=None):
+        """ One row per station with its base score in every window. """
+        scores = self.scores(weights)
+        table = self.stations.copy()
+        for column, time_of_day in enumerate(self.windows):
+            table[time_of_day] = scores[column]
+        return table
+
+    def contributions(self, time_of_day, weights=None):
+        """ Per-input contribution (weight x input) to every station's score in one window. """
+        self.load()
+        contributions = self.inputs[self.windows.index(time_of_day)] * weight_vector(weights)
+        return pd.concat([self.stations, pd.DataFrame(contributions, columns=score_inputs)], axis=1)
+
+    def max_error(self, weights=None):
+        """ Largest difference between recomputed and shipped scores (0 up to rounding for the default weights). """
+        return float(np.abs(self.scores(weights) - self.shipped).max())
+
+    def sweep(self, weight_matrix, chunk=sweep_chunk):
+        """ Yields (start, scores) with scores of shape (vectors x windows x stations), chunk by chunk. """
+        self.load()
+        weight_matrix = weight_vector(weight_matrix)
+        for start in range(0, len(weight_matrix), chunk):
+            yield start, np.einsum("wsi,vi->vws", self.inputs, weight_matrix[start:start + chunk])
+
+    def sweep_summary(self, weight_matrix, k=10, chunk=sweep_chunk):
+        """
+        Robustness of the station ranking over many weightings. Returns (windows x stations) arrays:
+        `top_k_share` (fraction of weight vectors that put the station in the top K), `mean_rank`
+        (0 = most attractive), and the min / max score the station reaches.
+        """
+        n_vectors = len(weight_matrix)
+        shape = (len(self.load().windows), len(self.stations))
+        in_top_k = np.zeros(shape)
+        rank_sum = np.zeros(shape)
+        low = np.full(shape, np.inf)
+        high = np.full(shape, -np.inf)
+        with span("base_score_sweep", vectors=n_vectors):
+            for _, scores in self.sweep(weight_matrix, chunk):
+                order = np.argsort(-scores, axis=2)
+                ranks = np.empty_like(order)
+                np.put_along_axis(ranks, order, np.arange(shape[1]), axis=2)
+                in_top_k += (ranks < k).sum(axis=0)
+                rank_sum += ranks.sum(axis=0)
+                low = np.minimum(low, scores.min(axis=0))
+                high = np.maximum(high, scores.max(axis=0))
+        return {"top_k_share": in_top_k / n_vectors, "mean_rank": rank_sum / n_vectors, "min": low, "max": high}
+
+    def write(self, weights=None, folder=None):
+        """ Rewrites the score column of every table with the given weights (into `folder`, default in place). """
+        scores = self.scores(weights)
+        folder = folder or self.folder
+        os.makedirs(folder, exist_ok=True)
+        for column, time_of_day in enumerate(self.windows):
+            df = pd.read_csv(base_score_path(time_of_day, self.folder))
+            df[score_column(time_of_day)] = df["Station_ID"].map(
+                dict(zip(self.stations["Station_ID"], scores[column])))
+            df.to_csv(base_score_path(time_of_day, folder), index=False)
+        return folder
+
+
+_scores = {}
+
+
+def get_base_scores(folder=base_score_folder):
+    """ Shared score engine for a Base_Attractiveness_Scores folder. """
+    if folder not in _scores:
+        _scores[folder] = BaseAttractivenessScores(folder)
+    return _scores[folder]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute and explore the base attractiveness scores.")
+    parser.add_argument("--folder", default=base_score_folder)
+    parser.add_argument("--weights", nargs=len(score_inputs), type=float, metavar="W",
+                        help=f"Weights in the order {score_inputs} (default: the documented weights)")
+    parser.add_argument("--sweep", type=int, default=0, help="Number of random weightings around the weights")
+    parser.add_argument("--concentration", type=float, default=50.0, help="Dirichlet concentration of the sweep")
+    parser.add_argument("--time-of-day", default="PM_PEAK", choices=time_windows)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--write", metavar="FOLDER", help="Write the recomputed tables into FOLDER")
+    args = parser.parse_args()
+
+    engine = get_base_scores(args.folder)
+    weights = args.weights
+    print(f"Max difference to the shipped scores: {engine.max_error(weights):.2e}")
+    table = engine.score_table(weights)
+    print(f"\nTop {args.k} in {args.time_of_day}:")
+    print(table.nlargest(args.k, args.time_of_day)[["Station_Name", args.time_of_day]].to_string(index=False))
+
+    if args.sweep:
+        summary = engine.sweep_summary(random_weights(args.sweep, args.concentration, around=weights), args.k)
+        column = engine.windows.index(args.time_of_day)
+        result = engine.stations[["Station_Name"]].assign(top_k_share=summary["top_k_share"][column],
+                                                         mean_rank=summary["mean_rank"][column],
+                                                         min=summary["min"][column], max=summary["max"][column])
+        print(f"\nTop-{args.k} share over {args.sweep} weightings in {args.time_of_day}:")
+        print(result.nlargest(args.k, "top_k_share").to_string(index=False))
+    if args.write:
+        print(f"\nWrote {engine.write(weights, args.write)}")
@@ -0,0 +1,220 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from page_3_threat_features.feature_store import time_windows, feature_folder, load_all_windows, update_feature_column
+
+
+crime_folder = "page_3_threat_features/Crime_Data"
+crime_file_template = "Boston_Cambridge_Brookline_crime_filtered_{}.csv"
+nodes_path = os.path.join("MBTA_graph_data", "Node_CSV.csv")
+
+earth_radius_m = 6371008.8
+
+# The shipped Crime_Index is a Gaussian kernel density of the crimes of a window at each station, scaled by
+# the global maximum. Its bandwidth is not recorded; 600 m gives a correlation of 0.98-0.99 per window with
+# the shipped column (a count inside Buffer_Size only reaches 0.43-0.57, a count per buffer area 0.55-0.79).
+kernel_bandwidth_m = 600.0
+kernel_cutoff = 3  # Crimes further than this many bandwidths away are ignored (weight < 0.012)
+index_methods = ("kernel", "buffer")
+
+# Stations per vectorized batch; bounds the size of the candidate (station, crime) pair arrays
+station_batch_size = 2048
+
+
+def project_to_meters(lat, lon, origin_lat, origin_lon):
+    """ Local equirectangular projection around the origin (sub-meter error at city scale). """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    x = (lon - np.radians(origin_lon)) * np.cos(np.radians(origin_lat)) * earth_radius_m
+    y = (lat - np.radians(origin_lat)) * earth_radius_m
+    return x, y
+
+
+class CrimeGrid:
+    """
+    Crime points bucketed into square grid cells, sorted by cell key.
+    With cells at least as large as the biggest query radius, every point within a station's buffer
+    lies in the 3x3 block of cells around the station, so a radius count only touches those cells.
+    """
+
+    def __init__(self, x, y, window_codes, cell_size):
+        self.cell_size = float(cell_size)
+        keys = self.cell_keys(np.floor(x / self.cell_size), np.floor(y / self.cell_size))
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.x = np.asarray(x, dtype=float)[order]
+        self.y = np.asarray(y, dtype=float)[order]
+        self.window_codes = np.asarray(window_codes, dtype=np.int64)[order]
+
+    @staticmethod
+    def cell_keys(cx, cy):
+        offset = 1 << 30
+        return (cx.astype(np.int64) + offset) * (1 << 31) + (cy.astype(np.int64) + offset)
+
+    def count_within(self, sx, sy, radius, n_windows, bandwidth=None):
+        """
+        Returns an (n_stations, n_windows) array of crime counts within each station's radius.
+        With a bandwidth (meters) every crime is weighted by a Gaussian kernel of its distance instead.
+        """
+        sx, sy = np.asarray(sx, dtype=float), np.asarray(sy, dtype=float)
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), sx.shape)
+        if radius.max() > self.cell_size:
+            raise ValueError("Grid cell size must be at least the largest buffer radius")
+
+        counts = np.zeros((len(sx), n_windows), dtype=np.int64 if bandwidth is None else float)
+        for start in range(0, len(sx), station_batch_size):
+            batch = slice(start, start + station_batch_size)
+            counts[batch] = self._count_batch(sx[batch], sy[batch], radius[batch], n_windows, bandwidth)
+        return counts
+
+    def _count_batch(self, sx, sy, radius, n_windows, bandwidth=None):
+        n = len(sx)
+        cx, cy = np.floor(sx / self.cell_size), np.floor(sy / self.cell_size)
+        dx, dy = np.meshgrid([-1, 0, 1], [-1, 0, 1])
+        neighbour_keys = self.cell_keys((cx[:, None] + dx.ravel()), (cy[:, None] + dy.ravel()))
+        station_of_key = np.repeat(np.arange(n), 9)
+
+        starts = np.searchsorted(self.keys, neighbour_keys.ravel(), side="left")
+        ends = np.searchsorted(self.keys, neighbour_keys.ravel(), side="right")
+        lengths = ends - starts
+
+        # Expand every (station, candidate crime) pair without a Python loop
+        pair_station = np.repeat(station_of_key, lengths)
+        pair_offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pair_point = np.repeat(starts, lengths) + pair_offset
+
+        d2 = (self.x[pair_point] - sx[pair_station]) ** 2 + (self.y[pair_point] - sy[pair_station]) ** 2
+        inside = d2 <= radius[pair_station] ** 2
+        flat = pair_station[inside] * n_windows + self.window_codes[pair_point[inside]]
+        weights = None if bandwidth is None else np.exp(-d2[inside] / (2 * bandwidth ** 2))
+        return np.bincount(flat, weights=weights, minlength=n * n_windows).reshape(n, n_windows)
+
+
+def load_crime_points(folder=crime_folder, windows=time_windows):
+    """ Reads the per-window crime extracts; returns lat, lon and window code arrays plus the windows found. """
+    lats, lons, codes, found = [], [], [], []
+    for code, time_of_day in enumerate(windows):
+        crime_path = os.path.join(folder, crime_file_template.format(time_of_day))
+        if not os.path.exists(crime_path):
+            continue
+        crime_df = pd.read_csv(crime_path, usecols=["Lat", "Long"]).dropna()
+        lats.append(crime_df["Lat"].to_numpy())
+        lons.append(crime_df["Long"].to_numpy())
+        codes.append(np.full(len(crime_df), code, dtype=np.int64))
+        found.append(time_of_day)
+    if not lats:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64), found
+    return np.concatenate(lats), np.concatenate(lons), np.concatenate(codes), found
+
+
+def station_crime_counts(stations_df, crime_lat, crime_lon, window_codes, n_windows, radius=None):
+    """
+    Counts crimes inside each station's buffer for every time window in one vectorized pass.
+    The buffer defaults to the station's Buffer_Size (meters) from Node_CSV.
+    """
+    if radius is None:
+        radius = stations_df["Buffer_Size"].to_numpy(dtype=float)
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), (len(stations_df),))
+
+    origin_lat, origin_lon = stations_df["Lat"].mean(), stations_df["Lon"].mean()
+    sx, sy = project_to_meters(stations_df["Lat"], stations_df["Lon"], origin_lat, origin_lon)
+    px, py = project_to_meters(crime_lat, crime_lon, origin_lat, origin_lon)
+
+    grid = CrimeGrid(px, py, window_codes, cell_size=max(radius.max(), 1.0))
+    return grid.count_within(sx, sy, radius, n_windows)
+
+
+def station_crime_density(stations_df, crime_lat, crime_lon, window_codes, n_windows, bandwidth=kernel_bandwidth_m):
+    """ Gaussian kernel density (sum of kernel weights) of the crimes of every window at each station. """
+    origin_lat, origin_lon = stations_df["Lat"].mean(), stations_df["Lon"].mean()
+    sx, sy = project_to_meters(stations_df["Lat"], stations_df["Lon"], origin_lat, origin_lon)
+    px, py = project_to_meters(crime_lat, crime_lon, origin_lat, origin_lon)
+
+    cutoff = kernel_cutoff * bandwidth
+    grid = CrimeGrid(px, py, window_codes, cell_size=cutoff)
+    return grid.count_within(sx, sy, cutoff, n_windows, bandwidth=bandwidth)
+
+
+def buffer_areas_km2(stations_df, radius=None):
+    if radius is None:
+        radius = stations_df["Buffer_Size"].to_numpy(dtype=float)
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), (len(stations_df),))
+    return np.pi * (radius / 1000) ** 2
+
+
+def normalize_counts(counts):
+    """ Scales counts (or densities) by the global maximum so windows stay comparable with each other. """
+    peak = counts.max()
+    return counts / peak if peak > 0 else counts.astype(float)
+
+
+def compute_crime_index(stations_df=None, folder=crime_folder, radius=None, method="kernel",
+                        bandwidth=kernel_bandwidth_m):
+    """
+    Computes Crime_Index for every station and time window from the raw crime records.
+    method="kernel" follows the shipped definition (see kernel_bandwidth_m); method="buffer" uses the
+    crimes per km² inside each station's buffer (Buffer_Size, or a fixed radius).
+    Values are scaled by the maximum over the windows found, so they are not on the shipped scale when a
+    window is missing (the shipped maximum lies in MIDDAY_BASE, which has no extract).
+    Returns a DataFrame with an ID column and one column per window; windows without a crime extract are NaN.
+    """
+    if method not in index_methods:
+        raise ValueError(f"Unknown Crime_Index method {method}; expected one of {index_methods}")
+    if stations_df is None:
+        stations_df = pd.read_csv(nodes_path)
+    crime_lat, crime_lon, window_codes, found = load_crime_points(folder)
+
+    if method == "kernel":
+        values = station_crime_density(stations_df, crime_lat, crime_lon, window_codes, len(time_windows), bandwidth)
+    else:
+        counts = station_crime_counts(stations_df, crime_lat, crime_lon, window_codes, len(time_windows), radius)
+        values = counts / buffer_areas_km2(stations_df, radius)[:, None]
+    crime_index = normalize_counts(values)
+
+    frame = pd.DataFrame(crime_index, columns=time_windows)
+    frame[[w for w in time_windows if w not in found]] = np.nan
+    frame.insert(0, "ID", stations_df["ID"].to_numpy())
+    return frame
+
+
+def compare_with_features(crime_index_df, folder=feature_folder):
+    """ Correlation of the recomputed values with the Crime_Index in the Feature_Label tables, per window. """
+    tables = load_all_windows(folder)
+    recomputed = crime_index_df.set_index("ID")
+    correlations = {}
+    for time_of_day, table in tables.items():
+        if time_of_day not in recomputed or recomputed[time_of_day].isna().all():
+            continue
+        current = table.set_index("ID")["Crime_Index"]
+        correlations[time_of_day] = float(np.corrcoef(current, recomputed[time_of_day].reindex(current.index))[0, 1])
+    return correlations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute Crime_Index from raw crime records.")
+    parser.add_argument("--crime-folder", default=crime_folder)
+    parser.add_argument("--method", choices=index_methods, default="kernel",
+                        help="kernel: Gaussian kernel density (shipped definition); buffer: crimes per km² in the buffer")
+    parser.add_argument("--bandwidth", type=float, default=kernel_bandwidth_m, help="Kernel bandwidth in meters")
+    parser.add_argument("--radius", type=float, default=None, help="Fixed buffer radius in meters (default: Buffer_Size per station)")
+    parser.add_argument("--output", default=os.path.join("outputs", "crime_index.csv"))
+    parser.add_argument("--apply", action="store_true",
+                        help="Overwrite Crime_Index in the Feature_Label tables with the recomputed values")
+    args = parser.parse_args()
+
+    crime_index_df = compute_crime_index(folder=args.crime_folder, radius=args.radius, method=args.method,
+                                         bandwidth=args.bandwidth)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    crime_index_df.to_csv(args.output, index=False)
+    print(f"Crime_Index written to {args.output}")
+    for time_of_day, correlation in compare_with_features(crime_index_df).items():
+        print(f"  {time_of_day}: correlation with the current Crime_Index {correlation:.3f}")
+
+    if args.apply:
+        update_feature_column("Crime_Index", crime_index_df, feature_folder)
+        print(f"Overwrote Crime_Index in {feature_folder} (windows without a crime extract kept their values)")
+    else:
+        print("Feature_Label tables unchanged; pass --apply to overwrite Crime_Index")
@@ -0,0 +1,213 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from page_3_threat_features.crime_index import station_crime_density, normalize_counts, nodes_path
+from page_3_threat_features.feature_store import time_windows, feature_folder, update_feature_column
+
+
+# Running per-station, per-window crime densities, the keys of the records already ingested and the
+# newest timestamp seen
+state_path = "page_3_threat_features/Crime_Data/crime_counts.npz"
+
+default_chunksize = 100_000
+default_id_columns = ("INCIDENT_NUMBER", "OFFENSE_CODE")  # One incident has a row per offense
+
+# Start hour of each time window (hours past midnight); a window runs until the next one starts
+window_start_hours = [
+    (0.0, "NIGHT"),
+    (3.0, "VERY_EARLY_MORNING"),
+    (6.0, "EARLY_AM"),
+    (7.0, "AM_PEAK"),
+    (9.0, "MIDDAY_BASE"),
+    (13.5, "MIDDAY_SCHOOL"),
+    (16.0, "PM_PEAK"),
+    (18.5, "EVENING"),
+    (22.0, "LATE_EVENING"),
+]
+
+
+_clock_pattern = r"(?:^|\s|T)(\d{1,2}):(\d{2})(?::(\d{2}))?"
+
+
+def hours_to_window(hours):
+    """ Maps hours past midnight to window codes (positions in feature_store.time_windows). """
+    starts = np.array([start for start, _ in window_start_hours])
+    codes = np.array([time_windows.index(window) for _, window in window_start_hours])
+    return codes[np.searchsorted(starts, np.asarray(hours, dtype=float), side="right") - 1]
+
+
+def assign_time_window(timestamps):
+    """ Maps timestamps to window codes (positions in feature_store.time_windows). """
+    return hours_to_window((timestamps.dt.hour + timestamps.dt.minute / 60 + timestamps.dt.second / 3600).to_numpy())
+
+
+def clock_hours(values):
+    """ Hours past midnight of the HH:MM[:SS] part of each string, NaN where there is none. """
+    parts = values.astype(str).str.extract(_clock_pattern).astype(float)
+    hours = parts[0] + parts[1] / 60 + parts[2].fillna(0) / 3600
+    return hours.where((parts[0] < 24) & (parts[1] < 60)).to_numpy()
+
+
+def record_windows(dates, times=None):
+    """
+    Window code of every record, or -1 when it has no time of day. Date-only values ("2022", "2022-05-01")
+    parse as midnight, so the time comes from the date string only when it has an HH:MM part, else from
+    the time column (a clock time, or a window name as in the filtered extracts).
+    """
+    hours = clock_hours(dates)
+    if times is not None:
+        hours = np.where(np.isnan(hours), clock_hours(times), hours)
+    codes = np.full(len(hours), -1, dtype=np.int64)
+    known = ~np.isnan(hours)
+    codes[known] = hours_to_window(hours[known])
+    if times is not None:
+        named = times.astype(str).str.strip().map({window: code for code, window in enumerate(time_windows)})
+        use_name = ~known & named.notna().to_numpy()
+        codes[use_name] = named.to_numpy()[use_name].astype(np.int64)
+    return codes
+
+
+def record_keys(frame):
+    """ 64-bit key of every record, from its incident ID columns (if any), timestamp and coordinates. """
+    return pd.util.hash_pandas_object(frame.astype(str), index=False).to_numpy(dtype=np.uint64)
+
+
+def load_state(stations_df, path=state_path):
+    """
+    Returns (density, seen record keys, watermark) from a previous run, or an empty state if there is
+    none or the stations changed.
+    """
+    density = np.zeros((len(stations_df), len(time_windows)))
+    empty = (density, np.empty(0, dtype=np.uint64), None)
+    if not os.path.exists(path):
+        return empty
+
+    state = np.load(path, allow_pickle=False)
+    if "keys" not in state or "density" not in state:
+        print("Crime counters were written by an older version; rebuilding them from scratch.")
+        return empty
+    if not np.array_equal(state["ids"], stations_df["ID"].to_numpy()) or list(state["windows"]) != time_windows:
+        print("Station set or time windows changed since the last run; rebuilding counters from scratch.")
+        return empty
+    watermark = pd.Timestamp(str(state["watermark"])) if str(state["watermark"]) else None
+    return state["density"].astype(float), state["keys"].astype(np.uint64), watermark
+
+
+def save_state(stations_df, density, keys, watermark, path=state_path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, ids=stations_df["ID"].to_numpy(), windows=np.array(time_windows), density=density, keys=keys,
+             watermark=np.array("" if watermark is None else watermark.isoformat()))
+    os.replace(tmp_path, path)
+
+
+def ingest_crime_export(export_path, stations_df=None, chunksize=default_chunksize, state_file=state_path,
+                        rebuild=False, date_column="OCCURRED_ON_DATE", lat_column="Lat", lon_column="Long",
+                        id_columns=default_id_columns, time_column="TIME"):
+    """
+    Streams a raw crime export in chunks and adds every record not ingested before to the per-station
+    kernel density counters (the Crime_Index definition of crime_index). Records are recognized by their
+    ID columns, timestamp and coordinates, so late or backfilled records are still counted and re-reading a
+    cumulative export counts nothing twice. Records without a time of day (in the date or the time column)
+    cannot be put in a window and are dropped. Only one chunk is held in memory at a time.
+    Returns the updated (n_stations, n_windows) density array.
+    """
+    if stations_df is None:
+        stations_df = pd.read_csv(nodes_path)
+
+    if rebuild:
+        density, seen, watermark = np.zeros((len(stations_df), len(time_windows))), np.empty(0, dtype=np.uint64), None
+    else:
+        density, seen, watermark = load_state(stations_df, state_file)
+    newest = watermark
+    ingested = duplicates = untimed = 0
+
+    header = pd.read_csv(export_path, nrows=0, encoding_errors="replace").columns
+    id_columns = [column for column in id_columns if column in header]
+    if not id_columns:
+        print("No incident ID column in the export; records are identified by timestamp and coordinates.")
+    time_columns = [time_column] if time_column in header else []
+    reader = pd.read_csv(export_path, usecols=[date_column, lat_column, lon_column, *id_columns, *time_columns],
+                         chunksize=chunksize, encoding_errors="replace")
+    for chunk in reader:
+        # Timestamps are local wall-clock times; drop any UTC-offset suffix before parsing
+        local_times = chunk[date_column].astype(str).str.replace(r"(\d{2}:\d{2}(?::\d{2})?)[+-]\d{2}(?::?\d{2})?$",
+                                                                 r"\1", regex=True)
+        timestamps = pd.to_datetime(local_times, errors="coerce", format="mixed")
+        lat = pd.to_numeric(chunk[lat_column], errors="coerce")
+        lon = pd.to_numeric(chunk[lon_column], errors="coerce")
+
+        codes = record_windows(chunk[date_column], chunk[time_column] if time_columns else None)
+
+        # Drop unparseable rows, rows without a time of day and the placeholder coordinates of un-geocoded incidents
+        located = (timestamps.notna() & lat.notna() & lon.notna() & (lat.abs() > 1) & (lon.abs() > 1)).to_numpy()
+        valid = located & (codes >= 0)
+        untimed += int((located & (codes < 0)).sum())
+        if not valid.any():
+            continue
+
+        # Skip records seen in an earlier run or earlier in this export
+        keys, first = np.unique(record_keys(chunk.loc[valid, [*id_columns, date_column, lat_column, lon_column]]),
+                                return_index=True)
+        new = ~np.isin(keys, seen, assume_unique=True)
+        rows = np.flatnonzero(valid)[np.sort(first[new])]
+        duplicates += int(valid.sum()) - len(rows)
+        if len(rows) == 0:
+            continue
+        seen = np.union1d(seen, keys[new])
+
+        timestamps, lat, lon = timestamps.iloc[rows], lat.iloc[rows].to_numpy(), lon.iloc[rows].to_numpy()
+        density += station_crime_density(stations_df, lat, lon, codes[rows], len(time_windows))
+
+        chunk_newest = timestamps.max()
+        newest = chunk_newest if newest is None else max(newest, chunk_newest)
+        ingested += len(rows)
+
+    save_state(stations_df, density, seen, newest, state_file)
+    print(f"Ingested {ingested} new crime records, skipped {duplicates} already ingested and dropped {untimed} "
+          f"without a time of day (newest: {newest}).")
+    return density
+
+
+def crime_index_frame(stations_df, density):
+    frame = pd.DataFrame(normalize_counts(density), columns=time_windows)
+    frame.insert(0, "ID", stations_df["ID"].to_numpy())
+    return frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a raw crime export into the Crime_Index feature.")
+    parser.add_argument("export_path", help="Raw Boston/Cambridge/Brookline crime export (CSV)")
+    parser.add_argument("--chunksize", type=int, default=default_chunksize)
+    parser.add_argument("--state", default=state_path)
+    parser.add_argument("--feature-folder", default=feature_folder)
+    parser.add_argument("--output", default=os.path.join("outputs", "crime_index.csv"))
+    parser.add_argument("--apply", action="store_true",
+                        help="Overwrite Crime_Index in the Feature_Label tables with the ingested values")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore stored counters and recount the whole export")
+    parser.add_argument("--date-column", default="OCCURRED_ON_DATE")
+    parser.add_argument("--lat-column", default="Lat")
+    parser.add_argument("--lon-column", default="Long")
+    parser.add_argument("--time-column", default="TIME",
+                        help="Time of day (HH:MM or a window name) for records whose date has none, if the export has it")
+    parser.add_argument("--id-columns", nargs="*", default=list(default_id_columns),
+                        help="Columns identifying a record (those missing from the export are ignored)")
+    args = parser.parse_args()
+
+    stations = pd.read_csv(nodes_path)
+    crime_density = ingest_crime_export(args.export_path, stations, args.chunksize, args.state, args.rebuild,
+                                        args.date_column, args.lat_column, args.lon_column, args.id_columns,
+                                        args.time_column)
+    crime_index_df = crime_index_frame(stations, crime_density)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    crime_index_df.to_csv(args.output, index=False)
+    print(f"Crime_Index written to {args.output}")
+
+    if args.apply:
+        update_feature_column("Crime_Index", crime_index_df, args.feature_folder)
+        print(f"Overwrote Crime_Index in {args.feature_folder}")
+    else:
+        print("Feature_Label tables unchanged; pass --apply to overwrite Crime_Index")
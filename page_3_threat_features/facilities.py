@@ -0,0 +1,290 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from instrumentation import span
+
+
+layer_folder = "page_3_threat_features/Layer_Information"
+
+# Facility layers: CSV file and the column used as the facility name
+facility_layers = {
+    "police": ("Boston_police.csv", "Station"),
+    "fire": ("Boston_fire.csv", "GEOADDRESS"),
+    "hospital": ("Boston_hospital.csv", "Name"),
+}
+
+# Weights of the nearest police / fire distances in the D_police_fire composite
+police_fire_weights = (0.706982782, 0.293017218)
+
+earth_radius_m = 6371008.8
+
+
+def to_unit_xyz(lat, lon):
+    """ Projects lat/lon (degrees) onto the unit sphere so Euclidean KD-tree queries follow the haversine metric. """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_meters(chord):
+    """ Converts unit-sphere chord lengths into great-circle distances in meters. """
+    return 2 * earth_radius_m * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """ Vectorized great-circle distance in meters (inputs broadcast against each other). """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * earth_radius_m * np.arcsin(np.sqrt(a))
+
+
+def facility_layer_path(layer, folder=layer_folder):
+    return os.path.join(folder, facility_layers[layer][0])
+
+
+def load_facility_layer(layer, folder=layer_folder):
+    """
+    Reads one facility layer and returns a frame with Name, Latitude and Longitude.
+    Rows without valid coordinates (missing, non-numeric, out of range or 0/0) are dropped.
+    """
+    file_name, name_column = facility_layers[layer]
+    file_path = os.path.join(folder, file_name)
+    with span("read_csv", path=file_path):
+        layer_df = pd.read_csv(file_path)
+    lat = pd.to_numeric(layer_df["Latitude"], errors="coerce")
+    lon = pd.to_numeric(layer_df["Longitude"], errors="coerce")
+    valid = lat.between(-90, 90) & lon.between(-180, 180) & ~((lat == 0) & (lon == 0))
+    if not valid.all():
+        print(f"Dropped {(~valid).sum()} rows with invalid coordinates from {file_path}")
+    return pd.DataFrame({
+        "Name": layer_df.loc[valid, name_column].astype(str).str.strip().values,
+        "Latitude": lat[valid].to_numpy(dtype=float),
+        "Longitude": lon[valid].to_numpy(dtype=float),
+    })
+
+
+class FacilityIndex:
+    """
+    Haversine nearest-neighbour index over one facility layer.
+    Coordinates live on the unit sphere inside a cKDTree, so chord order equals great-circle order.
+    The tree is rebuilt lazily after facilities are added or moved.
+    """
+
+    def __init__(self, lat, lon, names):
+        self.lat = np.asarray(lat, dtype=float).copy()
+        self.lon = np.asarray(lon, dtype=float).copy()
+        self.names = np.asarray(names, dtype=object).copy()
+        self._tree = None
+
+    @classmethod
+    def from_layer(cls, layer, folder=layer_folder):
+        layer_df = load_facility_layer(layer, folder)
+        return cls(layer_df["Latitude"], layer_df["Longitude"], layer_df["Name"])
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = cKDTree(to_unit_xyz(self.lat, self.lon))
+        return self._tree
+
+    def query(self, lat, lon, k=1):
+        """
+        k-nearest facilities for every query point in one call.
+        Returns (distances in meters, facility indices, facility names), each shaped (n_points, k).
+        An empty layer (or k=0) gives (n_points, 0) arrays.
+        """
+        k = min(k, len(self))
+        if k < 1:
+            n_points = len(np.atleast_1d(lat))
+            return np.empty((n_points, 0)), np.empty((n_points, 0), dtype=int), np.empty((n_points, 0), dtype=object)
+        chord, idx = self.tree.query(to_unit_xyz(lat, lon), k=k)
+        chord, idx = chord.reshape(-1, k), idx.reshape(-1, k)
+        return chord_to_meters(chord), idx, self.names[idx]
+
+    def within(self, lat, lon, radius_m):
+        """ Indices of the facilities within radius_m meters of each query point (one array per point). """
+        chord = 2 * np.sin(min(radius_m / (2 * earth_radius_m), np.pi / 2))
+        points = to_unit_xyz(np.atleast_1d(lat), np.atleast_1d(lon))
+        return [np.asarray(found, dtype=int) for found in self.tree.query_ball_point(points, chord)]
+
+    def add_facility(self, lat, lon, name):
+        """ Appends a facility and returns its index. """
+        self.lat = np.append(self.lat, float(lat))
+        self.lon = np.append(self.lon, float(lon))
+        self.names = np.append(self.names, np.array([name], dtype=object))
+        self._tree = None
+        return len(self) - 1
+
+    def move_facility(self, facility, lat, lon):
+        """ Moves a facility (given by index or name) and returns its index. """
+        idx = self.index_of(facility)
+        self.lat[idx], self.lon[idx] = float(lat), float(lon)
+        self._tree = None
+        return idx
+
+    def index_of(self, facility):
+        if isinstance(facility, (int, np.integer)):
+            return int(facility)
+        matches = np.flatnonzero(self.names == facility)
+        if len(matches) == 0:
+            raise KeyError(f"Unknown facility: {facility}")
+        return int(matches[0])
+
+
+class FacilityLayer:
+    """ One loaded facility layer: validated coordinates, its spatial index and the serialized map payload. """
+
+    def __init__(self, layer, folder=layer_folder):
+        self.layer = layer
+        self.index = FacilityIndex.from_layer(layer, folder)
+        self.coordinates = np.column_stack([self.index.lat, self.index.lon])
+        # [[lat, lon], ...] rounded to ~1 m, ready to embed in a map as is
+        self.coordinates_json = json.dumps(np.round(self.coordinates, 5).tolist())
+
+    def __len__(self):
+        return len(self.index)
+
+
+class FacilityRegistry:
+    """
+    Loads every facility layer of a Layer_Information folder once and keeps it in memory.
+    A layer is reloaded when its CSV changes (modification time or size), so edits are picked up.
+    """
+
+    def __init__(self, folder=layer_folder):
+        self.folder = folder
+        self._layers = {}
+
+    def _signature(self, layer):
+        path = facility_layer_path(layer, self.folder)
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, layer):
+        """ The FacilityLayer for "police", "fire" or "hospital", or None if its file is missing. """
+        signature = self._signature(layer)
+        if signature is None:
+            print(f"File not found: {facility_layer_path(layer, self.folder)}")
+            self._layers.pop(layer, None)
+            return None
+        cached = self._layers.get(layer)
+        if cached is None or cached[0] != signature:
+            with span("load_facility_layer", layer=layer):
+                cached = self._layers[layer] = (signature, FacilityLayer(layer, self.folder))
+        return cached[1]
+
+    def nearest(self, layer, lat, lon, k=1):
+        """ k-nearest facilities of a layer: (distances in meters, indices, names), each (n_points, k). """
+        return self.get(layer).index.query(lat, lon, k=k)
+
+    def within(self, layer, lat, lon, radius_m):
+        """ Names of the facilities of a layer within radius_m meters of each query point. """
+        facility_layer = self.get(layer)
+        return [facility_layer.index.names[found] for found in facility_layer.index.within(lat, lon, radius_m)]
+
+    def clear(self):
+        self._layers.clear()
+
+
+_registries = {}
+
+
+def get_registry(folder=layer_folder):
+    """ Shared registry for a Layer_Information folder. """
+    if folder not in _registries:
+        _registries[folder] = FacilityRegistry(folder)
+    return _registries[folder]
+
+
+class StationFacilityDistances:
+    """
+    Nearest-facility distances and names for every station, kept up to date under facility edits.
+    Adding or moving a facility only recomputes the stations whose nearest facility can change.
+    """
+
+    def __init__(self, stations_df, layers=None, folder=layer_folder):
+        self.stations = stations_df[["ID", "Lat", "Lon"]].reset_index(drop=True)
+        self.lat = self.stations["Lat"].to_numpy(dtype=float)
+        self.lon = self.stations["Lon"].to_numpy(dtype=float)
+        self.indexes = {}
+        self.nearest_dist = {}
+        self.nearest_idx = {}
+
+        for layer in (layers or facility_layers.keys()):
+            index = FacilityIndex.from_layer(layer, folder)
+            dist, idx, _ = index.query(self.lat, self.lon, k=1)
+            self.indexes[layer] = index
+            self.nearest_dist[layer] = dist[:, 0]
+            self.nearest_idx[layer] = idx[:, 0]
+
+    def add_facility(self, layer, lat, lon, name):
+        """ Adds a facility (e.g. a new police post) and returns the positions of the stations it affected. """
+        facility = self.indexes[layer].add_facility(lat, lon, name)
+        d_new = haversine_m(self.lat, self.lon, float(lat), float(lon))
+        affected = np.flatnonzero(d_new < self.nearest_dist[layer])
+        self.nearest_dist[layer][affected] = d_new[affected]
+        self.nearest_idx[layer][affected] = facility
+        return affected
+
+    def move_facility(self, layer, facility, lat, lon):
+        """ Moves an existing facility and returns the positions of the stations it affected. """
+        index = self.indexes[layer]
+        facility = index.move_facility(facility, lat, lon)
+        d_new = haversine_m(self.lat, self.lon, float(lat), float(lon))
+
+        # Stations served by the moved facility may now be closer to another one
+        served = self.nearest_idx[layer] == facility
+        if served.any():
+            dist, idx, _ = index.query(self.lat[served], self.lon[served], k=1)
+            self.nearest_dist[layer][served] = dist[:, 0]
+            self.nearest_idx[layer][served] = idx[:, 0]
+
+        closer = d_new < self.nearest_dist[layer]
+        self.nearest_dist[layer][closer] = d_new[closer]
+        self.nearest_idx[layer][closer] = facility
+        return np.flatnonzero(served | closer)
+
+    def to_frame(self, normalize=True):
+        """
+        Returns the Feature_Label distance columns (D_nearest_*, D_police_fire and *_name) keyed by ID.
+        With normalize=True distances are min-max scaled across stations like the shipped features.
+        These are not a drop-in replacement for the shipped columns: the current Layer_Information files give
+        different nearest facilities for part of the stations, so compare against Feature_Label before writing.
+        """
+        frame = self.stations[["ID"]].copy()
+        for layer, index in self.indexes.items():
+            dist = self.nearest_dist[layer]
+            if normalize:
+                span = dist.max() - dist.min()
+                dist = (dist - dist.min()) / span if span > 0 else np.zeros_like(dist)
+            frame[f"D_nearest_{layer}"] = dist
+            frame[f"D_nearest_{layer}_name"] = index.names[self.nearest_idx[layer]]
+
+        if "D_nearest_police" in frame and "D_nearest_fire" in frame:
+            w_police, w_fire = police_fire_weights
+            frame["D_police_fire"] = w_police * frame["D_nearest_police"] + w_fire * frame["D_nearest_fire"]
+        return frame
+
+
+def compute_facility_features(stations_df, normalize=True, folder=layer_folder):
+    """ Recomputes the nearest-facility feature columns for all stations from Layer_Information. """
+    return StationFacilityDistances(stations_df, folder=folder).to_frame(normalize=normalize)
+
+
+if __name__ == "__main__":
+    nodes_df = pd.read_csv(os.path.join("MBTA_graph_data", "Node_CSV.csv"))
+    output_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join("outputs", "facility_features.csv")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    compute_facility_features(nodes_df).to_csv(output_path, index=False)
+    print(f"Facility features written to {output_path}")
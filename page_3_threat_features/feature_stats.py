@@ -0,0 +1,174 @@
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from page_3_threat_features.feature_store import time_windows, feature_folder, feature_label_path, load_window
+
+
+# Per-folder statistics are persisted here, keyed by the source files' fingerprints
+stats_cache_folder = ".cache/feature_stats"
+
+quantile_levels = [0.05, 0.25, 0.5, 0.75, 0.95]
+sketch_size = 101  # Percentiles kept per window and feature, merged for the global quantiles
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def column_statistics(values):
+    """ Summary of one column of one window, plus the percentile sketch used to merge windows. """
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    quantiles = np.quantile(values, quantile_levels)
+    return {"count": int(len(values)), "min": float(values.min()), "max": float(values.max()),
+            "mean": float(values.mean()), "median": float(np.median(values)),
+            "quantiles": dict(zip(map(str, quantile_levels), quantiles.tolist())),
+            "sketch": np.quantile(values, np.linspace(0, 1, sketch_size)).tolist()}
+
+
+def window_statistics(df):
+    """ Statistics of every numeric feature of one Feature_Label table, from a single read of the file. """
+    return {column: column_statistics(df[column].to_numpy(dtype=float)) for column in df.columns
+            if column != "ID" and pd.api.types.is_numeric_dtype(df[column])}
+
+
+def merge_statistics(parts):
+    """
+    Combines per-window statistics of one feature: count, min, max and mean are exact, the median and
+    quantiles come from the count-weighted mixture of the windows' percentile sketches.
+    """
+    parts = [part for part in parts if part]
+    if not parts:
+        return None
+    counts = np.array([part["count"] for part in parts], dtype=float)
+    sketches = [np.array(part["sketch"]) for part in parts]
+    grid = np.unique(np.concatenate(sketches))
+    levels = np.linspace(0, 1, sketch_size)
+    cdf = sum(count * np.interp(grid, sketch, levels, left=0, right=1) for count, sketch in zip(counts, sketches))
+    cdf /= counts.sum()
+    quantile = lambda q: float(np.interp(q, cdf, grid))
+    return {"count": int(counts.sum()), "min": min(part["min"] for part in parts),
+            "max": max(part["max"] for part in parts),
+            "mean": float(np.dot(counts, [part["mean"] for part in parts]) / counts.sum()),
+            "median": quantile(0.5), "quantiles": {str(q): quantile(q) for q in quantile_levels}}
+
+
+class FeatureStats:
+    """
+    Min / max / mean / median / quantiles of every numeric feature, per time window and over all windows.
+    Each Feature_Label file is read once when its fingerprint (mtime and size, then content hash)
+    changes; the results are persisted in `stats_cache_folder`, so unchanged files are never re-read.
+    """
+
+    def __init__(self, folder=feature_folder, cache_folder=stats_cache_folder):
+        self.folder = folder
+        key = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()[:12]
+        self.cache_path = os.path.join(cache_folder, f"{key}.json")
+        self.entries = self.load()
+        self._global = None
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as error:
+            print(f"Ignoring unreadable statistics cache {self.cache_path}: {error}")
+            return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(self.cache_path + ".tmp", "w") as f:
+            json.dump(self.entries, f)
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+
+    def update(self, time_of_day):
+        """ Recomputes a window's statistics if its file changed. Returns True if the entry changed. """
+        path = feature_label_path(time_of_day, self.folder)
+        if not os.path.exists(path):
+            if time_of_day not in self.entries:
+                return False
+            del self.entries[time_of_day]
+            self._global = None
+            return True
+        fingerprint = file_fingerprint(path)
+        entry = self.entries.get(time_of_day)
+        if entry and entry["fingerprint"] == fingerprint:
+            return False
+        digest = content_hash(path)
+        if entry and entry["hash"] == digest:
+            entry["fingerprint"] = fingerprint  # Touched or copied, same content
+            return True
+        with span("feature_stats", time_of_day=time_of_day):
+            self.entries[time_of_day] = {"fingerprint": fingerprint, "hash": digest,
+                                         "features": window_statistics(load_window(time_of_day, self.folder))}
+        self._global = None
+        return True
+
+    def refresh(self, windows=time_windows):
+        changed = [time_of_day for time_of_day in windows if self.update(time_of_day)]
+        if changed:
+            self.save()
+        return changed
+
+    def window(self, time_of_day):
+        """ {feature: statistics} of one time window ({} if its table is missing). """
+        self.refresh([time_of_day])
+        return self.entries.get(time_of_day, {}).get("features", {})
+
+    def global_stats(self):
+        """ {feature: statistics} over all time windows. """
+        self.refresh()
+        if self._global is None:
+            features = {feature for entry in self.entries.values() for feature in entry["features"]}
+            self._global = {feature: merge_statistics([entry["features"].get(feature) for entry in self.entries.values()])
+                            for feature in features}
+        return self._global
+
+    def global_min_max(self, features):
+        """ ({feature: min}, {feature: max}) over all windows. """
+        stats = self.global_stats()
+        return ({feature: stats[feature]["min"] for feature in features},
+                {feature: stats[feature]["max"] for feature in features})
+
+
+_stats = {}
+
+
+def get_feature_stats(folder=feature_folder):
+    """ Shared statistics for a Feature_Label folder. """
+    if folder not in _stats:
+        _stats[folder] = FeatureStats(folder)
+    return _stats[folder]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print (and cache) the Feature_Label statistics.")
+    parser.add_argument("--feature-folder", default=feature_folder)
+    parser.add_argument("--time-of-day", choices=time_windows, help="One window instead of all windows")
+    args = parser.parse_args()
+
+    stats = get_feature_stats(args.feature_folder)
+    changed = stats.refresh()
+    print(f"Recomputed {len(changed)} windows: {changed}" if changed else "All windows up to date")
+    table = stats.window(args.time_of_day) if args.time_of_day else stats.global_stats()
+    rows = {feature: {"min": s["min"], "median": s["median"], "max": s["max"], "mean": s["mean"], **s["quantiles"]}
+            for feature, s in sorted(table.items()) if s}
+    print(pd.DataFrame(rows).T.to_string(float_format=lambda value: f"{value:.4g}"))
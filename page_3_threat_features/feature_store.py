@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+
+from instrumentation import traced
+
+
+feature_folder = "page_3_threat_features/Feature_Label"
+
+time_windows = ["VERY_EARLY_MORNING", "EARLY_AM", "AM_PEAK", "MIDDAY_BASE",
+                "MIDDAY_SCHOOL", "PM_PEAK", "EVENING", "LATE_EVENING", "NIGHT"]
+
+
+def feature_label_path(time_of_day, folder=feature_folder):
+    return os.path.join(folder, f"Feature_Label_{time_of_day}.csv")
+
+
+@traced
+def load_window(time_of_day, folder=feature_folder):
+    """ Loads the Feature_Label table of one time window, or None if it is missing. """
+    file_path = feature_label_path(time_of_day, folder)
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}")
+        return None
+    return pd.read_csv(file_path)
+
+
+def load_all_windows(folder=feature_folder):
+    """ Loads every available Feature_Label table into a {time_of_day: DataFrame} dict. """
+    tables = {}
+    for time_of_day in time_windows:
+        df = load_window(time_of_day, folder)
+        if df is not None:
+            tables[time_of_day] = df
+    return tables
+
+
+def update_feature_column(column, values, folder=feature_folder):
+    """
+    Writes new values of one feature column into the Feature_Label tables.
+    `values` is a DataFrame with an ID column and one column per time window; windows without values
+    (missing column or NaN) keep their existing entries.
+    """
+    values = values.set_index("ID")
+    for time_of_day in time_windows:
+        if time_of_day not in values.columns:
+            continue
+        df = load_window(time_of_day, folder)
+        if df is None:
+            continue
+        new_values = df["ID"].map(values[time_of_day])
+        df[column] = new_values.where(new_values.notna(), df[column])
+        df.to_csv(feature_label_path(time_of_day, folder), index=False)
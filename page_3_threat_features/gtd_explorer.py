@@ -0,0 +1,149 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from page_3_threat_features.gtd_store import (
+    load_gtd_store, pre_9_11_mask, rail_subtypes, gtd_raw_path, gtd_store_path, gtd_folder
+)
+
+
+explorer_map_folder = os.path.join(gtd_folder, "maps")
+
+# Dimensions of the pre-aggregated attack-count cube
+cube_keys = ["iyear", "pre_9_11", "region_txt", "country_txt", "attacktype1_txt", "targsubtype1_txt"]
+
+# Rendered GeoJSON layers kept in memory per filter combination
+layer_cache_size = 32
+
+
+def make_filters(year_range=None, countries=None, regions=None, attack_types=None, target_subtypes=rail_subtypes):
+    """ Normalizes explorer filters into a hashable, JSON-serializable dict (None means no filter). """
+    def as_list(values):
+        if values is None:
+            return None
+        return sorted([values] if isinstance(values, str) else list(values))
+
+    return {
+        "year_range": None if year_range is None else [int(year_range[0]), int(year_range[1])],
+        "countries": as_list(countries),
+        "regions": as_list(regions),
+        "attack_types": as_list(attack_types),
+        "target_subtypes": as_list(target_subtypes),
+    }
+
+
+def filter_mask(frame, filters):
+    mask = np.ones(len(frame), dtype=bool)
+    if filters["year_range"] is not None:
+        start, end = filters["year_range"]
+        mask &= (frame["iyear"].to_numpy() >= start) & (frame["iyear"].to_numpy() <= end)
+    for key, column in [("countries", "country_txt"), ("regions", "region_txt"),
+                        ("attack_types", "attacktype1_txt"), ("target_subtypes", "targsubtype1_txt")]:
+        if filters[key] is not None:
+            mask &= frame[column].isin(filters[key]).to_numpy()
+    return mask
+
+
+class GTDExplorer:
+    """
+    Answers filtered GTD queries from an in-memory attack-count cube and caches rendered layers.
+    Everything is rebuilt when the preprocessed store or the raw export changes.
+    """
+
+    def __init__(self, raw_path=gtd_raw_path, store_path=gtd_store_path):
+        self.raw_path = raw_path
+        self.store_path = store_path
+        self.fingerprint = None
+        self.points_df = None
+        self.cube = None
+        self.layer_cache = {}
+
+    def source_fingerprint(self):
+        stats = [(os.path.getmtime(p), os.path.getsize(p)) for p in (self.raw_path, self.store_path) if os.path.exists(p)]
+        return hashlib.sha1(json.dumps(stats).encode()).hexdigest()[:10]
+
+    def refresh(self):
+        """ Reloads the store and rebuilds the cube if the source data changed. Returns False if no data exists. """
+        fingerprint = self.source_fingerprint()
+        if fingerprint == self.fingerprint and self.points_df is not None:
+            return True
+
+        points_df = load_gtd_store(self.raw_path, self.store_path)
+        if points_df is None:
+            return False
+        points_df["pre_9_11"] = pre_9_11_mask(points_df)
+
+        self.points_df = points_df
+        self.cube = points_df.groupby(cube_keys, observed=True).size().rename("attacks").reset_index()
+        self.layer_cache = {}
+        self.fingerprint = self.source_fingerprint()
+        return True
+
+    def points(self, filters):
+        """ Attack points (one row per event) matching the filters. """
+        return self.points_df[filter_mask(self.points_df, filters)].reset_index(drop=True)
+
+    def statistics(self, filters):
+        """ Summary statistics computed from the cube only. """
+        cube = self.cube[filter_mask(self.cube, filters)]
+        attacks = cube["attacks"].to_numpy()
+        is_us = (cube["country_txt"] == "United States").to_numpy()
+        pre = cube["pre_9_11"].to_numpy()
+
+        def top_attack_types(rows):
+            counts = cube[rows].groupby("attacktype1_txt", observed=True)["attacks"].sum()
+            return counts.sort_values(ascending=False).head(2)
+
+        years = cube["iyear"].to_numpy()
+        return {
+            "total_attacks": int(attacks.sum()),
+            "pre_9_11_us": int(attacks[pre & is_us].sum()),
+            "post_9_11_us": int(attacks[~pre & is_us].sum()),
+            "pre_9_11_global": int(attacks[pre].sum()),
+            "post_9_11_global": int(attacks[~pre].sum()),
+            "us_top_attacks": top_attack_types(is_us),
+            "world_top_attacks": top_attack_types(~is_us),
+            "attacks_by_year": cube.groupby("iyear")["attacks"].sum(),
+            "first_year": int(years.min()) if len(years) else None,
+            "last_year": int(years.max()) if len(years) else None,
+        }
+
+    def filter_key(self, filters):
+        return hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()[:10]
+
+    def map_path(self, filters, variant=None, folder=explorer_map_folder):
+        """
+        Cache location of the rendered map for these filters and the current source data. `variant` holds
+        anything else baked into the HTML (e.g. the asset and tile links).
+        """
+        key = self.filter_key(filters if variant is None else {"filters": filters, "variant": variant})
+        return os.path.join(folder, f"gtd_map_{self.fingerprint}_{key}.html")
+
+    def cached_layer(self, filters, build_layer):
+        """ Returns the GeoJSON layer data for the filters, building it with build_layer(points_df) on a miss. """
+        key = self.filter_key(filters)
+        if key not in self.layer_cache:
+            if len(self.layer_cache) >= layer_cache_size:
+                self.layer_cache.pop(next(iter(self.layer_cache)))
+            self.layer_cache[key] = build_layer(self.points(filters))
+        return self.layer_cache[key]
+
+    def prune_stale_maps(self, folder=explorer_map_folder):
+        """ Deletes rendered maps that were built from older source data. """
+        for path in glob.glob(os.path.join(folder, "gtd_map_*.html")):
+            if not os.path.basename(path).startswith(f"gtd_map_{self.fingerprint}_"):
+                os.remove(path)
+
+
+_explorer = None
+
+
+def get_explorer():
+    """ Shared explorer instance, refreshed against the source data on every call. """
+    global _explorer
+    if _explorer is None:
+        _explorer = GTDExplorer()
+    return _explorer if _explorer.refresh() else None
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+gtd_folder = "page_3_threat_features/GTD_data"
+gtd_raw_path = os.path.join(gtd_folder, "gtd_combined.csv")
+gtd_store_path = os.path.join(gtd_folder, "gtd_transportation.npz")
+
+# Only these GTD columns are needed by the maps and statistics
+numeric_columns = ["iyear", "imonth", "iday", "latitude", "longitude"]
+text_columns = ["country_txt", "region_txt", "attacktype1_txt", "targsubtype1_txt"]
+
+rail_subtypes = ["Train/Train Tracks/Trolley", "Subway"]
+
+raw_chunksize = 50_000
+
+
+def build_gtd_store(raw_path=gtd_raw_path, store_path=gtd_store_path):
+    """
+    Filters the raw GTD export down to geocoded Transportation targets and stores only the needed
+    columns in a compact columnar .npz file (text columns are dictionary-encoded).
+    """
+    chunks = []
+    reader = pd.read_csv(raw_path, encoding="ISO-8859-1", usecols=numeric_columns + text_columns + ["targtype1_txt"],
+                         chunksize=raw_chunksize, low_memory=False)
+    for chunk in reader:
+        chunk = chunk[(chunk["targtype1_txt"] == "Transportation")]
+        chunks.append(chunk.dropna(subset=["latitude", "longitude"]))
+    gtd_df = pd.concat(chunks, ignore_index=True)
+
+    arrays = {}
+    for column in numeric_columns:
+        dtype = np.float32 if column in ("latitude", "longitude") else np.int16
+        arrays[column] = gtd_df[column].fillna(0).to_numpy(dtype=dtype)
+    for column in text_columns:
+        codes, categories = pd.factorize(gtd_df[column].fillna("Unknown"))
+        arrays[column] = codes.astype(np.int16)
+        arrays[f"{column}__categories"] = np.asarray(categories, dtype=str)
+
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    tmp_path = store_path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, store_path)
+    return store_path
+
+
+def store_is_stale(raw_path=gtd_raw_path, store_path=gtd_store_path):
+    if not os.path.exists(store_path):
+        return True
+    return os.path.exists(raw_path) and os.path.getmtime(raw_path) > os.path.getmtime(store_path)
+
+
+def load_gtd_store(raw_path=gtd_raw_path, store_path=gtd_store_path):
+    """
+    Loads the preprocessed GTD table, (re)building it first if the raw export is newer.
+    Returns None when neither the store nor the raw export exists.
+    """
+    if store_is_stale(raw_path, store_path):
+        if not os.path.exists(raw_path):
+            print(f"Data file not found: {raw_path}")
+            return None
+        build_gtd_store(raw_path, store_path)
+
+    with np.load(store_path, allow_pickle=False) as store:
+        columns = {column: store[column] for column in numeric_columns}
+        for column in text_columns:
+            columns[column] = pd.Categorical.from_codes(store[column], store[f"{column}__categories"])
+    return pd.DataFrame(columns)
+
+
+def pre_9_11_mask(df):
+    """ True for attacks before September 2001. """
+    year, month = df["iyear"].to_numpy(), df["imonth"].to_numpy()
+    return (year < 2001) | ((year == 2001) & (month < 9))
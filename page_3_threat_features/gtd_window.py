@@ -1,135 +1,128 @@
 import sys
 import os
-import pandas as pd
+import argparse
+import numpy as np
 import folium
 import webbrowser
 
-def generate_gtd_map():
-    """Generates a single GTD map with all urban rail attacks globally."""
-    data_path = "page_3_threat_features/GTD_data/gtd_combined.csv"
-    output_folder = "page_3_threat_features/GTD_data/maps"
-    os.makedirs(output_folder, exist_ok=True)
-    global_map_path = os.path.join(output_folder, "gtd_map_all.html")
+import map_assets
+from instrumentation import span, traced
+from map_assets import create_base_map, save_map, add_title, add_description, add_category_legend, link_settings
+from page_3_threat_features.gtd_explorer import get_explorer, make_filters, explorer_map_folder
+from page_3_threat_features.gtd_store import rail_subtypes
+
+
+def gtd_points_geojson(df):
+    """Builds a GeoJSON FeatureCollection of attack points straight from the column arrays."""
+    colors = np.where(df["pre_9_11"], "orange", "red")
+    dates = [f"{month:02d}-{day:02d}-{year}" for month, day, year in zip(df["imonth"], df["iday"], df["iyear"])]
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(float(lon), 5), round(float(lat), 5)]},
+            "properties": {"attack_type": attack_type, "date": date, "color": color},
+        }
+        for lat, lon, attack_type, date, color in zip(df["latitude"], df["longitude"], df["attacktype1_txt"], dates, colors)
+    ]
+    return {"type": "FeatureCollection", "features": features}
 
-    if not os.path.exists(data_path):
-        print(f"Data file not found: {data_path}")
-        return
 
-    if os.path.exists(global_map_path):
-        webbrowser.open(global_map_path)  # Open the existing map
-        return
+def top_attacks_html(top_attacks):
+    return "<br>".join(f"{attack_type}: {count} attacks" for attack_type, count in top_attacks.items() if count > 0)
 
-    df = pd.read_csv(data_path, encoding="ISO-8859-1", low_memory=False)
 
-    # Filter for transportation attacks related to trains and subways
-    df = df.dropna(subset=["latitude", "longitude"])
-    df = df[
-        (df["targtype1_txt"] == "Transportation") &
-        (df["targsubtype1_txt"].isin(["Train/Train Tracks/Trolley", "Subway"]))
-    ]
+def gtd_map_path(explorer, filters):
+    """ Cached map file for the filters, keyed on the asset/tile links baked into the HTML as well. """
+    return explorer.map_path(filters, variant=link_settings())
+
+
+@traced
+def generate_gtd_map(year_range=None, countries=None, regions=None, attack_types=None,
+                     target_subtypes=rail_subtypes, open_browser=True):
+    """Generates a GTD map of urban rail attacks, optionally filtered by year range, country/region,
+    attack type and target subtype. Rendered maps are cached per filter and rebuilt when the data changes."""
+    with span("load_gtd"):
+        explorer = get_explorer()
+    if explorer is None:
+        return None
+
+    filters = make_filters(year_range, countries, regions, attack_types, target_subtypes)
+    os.makedirs(explorer_map_folder, exist_ok=True)
+    explorer.prune_stale_maps()
+    global_map_path = gtd_map_path(explorer, filters)
 
-    # Count statistics
-    total_attacks = len(df)
-    us_attacks = df[df["country_txt"] == "United States"]
-    world_attacks = df[df["country_txt"] != "United States"]
+    if not os.path.exists(global_map_path):
+        render_gtd_map(explorer, filters, global_map_path)
 
-    pre_9_11_us = len(us_attacks[(us_attacks["iyear"] < 2001) | ((us_attacks["iyear"] == 2001) & (us_attacks["imonth"] < 9))])
-    post_9_11_us = len(us_attacks) - pre_9_11_us
+    # Open map in the system default web browser; maps linking the local server's /assets are opened through it
+    if open_browser:
+        if map_assets.asset_base_url is None:
+            webbrowser.open(global_map_path)
+        else:
+            from local_map_server import map_url
+            webbrowser.open(map_url(global_map_path))
+    return global_map_path
 
-    pre_9_11_global = len(df[(df["iyear"] < 2001) | ((df["iyear"] == 2001) & (df["imonth"] < 9))])
-    post_9_11_global = total_attacks - pre_9_11_global
 
-    # Most common attack types
-    us_top_attacks = us_attacks["attacktype1_txt"].value_counts().head(2)
-    world_top_attacks = world_attacks["attacktype1_txt"].value_counts().head(2)
+@traced
+def render_gtd_map(explorer, filters, global_map_path):
+    """Renders one filtered GTD map from the explorer's cube and cached point layer."""
+    stats = explorer.statistics(filters)
+    total_attacks = stats["total_attacks"]
+    pre_9_11_us, post_9_11_us = stats["pre_9_11_us"], stats["post_9_11_us"]
+    pre_9_11_global, post_9_11_global = stats["pre_9_11_global"], stats["post_9_11_global"]
+    us_top_attacks, world_top_attacks = stats["us_top_attacks"], stats["world_top_attacks"]
+    year_span = f"{stats['first_year']}-{stats['last_year']}" if total_attacks else "no matching attacks"
 
     # Create the folium map with a simple base map
-    m = folium.Map(location=[20, 0], zoom_start=2, tiles="CartoDB positron")  # Faster, less detailed map
+    m = create_base_map(20, 0, zoom_start=2)  # Faster, less detailed map
 
     # Add title
-    title_html = """
-    <div style="position: fixed;
-                top: 10px; left: 50%;
-                transform: translateX(-50%);
-                background-color: rgba(255, 255, 255, 0.9);
-                padding: 15px;
-                font-size: 22px;
-                font-weight: bold;
-                text-align: center;
-                z-index:9999;
-                border-radius: 8px;">
-        Global Terrorism Events at Rail Infrastructure Targets
-    </div>
-    """
-    m.get_root().html.add_child(folium.Element(title_html))
-
-    # Add markers with hover tooltips (Attack Type & Date)
-    for _, row in df.iterrows():
-        color = "red" if (row["iyear"] > 2001 or (row["iyear"] > 2001 and row["imonth"] > 9)) else "orange"
-        attack_date = f"{int(row['imonth']):02d}-{int(row['iday']):02d}-{row['iyear']}"
-        tooltip_text = f"Attack type: {row['attacktype1_txt']}<br>Date: {attack_date}"
-
-        folium.CircleMarker(
-            location=[row["latitude"], row["longitude"]],
-            radius=2.5,
-            color=color,
-            fill=True,
-            fill_color=color,
-            fill_opacity=1.0,
-            tooltip=tooltip_text
-        ).add_to(m)
+    add_title(m, "Global Terrorism Events at Rail Infrastructure Targets", centered=True)
+
+    # Add all markers as one GeoJSON layer with hover tooltips (Attack Type & Date)
+    folium.GeoJson(
+        explorer.cached_layer(filters, gtd_points_geojson),
+        marker=folium.CircleMarker(radius=2.5, fill=True, fill_opacity=1.0),
+        style_function=lambda feature: {"color": feature["properties"]["color"],
+                                        "fillColor": feature["properties"]["color"]},
+        tooltip=folium.GeoJsonTooltip(fields=["attack_type", "date"], aliases=["Attack type:", "Date:"]),
+    ).add_to(m)
 
     # Add Legend
-    legend_html = """
-    <div style="
-        position: fixed; 
-        bottom: 50px; left: 50px; width: 170px; height: 80px; 
-        background-color: white; z-index:9999; font-size:14px;
-        border-radius: 5px; padding: 10px; box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-        <b>Legend</b><br>
-        <div style='background-color:red; width: 15px; height: 15px; display: inline-block;'></div> Post-9/11 Attacks <br>
-        <div style='background-color:orange; width: 15px; height: 15px; display: inline-block;'></div> Pre-9/11 Attacks <br>
-    </div>
-    """
-    m.get_root().html.add_child(folium.Element(legend_html))
+    add_category_legend(m, {"Post-9/11 Attacks": "red", "Pre-9/11 Attacks": "orange"})
 
     # Statistics Bar
     stats_html = f"""
-    <div style="position: fixed;
-                bottom: 20px; right: 10px;
-                width: 270px;
-                background-color: rgba(255, 255, 255, 0.9);
-                z-index:9999; font-size:14px;
-                border-radius: 5px; padding: 10px;
-                box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
         <b>Attack Statistics</b><br>
         <b>Top Attack Types in U.S.:</b><br>
-        {us_top_attacks.index[0]}: {us_top_attacks.iloc[0]} attacks<br>
-        {us_top_attacks.index[1]}: {us_top_attacks.iloc[1]} attacks<br><br>
+        {top_attacks_html(us_top_attacks)}<br><br>
 
         <b>Top Attack Types Globally:</b><br>
-        {world_top_attacks.index[0]}: {world_top_attacks.iloc[0]} attacks<br>
-        {world_top_attacks.index[1]}: {world_top_attacks.iloc[1]} attacks<br><br>
+        {top_attacks_html(world_top_attacks)}<br><br>
 
-        <b>Total Attacks:</b> {total_attacks} (1970-2021)<br>
+        <b>Total Attacks:</b> {total_attacks} ({year_span})<br>
         <b>Pre-9/11 Attacks (U.S.):</b> {pre_9_11_us}<br>
         <b>Post-9/11 Attacks (U.S.):</b> {post_9_11_us}<br>
         <b>Pre-9/11 Attacks (Global):</b> {pre_9_11_global}<br>
         <b>Post-9/11 Attacks (Global):</b> {post_9_11_global}<br>
-        <div style="font-style: italic; font-size: 12px; text-align: left; margin-top: 10px;">
-        Source: Global Terrorism Dataset (https://www.start.umd.edu/data-tools/GTD)
-    </div>
-    </div>
+        <div class="mbta-source">Source: Global Terrorism Dataset (https://www.start.umd.edu/data-tools/GTD)</div>
     """
-    m.get_root().html.add_child(folium.Element(stats_html))
+    add_description(m, stats_html, slot=None, style="mbta-bottom-right mbta-translucent")
 
     # Save map
-    m.save(global_map_path)
-
-    # Open map in the system default web browser
-    webbrowser.open(global_map_path)
+    with span("save"):
+        save_map(m, global_map_path)
 
 
 if __name__ == "__main__":
-    generate_gtd_map()
+    parser = argparse.ArgumentParser(description="Explore GTD attacks on rail infrastructure.")
+    parser.add_argument("--years", nargs=2, type=int, metavar=("FROM", "TO"))
+    parser.add_argument("--country", action="append")
+    parser.add_argument("--region", action="append")
+    parser.add_argument("--attack-type", action="append")
+    parser.add_argument("--target-subtype", action="append", help="Defaults to train and subway targets")
+    args = parser.parse_args()
+
+    generate_gtd_map(args.years, args.country, args.region, args.attack_type, args.target_subtype or rail_subtypes)
     sys.exit(0)  # Exit the script immediately, no GUI window is created
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from page_3_threat_features.feature_store import time_windows, feature_folder, feature_label_path, load_window
+
+
+# Lower is "better" (closer) for the distance features; every other feature ranks highest first
+ascending_features = {"D_nearest_police", "D_nearest_fire", "D_nearest_hospital", "D_police_fire"}
+
+
+class WindowRanking:
+    """
+    Station orders of one Feature_Label table, for every numeric feature.
+    `orders[feature]` lists row positions best-first (ties keep table order, NaN last) and
+    `ranks[feature]` is its inverse, so a top-K is a slice and top-K membership is `ranks < k`.
+    """
+
+    def __init__(self, df):
+        self.ids = df["ID"].to_numpy()
+        self.names = df["Station_Name"].to_numpy(dtype=object)
+        self.values = {}
+        self.orders = {}
+        self.ranks = {}
+        for feature in df.columns:
+            if feature == "ID" or not pd.api.types.is_numeric_dtype(df[feature]):
+                continue
+            values = df[feature].to_numpy(dtype=float)
+            keys = values if feature in ascending_features else -values
+            order = np.argsort(np.where(np.isnan(keys), np.inf, keys), kind="stable")
+            ranks = np.empty(len(order), dtype=np.int64)
+            ranks[order] = np.arange(len(order))
+            self.values[feature] = values
+            self.orders[feature] = order
+            self.ranks[feature] = ranks
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class RankingIndex:
+    """
+    Precomputed rankings for every (time window, feature) of a Feature_Label folder.
+    A window is (re)ranked the first time it is used after its CSV changed.
+    """
+
+    def __init__(self, folder=feature_folder):
+        self.folder = folder
+        self._windows = {}
+
+    def window(self, time_of_day):
+        """ The WindowRanking of a time window, or None if its table is missing. """
+        path = feature_label_path(time_of_day, self.folder)
+        if not os.path.exists(path):
+            print(f"File not found: {path}")
+            return None
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._windows.get(time_of_day)
+        if cached is None or cached[0] != signature:
+            with span("rank_window", time_of_day=time_of_day):
+                cached = self._windows[time_of_day] = (signature, WindowRanking(load_window(time_of_day, self.folder)))
+        return cached[1]
+
+    def is_ranked(self, time_of_day, feature):
+        ranking = self.window(time_of_day)
+        return ranking is not None and feature in ranking.orders
+
+    def top_k(self, time_of_day, feature, k=None):
+        """ Row positions of the top-K stations, best first (all stations when k is None). """
+        return self.window(time_of_day).orders[feature][:k]
+
+    def top_k_ids(self, time_of_day, feature, k=None):
+        ranking = self.window(time_of_day)
+        return ranking.ids[ranking.orders[feature][:k]]
+
+    def top_k_mask(self, time_of_day, feature, k=None):
+        """ Boolean mask over the table rows marking the top-K stations. """
+        ranking = self.window(time_of_day)
+        return ranking.ranks[feature] < (len(ranking) if k is None else k)
+
+    def top_k_table(self, time_of_day, feature, k=None):
+        """ (ID, Station_Name, value) of the top-K stations as a DataFrame, best first. """
+        ranking = self.window(time_of_day)
+        rows = ranking.orders[feature][:k]
+        return pd.DataFrame({"ID": ranking.ids[rows], "Station_Name": ranking.names[rows],
+                             feature: ranking.values[feature][rows]})
+
+    def common_counts(self, time_of_day, features, k):
+        """ For every row, in how many of the features' top-K lists the station appears. """
+        ranking = self.window(time_of_day)
+        rows = np.concatenate([ranking.orders[feature][:k] for feature in features])
+        return np.bincount(rows, minlength=len(ranking))
+
+    def intersection_ids(self, time_of_day, features, k):
+        """ IDs of the stations in the top-K of every feature. """
+        ranking = self.window(time_of_day)
+        return ranking.ids[self.common_counts(time_of_day, features, k) == len(features)]
+
+    def clear(self):
+        self._windows.clear()
+
+
+_indexes = {}
+
+
+def get_ranking_index(folder=feature_folder):
+    """ Shared ranking index for a Feature_Label folder. """
+    if folder not in _indexes:
+        _indexes[folder] = RankingIndex(folder)
+    return _indexes[folder]
+
+
+def warm_up(folder=feature_folder):
+    """ Ranks every window up front (e.g. at startup) so the first map request does no sorting. """
+    index = get_ranking_index(folder)
+    for time_of_day in time_windows:
+        index.window(time_of_day)
+    return index
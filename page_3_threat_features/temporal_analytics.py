@@ -0,0 +1,192 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import span
+from page_3_threat_features.feature_store import time_windows, feature_folder, feature_label_path, load_all_windows
+from page_3_threat_features.ranking_index import ascending_features
+
+
+# Ordinal levels of the categorical features, so their risk profiles can be compared like numbers
+level_values = {"Low": 0.0, "Medium": 1.0, "High": 2.0}
+ordinal_features = {"Threat_Level", "Defense_Posture"}
+
+metrics = ["volatility", "peak_window", "rank_change"]
+
+
+class TemporalProfiles:
+    """
+    Every numeric (and ordinal) feature of the Feature_Label tables as a stations x windows matrix,
+    aligned on the station IDs of the first window, with the statistics across windows precomputed:
+    mean, std, volatility (std / |mean|), best / worst window and the per-window ranks (0 = best).
+    "Best" is the highest value, or the lowest for the distance features.
+    """
+
+    def __init__(self, tables):
+        self.windows = [time_of_day for time_of_day in time_windows if time_of_day in tables]
+        first = tables[self.windows[0]]
+        self.stations = first[["ID", "Station_Name", "Lat", "Lon"]].reset_index(drop=True)
+        self.values = {}
+        self.stats = {}
+        self.ranks = {}
+
+        positions = {}
+        for time_of_day in self.windows:
+            df = tables[time_of_day]
+            positions[time_of_day] = pd.Index(df["ID"]).get_indexer(self.stations["ID"])
+
+        for feature in first.columns:
+            if feature in ("ID", "Lat", "Lon"):
+                continue
+            if feature in ordinal_features:
+                columns = [tables[w][feature].map(level_values).to_numpy(dtype=float) for w in self.windows]
+            elif pd.api.types.is_numeric_dtype(first[feature]):
+                columns = [tables[w][feature].to_numpy(dtype=float) for w in self.windows]
+            else:
+                continue
+            # Station rows in first-window order; stations missing from a window are NaN there
+            matrix = np.full((len(self.stations), len(self.windows)), np.nan)
+            for column, (time_of_day, values) in enumerate(zip(self.windows, columns)):
+                found = positions[time_of_day] >= 0
+                matrix[found, column] = values[positions[time_of_day][found]]
+            self.values[feature] = matrix
+            self.stats[feature], self.ranks[feature] = profile_statistics(matrix, feature in ascending_features)
+
+    def window_index(self, time_of_day):
+        return self.windows.index(time_of_day)
+
+
+def profile_statistics(matrix, ascending=False):
+    """ Statistics across windows (columns) for every station (row), and the ranks within every window. """
+    mean = np.nanmean(matrix, axis=1)
+    std = np.nanstd(matrix, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        volatility = np.where(np.abs(mean) > 0, std / np.abs(mean), 0.0)
+
+    keys = matrix if ascending else -matrix
+    filled = np.where(np.isnan(keys), np.inf, keys)
+    all_missing = np.isnan(matrix).all(axis=1)
+    peak = np.where(all_missing, -1, np.argmin(filled, axis=1))
+    trough = np.where(all_missing, -1, np.argmax(np.where(np.isnan(keys), -np.inf, keys), axis=1))
+
+    # Rank of every station within each window: sort every column at once, then invert the permutation
+    order = np.argsort(filled, axis=0, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(matrix.shape[0])[:, None], axis=0)
+
+    stats = {"mean": mean, "std": std, "volatility": volatility, "min": np.nanmin(matrix, axis=1),
+             "max": np.nanmax(matrix, axis=1), "peak": peak, "trough": trough,
+             "rank_range": ranks.max(axis=1) - ranks.min(axis=1)}
+    return stats, ranks
+
+
+class TemporalAnalytics:
+    """
+    Cross-window queries over a Feature_Label folder. The profiles are rebuilt the first time they are
+    used after any of the window tables changed.
+    """
+
+    def __init__(self, folder=feature_folder):
+        self.folder = folder
+        self._signature = None
+        self._profiles = None
+
+    def signature(self):
+        paths = [feature_label_path(time_of_day, self.folder) for time_of_day in time_windows]
+        return tuple((os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+                     for path in paths)
+
+    @property
+    def profiles(self):
+        signature = self.signature()
+        if self._profiles is None or signature != self._signature:
+            with span("temporal_profiles", folder=self.folder):
+                tables = load_all_windows(self.folder)
+                self._profiles = TemporalProfiles(tables) if tables else None
+            self._signature = signature
+        return self._profiles
+
+    @property
+    def features(self):
+        return list(self.profiles.values) if self.profiles else []
+
+    def profile_table(self, feature):
+        """ One row per station: its value in every window, then mean, std, volatility, peak / trough window and rank range. """
+        profiles = self.profiles
+        stats = profiles.stats[feature]
+        table = profiles.stations.copy()
+        for column, time_of_day in enumerate(profiles.windows):
+            table[time_of_day] = profiles.values[feature][:, column]
+        for name in ("mean", "std", "volatility", "rank_range"):
+            table[name] = stats[name]
+        windows = np.array(profiles.windows + [None], dtype=object)  # Index -1 (no data) maps to None
+        table["peak_window"] = windows[stats["peak"]]
+        table["trough_window"] = windows[stats["trough"]]
+        return table
+
+    def rank_change(self, feature, from_window, to_window):
+        """ Rank improvement of every station from one window to another (positive = moved up the ranking). """
+        profiles = self.profiles
+        ranks = profiles.ranks[feature]
+        return ranks[:, profiles.window_index(from_window)] - ranks[:, profiles.window_index(to_window)]
+
+    def biggest_movers(self, feature, from_window, to_window, k=10, rising=True):
+        """
+        The k stations whose rank in `feature` improves (or, with rising=False, drops) the most between
+        two windows, e.g. biggest_movers("Attractiveness", "LATE_EVENING", "NIGHT") for the stations
+        that become most attractive overnight.
+        """
+        profiles = self.profiles
+        change = self.rank_change(feature, from_window, to_window)
+        order = np.argsort(-change if rising else change, kind="stable")[:k]
+        table = profiles.stations.iloc[order].reset_index(drop=True)
+        table[from_window] = profiles.values[feature][order, profiles.window_index(from_window)]
+        table[to_window] = profiles.values[feature][order, profiles.window_index(to_window)]
+        table["rank_change"] = change[order]
+        return table
+
+    def most_volatile(self, feature, k=10):
+        """ The k stations whose value of `feature` varies the most (relative to its mean) across the day. """
+        return self.profile_table(feature).nlargest(k, "volatility").reset_index(drop=True)
+
+    def peak_counts(self, feature):
+        """ How many stations peak in each window. """
+        profiles = self.profiles
+        peak = profiles.stats[feature]["peak"]
+        counts = np.bincount(peak[peak >= 0], minlength=len(profiles.windows))
+        return dict(zip(profiles.windows, counts.tolist()))
+
+    def clear(self):
+        self._signature = None
+        self._profiles = None
+
+
+_analytics = {}
+
+
+def get_temporal_analytics(folder=feature_folder):
+    """ Shared analytics for a Feature_Label folder. """
+    if folder not in _analytics:
+        _analytics[folder] = TemporalAnalytics(folder)
+    return _analytics[folder]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare station features across the time windows.")
+    parser.add_argument("feature", nargs="?", default="Attractiveness")
+    parser.add_argument("--from-window", default="LATE_EVENING", choices=time_windows)
+    parser.add_argument("--to-window", default="NIGHT", choices=time_windows)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--feature-folder", default=feature_folder)
+    args = parser.parse_args()
+
+    analytics = get_temporal_analytics(args.feature_folder)
+    pd.set_option("display.width", 200)
+    print(f"Biggest risers in {args.feature}, {args.from_window} -> {args.to_window}:")
+    print(analytics.biggest_movers(args.feature, args.from_window, args.to_window, args.k).to_string(index=False))
+    print(f"\nMost volatile in {args.feature}:")
+    print(analytics.most_volatile(args.feature, args.k)[["Station_Name", "mean", "std", "volatility", "peak_window",
+                                                         "trough_window", "rank_range"]].to_string(index=False))
+    print(f"\nStations peaking per window: {analytics.peak_counts(args.feature)}")
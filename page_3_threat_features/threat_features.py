@@ -3,8 +3,10 @@ import os
 import pandas as pd
 from PyQt6.QtWidgets import QApplication, QVBoxLayout, QWidget, QComboBox, QLabel, QHBoxLayout, QSpinBox, QCheckBox, QPushButton
 from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtCore import QSize, QTimer
+from PyQt6.QtCore import QSize, QTimer, QUrl
 from visualizer import generate_threat_feature_map, nodes_df, layer_files
+from local_map_server import get_map_server, map_url
+from instrumentation import span, traced, attach_latency_readout
 from page_2_map_with_features.map_features import MapFeaturesApp  # Import the centrality features window
 
 # Load Available Time of Day CSVs
@@ -53,6 +55,7 @@ class ThreatFeaturesApp(QWidget):
         super().__init__()
         self.setWindowTitle("Urban Rail Network Data Analysis")
         self.setGeometry(100, 40, 1200, 900)
+        get_map_server()  # Started before the first map, so the maps link their assets through it
 
         layout = QVBoxLayout()
 
@@ -126,6 +129,7 @@ class ThreatFeaturesApp(QWidget):
         layout.addLayout(top_row_layout)  # Includes new centrality button
         layout.addLayout(layers_layout)  # Layer + HeatMap toggles in same row
         layout.addWidget(self.browser)
+        attach_latency_readout(layout)
         self.setLayout(layout)
         self.update_map(self.time_of_day_dropdown.currentText(), self.feature_dropdown.currentText(), self.top_k_selector.value())
 
@@ -169,6 +173,7 @@ class ThreatFeaturesApp(QWidget):
         top_k = self.top_k_selector.value() if self.top_k_selector.isEnabled() else None
         self.update_map(selected_time, selected_feature, top_k)
 
+    @traced
     def update_map(self, selected_time, selected_feature, top_k):
         """ Updates map based on selected feature, time of day, top K selection, and layer toggles """
         # selected_time = self.time_of_day_dropdown.currentText()
@@ -188,7 +193,8 @@ class ThreatFeaturesApp(QWidget):
 
         map_path = generate_threat_feature_map(selected_time, selected_feature, top_k, active_layers, show_heatmap)
         if map_path:
-            self.browser.setHtml(open(map_path).read())
+            with span("load"):
+                self.browser.load(QUrl(map_url(map_path)))
 
 
 
@@ -0,0 +1,297 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import map_assets
+from page_3_threat_features.feature_store import time_windows, feature_folder, feature_label_path
+
+
+default_output = "briefing_maps"
+manifest_name = "manifest.json"
+
+data_folder = "MBTA_graph_data"
+layer_folder = "page_3_threat_features/Layer_Information"
+crime_folder = "page_3_threat_features/Crime_Data"
+
+# Rendering code and shared assets every map depends on
+code_inputs = ["visualizer.py", "map_assets.py", "page_3_threat_features/facilities.py",
+               "page_3_threat_features/ranking_index.py", "page_3_threat_features/feature_stats.py",
+               "page_3_threat_features/temporal_analytics.py"]
+asset_inputs = [os.path.join(map_assets.asset_folder, name) for name in ("mbta_maps.js", "mbta_maps.css", "icons.css")]
+
+# Briefing maps are handed around on their own: shared assets embedded, basemap tiles from the network
+link_settings = {"asset_base_url": None, "tile_url": None, "inline_assets": True}
+
+# Keys of visualizer.layer_files, and the file behind each
+facility_layers = {"Police Dept": "Boston_police.csv", "Fire Dept": "Boston_fire.csv", "Hospitals": "Boston_hospital.csv"}
+
+threat_features = ["Basemap", "Crime_Index", "Defense_Posture", "Population_Density", "Average_Ridership",
+                   "Threat_Level", "Attractiveness", "D_nearest_police", "D_nearest_hospital", "D_nearest_fire",
+                   "D_police_fire"]
+overlay_features = ["D_nearest_police", "D_nearest_fire", "D_nearest_hospital", "D_police_fire",
+                    "Population_Density", "Average_Ridership", "Crime_Index", "Attractiveness"]
+# Shown by category (or not ranked at all), so the threat page passes no top-K for these
+unranked_features = {"Basemap", "Defense_Posture", "Threat_Level"}
+centralities = ["No Centrality", "Domirank", "Degree", "Betweenness", "Eigen Vector", "Closeness"]
+
+# Parameter grid per map kind; every combination is rendered. Override with --grid grid.json (same shape).
+default_grid = {
+    "threat": {"time_of_day": time_windows, "feature": threat_features, "top_k": [5, 10],
+               "layers": [[], list(facility_layers)], "heatmap": [False, True]},
+    "centrality": {"centrality": centralities, "top_k": [5, 10]},
+    "attractiveness": {"time_of_day": time_windows},
+    "overlay": {"time_of_day": time_windows, "feature": overlay_features, "top_k": [5, 10]},
+    "overlay_common": {"time_of_day": time_windows, "features": [["Attractiveness", "Crime_Index", "Average_Ridership"]],
+                       "top_k": [5, 10]},
+    "temporal": {"feature": ["Attractiveness", "Crime_Index", "Average_Ridership"],
+                 "metric": ["volatility", "peak_window", "rank_change"], "time_of_day": time_windows, "top_k": [10]},
+}
+
+
+# ---------- Jobs ----------
+
+def expand_grid(grid):
+    """ Yields one job dict per distinct parameter combination of every map kind in the grid. """
+    seen = set()
+    for kind, params in grid.items():
+        if kind not in default_grid:
+            raise ValueError(f"Unknown map kind '{kind}', expected one of {list(default_grid)}")
+        keys = list(params)
+        for combination in itertools.product(*(params[key] for key in keys)):
+            job = dict(zip(keys, combination), kind=kind)
+            if kind == "threat" and job["feature"] in unranked_features:
+                job["top_k"] = None
+            if kind == "temporal" and job["metric"] != "rank_change":
+                job["time_of_day"] = None  # Only the rank change depends on the window
+            if job_path(job) not in seen:
+                seen.add(job_path(job))
+                yield job
+
+
+def job_path(job):
+    """ Output path of a job, relative to the output folder. """
+    kind = job["kind"]
+    if kind == "threat":
+        name = job["feature"] if job["top_k"] is None else f"{job['feature']}_top{job['top_k']}"
+        if job["layers"]:
+            name += "_layers-" + "-".join(layer.split()[0].lower() for layer in job["layers"])
+        if job["heatmap"]:
+            name += "_heatmap"
+        return os.path.join("threat", job["time_of_day"], name + ".html")
+    if kind == "centrality":
+        return os.path.join("centrality", f"{job['centrality'].replace(' ', '_')}_top{job['top_k']}.html")
+    if kind == "attractiveness":
+        return os.path.join("attractiveness", f"{job['time_of_day']}.html")
+    if kind == "temporal":
+        name = f"{job['feature']}_{job['metric']}" + (f"_{job['time_of_day']}" if job["time_of_day"] else "")
+        return os.path.join("temporal", f"{name}_top{job['top_k']}.html")
+    if kind == "overlay":
+        return os.path.join("overlay", job["time_of_day"], f"{job['feature']}_top{job['top_k']}.html")
+    return os.path.join("overlay", job["time_of_day"], f"common_{'+'.join(job['features'])}_top{job['top_k']}.html")
+
+
+def job_inputs(job, folder):
+    """ Files a job reads (data, rendering code and shared assets); the output is up to date while they are unchanged. """
+    inputs = [os.path.join(data_folder, "Node_CSV.csv"), os.path.join(data_folder, "Edge_CSV.csv"),
+              *code_inputs, *asset_inputs]
+    kind = job["kind"]
+    if kind in ("threat", "temporal"):
+        # Colour scales (threat) and profiles (temporal) use every window
+        inputs += [feature_label_path(time_of_day, folder) for time_of_day in time_windows]
+    if kind == "threat":
+        inputs += [os.path.join(layer_folder, facility_layers[layer]) for layer in job["layers"]]
+        if job["heatmap"]:
+            inputs.append(os.path.join(crime_folder, f"Boston_Cambridge_Brookline_crime_filtered_{job['time_of_day']}.csv"))
+    elif kind in ("attractiveness", "overlay", "overlay_common"):
+        inputs.append(feature_label_path(job["time_of_day"], folder))
+    return inputs
+
+
+_file_hashes = {}
+
+
+def file_hash(path):
+    """ Content hash of a file (missing files hash to a constant), memoized on mtime and size. """
+    if not os.path.exists(path):
+        return "missing"
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _file_hashes:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+
+def job_hash(job, folder):
+    # How assets and tiles are linked is baked into the HTML, so it is part of the hash as well
+    digest = hashlib.sha1(json.dumps({**job, **link_settings}, sort_keys=True).encode())
+    for path in job_inputs(job, folder):
+        digest.update(file_hash(path).encode())
+    return digest.hexdigest()
+
+
+# ---------- Rendering (worker processes) ----------
+
+_worker_folder = None
+
+
+def _init_worker(folder, output_root):
+    """ Points the visualizer at the feature tables and a private scratch folder for this worker, with standalone map links. """
+    global _worker_folder
+    import visualizer
+    for name, value in link_settings.items():
+        setattr(map_assets, name, value)
+    _worker_folder = os.path.join(output_root, ".scratch", str(os.getpid()))
+    os.makedirs(_worker_folder, exist_ok=True)
+    visualizer.output_folder = _worker_folder
+    visualizer.overlay_output_folder = _worker_folder
+    visualizer.threat_folder = folder
+    visualizer.temp_folder = folder
+
+
+def render_job(job, destination):
+    """ Renders one map and moves it to `destination`. Returns the render time, or None if no map was produced. """
+    import visualizer
+    start = time.perf_counter()
+    kind = job["kind"]
+    if kind == "threat":
+        map_path = visualizer.generate_threat_feature_map(job["time_of_day"], job["feature"], job["top_k"],
+                                                          job["layers"], job["heatmap"])
+    elif kind == "centrality":
+        map_path = visualizer.generate_mbta_map_with_centrality(job["centrality"], job["top_k"])
+    elif kind == "attractiveness":
+        map_path = visualizer.generate_attractiveness_map(job["time_of_day"])
+    elif kind == "temporal":
+        map_path = visualizer.generate_temporal_map(job["feature"], job["metric"], job["time_of_day"], job["top_k"])
+    elif kind == "overlay":
+        map_path = visualizer.generate_overlay_singular_map(job["time_of_day"], job["feature"], job["top_k"])
+    else:
+        map_path = visualizer.generate_overlay_singular_map(job["time_of_day"], job["features"], job["top_k"], True)
+    if not map_path or not os.path.exists(map_path):
+        return None
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(map_path, destination)
+    return time.perf_counter() - start
+
+
+# ---------- Manifest ----------
+
+def load_manifest(output_root):
+    path = os.path.join(output_root, manifest_name)
+    if not os.path.exists(path):
+        return {"maps": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, output_root):
+    manifest["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    path = os.path.join(output_root, manifest_name)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def render_all(grid=default_grid, output_root=default_output, folder=feature_folder, workers=None, force=False,
+               dry_run=False):
+    """
+    Renders every map of the grid into `output_root`, skipping maps whose inputs are unchanged since the
+    manifest entry was written. Returns (rendered, skipped, failed) lists of relative paths.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    manifest = load_manifest(output_root)
+    manifest["feature_folder"] = folder
+
+    pending, skipped = [], []
+    for job in expand_grid(grid):
+        relative_path = job_path(job)
+        input_hash = job_hash(job, folder)
+        entry = manifest["maps"].get(relative_path)
+        up_to_date = (entry is not None and entry["input_hash"] == input_hash
+                      and os.path.exists(os.path.join(output_root, relative_path)))
+        if up_to_date and not force:
+            skipped.append(relative_path)
+        else:
+            pending.append((job, relative_path, input_hash))
+
+    print(f"{len(pending)} maps to render, {len(skipped)} up to date")
+    if dry_run:
+        return [path for _, path, _ in pending], skipped, []
+
+    rendered, failed = [], []
+    if not pending:
+        return rendered, skipped, failed
+
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(folder, output_root)) as pool:
+            futures = {pool.submit(render_job, job, os.path.join(output_root, relative_path)): (job, relative_path, input_hash)
+                       for job, relative_path, input_hash in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                job, relative_path, input_hash = futures[future]
+                try:
+                    seconds = future.result()
+                except Exception as error:
+                    seconds, reason = None, f"{type(error).__name__}: {error}"
+                else:
+                    reason = "no map produced (missing input?)"
+                if seconds is None:
+                    failed.append(relative_path)
+                    print(f"[{done}/{len(pending)}] FAILED {relative_path}: {reason}")
+                    continue
+                manifest["maps"][relative_path] = {"params": job, "input_hash": input_hash,
+                                                   "rendered": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                                   "seconds": round(seconds, 3)}
+                rendered.append(relative_path)
+                print(f"[{done}/{len(pending)}] {relative_path} ({seconds:.2f} s)")
+                if done % 50 == 0:
+                    save_manifest(manifest, output_root)
+    finally:
+        save_manifest(manifest, output_root)
+        shutil.rmtree(os.path.join(output_root, ".scratch"), ignore_errors=True)
+    return rendered, skipped, failed
+
+
+def build_grid(args):
+    """ Default grid (or --grid file) restricted by --kinds, --windows and --top-k. """
+    grid = default_grid
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    grid = {kind: dict(params) for kind, params in grid.items() if not args.kinds or kind in args.kinds}
+    for params in grid.values():
+        if args.windows and "time_of_day" in params:
+            params["time_of_day"] = args.windows
+        if args.top_k and "top_k" in params:
+            params["top_k"] = args.top_k
+    return grid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render map variants for offline briefings.")
+    parser.add_argument("--output", default=default_output, help="Output folder (manifest.json is written here)")
+    parser.add_argument("--grid", help="JSON file with the parameter grid per map kind (default: built-in grid)")
+    parser.add_argument("--kinds", nargs="+", choices=list(default_grid), help="Only render these map kinds")
+    parser.add_argument("--windows", nargs="+", choices=time_windows, help="Only render these time windows")
+    parser.add_argument("--top-k", nargs="+", type=int, help="Top-K values to render")
+    parser.add_argument("--feature-folder", default=feature_folder, help="Feature_Label tables to render from")
+    parser.add_argument("--workers", type=int, default=None, help="Rendering processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Re-render maps that are up to date")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the maps that would be rendered")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rendered, skipped, failed = render_all(build_grid(args), args.output, args.feature_folder, args.workers,
+                                           args.force, args.dry_run)
+    if args.dry_run:
+        print("\n".join(rendered))
+    else:
+        print(f"Rendered {len(rendered)}, skipped {len(skipped)}, failed {len(failed)} "
+              f"in {time.perf_counter() - start:.1f} s -> {args.output}")
@@ -0,0 +1,381 @@
+import argparse
+import os
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import scipy as sp
+from scipy.spatial import cKDTree
+
+from page_3_threat_features.feature_store import time_windows, feature_label_path
+from page_3_threat_features.crime_index import crime_file_template, compute_crime_index
+from page_3_threat_features.crime_ingest import window_start_hours
+from page_3_threat_features.facilities import facility_layers, compute_facility_features
+
+
+# Downtown Boston; every synthetic network is centered here
+boston_center = (42.3555, -71.0605)
+meters_per_degree = 111_320
+
+mbta_lines = ["Orange Line", "Blue Line", "Red Line", "Green Line"]
+
+# The real network: ~114 stations within ~15 km of downtown, ~40 police, ~36 fire and ~24 hospital locations
+reference_stations = 114
+reference_radius_m = 15_000
+facilities_per_station = {"police": 39 / 114, "fire": 36 / 114, "hospital": 24 / 114}
+
+# Stations closer than this to a station of another line become a shared transfer station
+transfer_radius_m = 150
+
+# Mean ridership per window relative to AM_PEAK, and crime records per window relative to the busiest
+# window (both measured on the real Feature_Label / Crime_Data; MIDDAY_BASE has no crime extract)
+ridership_profile = {
+    "VERY_EARLY_MORNING": 0.075, "EARLY_AM": 0.267, "AM_PEAK": 1.0, "MIDDAY_BASE": 0.891,
+    "MIDDAY_SCHOOL": 0.669, "PM_PEAK": 1.226, "EVENING": 0.622, "LATE_EVENING": 0.173, "NIGHT": 0.025,
+}
+crime_profile = {
+    "VERY_EARLY_MORNING": 0.169, "EARLY_AM": 0.097, "AM_PEAK": 0.451, "MIDDAY_SCHOOL": 0.809,
+    "PM_PEAK": 0.982, "EVENING": 1.0, "LATE_EVENING": 0.368, "NIGHT": 0.476,
+}
+offense_groups = ["Larceny", "M/V related offenses", "Assault", "Vandalism", "Drug violation", "Robbery"]
+
+# Share of stations per Threat_Level / Defense_Posture level (29 / 56 / 29 in the real tables)
+level_shares = (0.25, 0.5, 0.25)
+
+# Share of Near / Medium / Far stations by distance from downtown (20 / 50 / 44 in Node_CSV)
+distance_category_shares = (0.18, 0.44, 0.38)
+
+# Above this size betweenness is estimated from sampled sources
+exact_betweenness_limit = 2000
+centrality_samples = 64
+
+default_crime_per_station = 20
+
+
+def city_radius_m(n_stations):
+    """ Larger networks cover a larger (but denser) area. """
+    return reference_radius_m * (n_stations / reference_stations) ** 0.25
+
+
+def offset_to_latlon(dx, dy):
+    lat = boston_center[0] + np.asarray(dy) / meters_per_degree
+    lon = boston_center[1] + np.asarray(dx) / (meters_per_degree * np.cos(np.radians(boston_center[0])))
+    return lat, lon
+
+
+def station_spacing_m(distance_from_center):
+    """ Stations sit ~400 m apart downtown and spread out towards the suburbs. """
+    return 400 + 0.06 * distance_from_center
+
+
+def walk_arm(rng, start, heading, n_steps):
+    """ Station positions (meters from downtown) along one arm that drifts outwards from `start`. """
+    points = np.empty((n_steps, 2))
+    position = np.array(start, dtype=float)
+    for k in range(n_steps):
+        radial = np.arctan2(position[1], position[0]) if np.hypot(*position) > 500 else heading
+        # Turn gently, with a pull towards the radial direction so lines keep heading out of town
+        heading += rng.normal(0, 0.15) + 0.2 * np.angle(np.exp(1j * (radial - heading)))
+        position = position + station_spacing_m(np.hypot(*position)) * np.array([np.cos(heading), np.sin(heading)])
+        points[k] = position
+    return points
+
+
+def generate_topology(n_stations, rng):
+    """
+    Builds lines that run through downtown with two arms each, plus branches splitting off the outer half
+    of an arm. Stations of a new line that land within transfer_radius_m of an existing station are merged
+    into it (transfer stations). Returns station xy (meters from downtown) and (line, source, target) edges.
+    """
+    radius = city_radius_m(n_stations)
+    line_length = max(8, int(round(30 * (n_stations / reference_stations) ** 0.25)))
+
+    placed = []
+    edges = []
+    line_number = 0
+    while len(placed) < n_stations:
+        line = mbta_lines[line_number] if line_number < len(mbta_lines) else f"Line {line_number + 1}"
+        line_number += 1
+
+        # A line crosses the core: start near downtown and walk out in two opposite directions
+        core = rng.normal(0, 0.1 * radius, 2)
+        heading = rng.uniform(0, 2 * np.pi)
+        arms = [walk_arm(rng, core, heading, line_length // 2),
+                walk_arm(rng, core, heading + np.pi, line_length - line_length // 2)]
+        arm_links = [(arm, 1, 0) for arm in range(2)]  # the arms meet at the core
+
+        for arm in range(2):
+            if rng.random() < 0.35:
+                fork = int(rng.integers(len(arms[arm]) // 2, len(arms[arm])))
+                branch_heading = rng.choice([-1, 1]) * rng.uniform(0.5, 1.0)
+                direction = arms[arm][fork] - (arms[arm][fork - 1] if fork > 0 else core)
+                branch = walk_arm(rng, arms[arm][fork], np.arctan2(direction[1], direction[0]) + branch_heading,
+                                  max(3, line_length // 4))
+                arm_links.append((len(arms), arm, fork))
+                arms.append(branch)
+
+        line_edges = place_line(placed, arms, arm_links, n_stations)
+        edges.extend((line, source, target) for source, target in line_edges)
+
+    xy = np.array(placed)
+    return xy, connect_components(xy, edges)
+
+
+def place_line(placed, arms, arm_links, n_stations):
+    """ Appends one line's stations to `placed`, merging close stations into existing ones. Returns the edges. """
+    tree = cKDTree(np.array(placed)) if placed else None
+    ids_per_arm = []
+    edges = []
+    for points in arms:
+        ids = []
+        for point in points:
+            if tree is not None:
+                distance, nearest = tree.query(point)
+                if distance < transfer_radius_m:
+                    ids.append(int(nearest))
+                    continue
+            if len(placed) >= n_stations:
+                break
+            placed.append(point)
+            ids.append(len(placed) - 1)
+        ids_per_arm.append(ids)
+        edges.extend((a, b) for a, b in zip(ids[:-1], ids[1:]) if a != b)
+
+    # Join the arms at the core and the branches at their fork
+    for arm, parent, fork in arm_links:
+        if ids_per_arm[arm] and ids_per_arm[parent]:
+            anchor = ids_per_arm[parent][min(fork, len(ids_per_arm[parent]) - 1)]
+            if anchor != ids_per_arm[arm][0]:
+                edges.append((anchor, ids_per_arm[arm][0]))
+    return edges
+
+
+def connect_components(xy, edges):
+    """ Links every stray component to the nearest station of the largest one. """
+    n = len(xy)
+    pairs = np.array([(s, t) for _, s, t in edges], dtype=int).reshape(-1, 2)
+    adjacency = sp.sparse.coo_array((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    n_components, labels = sp.sparse.csgraph.connected_components(adjacency, directed=False)
+    if n_components == 1:
+        return edges
+
+    main = np.bincount(labels).argmax()
+    main_ids = np.flatnonzero(labels == main)
+    tree = cKDTree(xy[main_ids])
+    line_of = {}
+    for line, source, target in edges:
+        line_of.setdefault(source, line)
+        line_of.setdefault(target, line)
+    for component in range(n_components):
+        if component == main:
+            continue
+        ids = np.flatnonzero(labels == component)
+        distance, nearest = tree.query(xy[ids])
+        closest = np.argmin(distance)
+        edges.append((line_of.get(ids[closest], "Transfer"), int(ids[closest]), int(main_ids[nearest[closest]])))
+    return edges
+
+
+def station_centralities(n, edges_df, rng):
+    """ Centrality columns of Node_CSV; betweenness/closeness are sampled estimates on large networks. """
+    from domirank import domirank
+
+    G = nx.Graph()
+    G.add_nodes_from(range(1, n + 1))
+    G.add_edges_from(zip(edges_df["Source"], edges_df["Target"]))
+    adjacency = nx.to_scipy_sparse_array(G, format="csr", dtype=float)
+
+    samples = None if n <= exact_betweenness_limit else centrality_samples
+    betweenness = nx.betweenness_centrality(G, k=samples, seed=int(rng.integers(1 << 31)))
+
+    sources = rng.choice(n, min(n, max(centrality_samples, 1)), replace=False) if n > exact_betweenness_limit else np.arange(n)
+    distances = sp.sparse.csgraph.shortest_path(adjacency, unweighted=True, indices=sources)
+    mean_distance = distances.sum(axis=0) / max(len(sources) - 1, 1)
+
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    eigen = np.abs(sp.sparse.linalg.eigsh(adjacency, k=1, which="LA")[1][:, 0])
+    return {
+        "Degree_Centrality": degree / max(n - 1, 1),
+        "Betweenness_Centrality": np.array([betweenness[i] for i in range(1, n + 1)]),
+        "Eigen_Centrality": eigen / eigen.max(),
+        "Closeness_Centrality": 1 / np.maximum(mean_distance, 1),
+        "Domirank_Centrality": domirank(adjacency, sigma=0.5 / degree.max())[1],
+    }
+
+
+def generate_facilities(xy, rng):
+    """ Facility locations clustered around (mostly downtown) stations, in each real layer file's format. """
+    distance = np.hypot(xy[:, 0], xy[:, 1])
+    weights = np.exp(-distance / (0.3 * distance.max() + 1))
+    layers = {}
+    for layer, ratio in facilities_per_station.items():
+        count = max(3, int(round(ratio * len(xy))))
+        anchor = rng.choice(len(xy), count, p=weights / weights.sum())
+        lat, lon = offset_to_latlon(*(xy[anchor] + rng.normal(0, 600, (count, 2))).T)
+        names = [f"{layer.title()} {i + 1}" for i in range(count)]
+        _, name_column = facility_layers[layer]
+        layers[layer] = pd.DataFrame({name_column: names, "Latitude": lat, "Longitude": lon})
+    return layers
+
+
+def generate_crime(xy, rng, points_per_station=default_crime_per_station):
+    """
+    Crime point clouds per window: 80% in hotspots around downtown-weighted stations, 20% spread
+    over the whole city. Same columns as the real Crime_Data extracts.
+    """
+    distance = np.hypot(xy[:, 0], xy[:, 1])
+    radius = distance.max() + 1
+    weights = np.exp(-distance / (0.25 * radius))
+    hotspots = rng.choice(len(xy), max(1, len(xy) // 5), replace=False, p=weights / weights.sum())
+    total = points_per_station * len(xy)
+    window_hours = dict((window, start) for start, window in window_start_hours)
+    starts = sorted(window_hours.values()) + [24.0]
+
+    crime = {}
+    for window, share in crime_profile.items():
+        n_points = int(total * share / sum(crime_profile.values()))
+        in_hotspot = rng.random(n_points) < 0.8
+        center = xy[rng.choice(hotspots, n_points)]
+        points = np.where(in_hotspot[:, None], center + rng.normal(0, 300, (n_points, 2)),
+                          rng.uniform(-radius, radius, (n_points, 2)))
+        lat, lon = offset_to_latlon(points[:, 0], points[:, 1])
+
+        start = window_hours[window]
+        end = starts[starts.index(start) + 1]
+        seconds = (rng.uniform(start, end, n_points) * 3600).astype(int)
+        dates = pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 365, n_points), unit="D") \
+            + pd.to_timedelta(seconds, unit="s")
+        crime[window] = pd.DataFrame({
+            "OCCURRED_ON_DATE": dates.strftime("%Y-%m-%d %H:%M:%S"),
+            "Lat": lat, "Long": lon,
+            "Merged_Offense_Group": rng.choice(offense_groups, n_points),
+            "TIME": dates.strftime("%H:%M:%S"),
+            "TIME_PERIOD": window,
+        })
+    return crime
+
+
+def assign_levels(score):
+    """ High / Medium / Low by quantile of the score, in the real tables' proportions. """
+    low, high = np.quantile(score, [level_shares[0], level_shares[0] + level_shares[1]])
+    return np.where(score >= high, "High", np.where(score < low, "Low", "Medium"))
+
+
+def feature_tables(nodes_df, facility_df, crime_index_df, xy, rng):
+    """ Feature_Label tables for every window, with the same columns and value ranges as the real ones. """
+    n = len(nodes_df)
+    distance = np.hypot(xy[:, 0], xy[:, 1])
+    radius = distance.max() + 1
+
+    population = np.exp(-distance / (0.35 * radius)) * rng.lognormal(0, 0.4, n)
+    population = population / population.max()
+    ridership = rng.lognormal(0, 1.0, n) * (1 + nodes_df["Degree_Centrality"].to_numpy() * n) \
+        * np.exp(-distance / (0.3 * radius))
+    ridership = 0.6 * ridership / ridership.max()
+
+    crime_index = crime_index_df.set_index("ID").reindex(nodes_df["ID"])
+    crime_index["MIDDAY_BASE"] = crime_index["MIDDAY_BASE"].fillna(crime_index["MIDDAY_SCHOOL"])
+
+    betweenness = nodes_df["Betweenness_Centrality"].to_numpy()
+    threat = assign_levels(crime_index.mean(axis=1).to_numpy() + ridership + betweenness + rng.normal(0, 0.05, n))
+    defense = assign_levels(1 - facility_df["D_nearest_police"].to_numpy() + rng.normal(0, 0.2, n))
+
+    tables = {}
+    for window in time_windows:
+        window_ridership = ridership * ridership_profile[window]
+        window_crime = crime_index[window].to_numpy()
+        attractiveness = (0.158 * window_ridership + 0.408 * facility_df["D_nearest_police"].to_numpy()
+                          + 0.242 * facility_df["D_nearest_fire"].to_numpy()
+                          + 0.028 * facility_df["D_nearest_hospital"].to_numpy()
+                          + 0.061 * betweenness + 0.103 * window_crime) * rng.lognormal(0, 0.2, n)
+        tables[window] = pd.DataFrame({
+            "ID": nodes_df["ID"], "Station_Name": nodes_df["stop_name"],
+            "Lat": nodes_df["Lat"], "Lon": nodes_df["Lon"],
+            "DomiRank": nodes_df["Domirank_Centrality"], "Betweenness": betweenness,
+            "Eigenvector": nodes_df["Eigen_Centrality"],
+            "D_nearest_police": facility_df["D_nearest_police"], "D_nearest_fire": facility_df["D_nearest_fire"],
+            "D_nearest_hospital": facility_df["D_nearest_hospital"], "D_police_fire": facility_df["D_police_fire"],
+            "Population_Density": population, "Average_Ridership": window_ridership,
+            "Defense_Posture": defense, "Threat_Level": threat,
+            "Crime_Index": window_crime, "Attractiveness": attractiveness / max(attractiveness.max(), 1e-12),
+            "D_nearest_police_name": facility_df["D_nearest_police_name"],
+            "D_nearest_fire_name": facility_df["D_nearest_fire_name"],
+            "D_nearest_hospital_name": facility_df["D_nearest_hospital_name"],
+        })
+    return tables
+
+
+def synthetic_paths(root):
+    """ Where each input lives inside a generated network (mirrors the repository layout). """
+    return {
+        "nodes": os.path.join(root, "MBTA_graph_data", "Node_CSV.csv"),
+        "edges": os.path.join(root, "MBTA_graph_data", "Edge_CSV.csv"),
+        "feature_folder": os.path.join(root, "page_3_threat_features", "Feature_Label"),
+        "crime_folder": os.path.join(root, "page_3_threat_features", "Crime_Data"),
+        "layer_folder": os.path.join(root, "page_3_threat_features", "Layer_Information"),
+        "edge_index": os.path.join(root, "page_3_threat_features", "GCN", "edge_index.csv"),
+    }
+
+
+def generate_network(n_stations, root, seed=7, crime_per_station=default_crime_per_station):
+    """
+    Generates an MBTA-shaped network with `n_stations` stations and writes every input the dashboard
+    and pipelines read (nodes, edges, Feature_Label tables, crime extracts, facility layers, model
+    edge index) under `root`. Returns the paths dict from synthetic_paths.
+    """
+    rng = np.random.default_rng(seed)
+    paths = synthetic_paths(root)
+    for key in ["nodes", "feature_folder", "crime_folder", "layer_folder", "edge_index"]:
+        os.makedirs(paths[key] if key.endswith("folder") else os.path.dirname(paths[key]), exist_ok=True)
+
+    xy, edges = generate_topology(n_stations, rng)
+    lat, lon = offset_to_latlon(xy[:, 0], xy[:, 1])
+    distance = np.hypot(xy[:, 0], xy[:, 1])
+
+    edges_df = pd.DataFrame(edges, columns=["Line", "Source", "Target"])
+    edges_df[["Source", "Target"]] += 1
+    nodes_df = pd.DataFrame({
+        "ID": np.arange(1, n_stations + 1),
+        "stop_name": [f"Station {i}" for i in range(1, n_stations + 1)],
+        "Lon": lon, "Lat": lat,
+        "Distance_Category": pd.cut(distance, np.quantile(distance, [0, *np.cumsum(distance_category_shares)]),
+                                    labels=["Near", "Medium", "Far"], include_lowest=True).astype(str),
+        "Buffer_Size": np.clip(150 + 0.05 * distance * rng.lognormal(0, 0.3, n_stations), 40, 1250),
+    })
+
+    for layer, layer_df in generate_facilities(xy, rng).items():
+        layer_df.to_csv(os.path.join(paths["layer_folder"], facility_layers[layer][0]), index=False)
+    for window, crime_df in generate_crime(xy, rng, crime_per_station).items():
+        crime_df.to_csv(os.path.join(paths["crime_folder"], crime_file_template.format(window)), index=False)
+
+    # Crime_Index and the facility distances come from the same pipelines used on the real data
+    crime_index_df = compute_crime_index(nodes_df, paths["crime_folder"])
+    crime_totals = crime_index_df[[w for w in time_windows if w != "MIDDAY_BASE"]].sum(axis=1).to_numpy()
+    nodes_df["Crime_Weight"] = crime_totals / max(crime_totals.sum(), 1e-12)
+    for column, values in station_centralities(n_stations, edges_df, rng).items():
+        nodes_df[column] = values
+    facility_df = compute_facility_features(nodes_df, folder=paths["layer_folder"])
+
+    for window, table in feature_tables(nodes_df, facility_df, crime_index_df, xy, rng).items():
+        table.to_csv(feature_label_path(window, paths["feature_folder"]), index=False)
+    nodes_df.to_csv(paths["nodes"], index=False)
+    edges_df.to_csv(paths["edges"], index=False)
+
+    # Model edge index: unique undirected edges in both directions over 0-based station positions
+    pairs = np.unique(np.sort(edges_df[["Source", "Target"]].to_numpy() - 1, axis=1), axis=0)
+    np.savetxt(paths["edge_index"], np.hstack([pairs.T, pairs.T[::-1]]).astype(float), delimiter=",")
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate an MBTA-shaped synthetic network for scale testing.")
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--output", default=None, help="Output folder (default: synthetic/mbta_<stations>)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--crime-per-station", type=int, default=default_crime_per_station,
+                        help="Crime records per station, spread over the time windows")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join("synthetic", f"mbta_{args.stations}")
+    generate_network(args.stations, output, args.seed, args.crime_per_station)
+    print(f"Synthetic network with {args.stations} stations written to {output}")
@@ -0,0 +1,243 @@
+import argparse
+import math
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import span
+from map_assets import asset_folder, tile_attribution
+
+
+# Basemap tiles are kept in an MBTiles (SQLite) file, so maps served by the local map server or the HTTP
+# service load their basemap locally, and an air-gapped machine only needs a prefetched copy of the file.
+tile_folder = os.path.join(asset_folder, "tiles")
+tile_store_path = os.path.join(tile_folder, "carto_positron.mbtiles")
+upstream_url = "https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png"
+upstream_subdomains = "abcd"
+upstream_timeout = 5
+
+boston_bounds = (-71.30, 42.18, -70.90, 42.48)  # (west, south, east, north) around every MBTA station
+default_zooms = (10, 16)  # Inclusive zoom range of a prefetch
+max_cached_tiles = 100000  # Least recently used tiles downloaded on demand beyond this are evicted
+prefetch_workers = 8
+
+# Reads only note the access time in memory; the times are written with the next put, or at most this often
+access_flush_seconds = 60
+
+
+def tile_range(bounds, zoom):
+    """ (x_min, x_max, y_min, y_max) of the XYZ tiles covering (west, south, east, north) at a zoom level. """
+    west, south, east, north = bounds
+    n = 2 ** zoom
+
+    def x(lon):
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def y(lat):
+        lat = math.radians(lat)
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    return x(west), x(east), y(north), y(south)
+
+
+def tiles_in(bounds, zooms):
+    """ Every (z, x, y) tile of the bounds for the zoom levels min..max (inclusive). """
+    for zoom in range(zooms[0], zooms[1] + 1):
+        x_min, x_max, y_min, y_max = tile_range(bounds, zoom)
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield zoom, x, y
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def download_tile(z, x, y):
+    url = upstream_url.format(s=upstream_subdomains[(x + y) % len(upstream_subdomains)], z=z, x=x, y=y)
+    request = urllib.request.Request(url, headers={"User-Agent": "MBTA-GUI tile cache"})
+    with urllib.request.urlopen(request, timeout=upstream_timeout) as response:
+        return response.read()
+
+
+class TileStore:
+    """
+    MBTiles file (rows are TMS, i.e. y counted from the south) with an extra access table for LRU eviction.
+    Tiles missing from the store are downloaded on request when the network is available and kept; a tile
+    that could not be downloaded is not requested again in this session. Prefetched tiles are pinned: the
+    capacity only applies to tiles downloaded on demand.
+    """
+
+    def __init__(self, path=tile_store_path, capacity=max_cached_tiles):
+        self.path = path
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.accessed = {}  # TMS key -> last read, not written yet
+        self.flushed = time.monotonic()
+        self.failed = set()  # (z, x, y) of the downloads that failed in this session
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, "
+                                    "tile_row INTEGER, tile_data BLOB, "
+                                    "PRIMARY KEY (zoom_level, tile_column, tile_row))")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tile_access (zoom_level INTEGER, tile_column INTEGER, "
+                                    "tile_row INTEGER, last_used REAL, pinned INTEGER NOT NULL DEFAULT 0, "
+                                    "PRIMARY KEY (zoom_level, tile_column, tile_row))")
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(tile_access)")]
+            if "pinned" not in columns:  # Store written before prefetched tiles were pinned
+                self.connection.execute("ALTER TABLE tile_access ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS tile_access_last_used ON tile_access (last_used)")
+            self.connection.executemany("INSERT OR IGNORE INTO metadata VALUES (?, ?)", [
+                ("name", "CartoDB positron"), ("format", "png"), ("type", "baselayer"),
+                ("bounds", ",".join(map(str, boston_bounds))), ("attribution", tile_attribution)])
+
+    @staticmethod
+    def key(z, x, y):
+        return z, x, 2 ** z - 1 - y  # XYZ -> TMS row
+
+    def get(self, z, x, y):
+        """ Tile bytes from the store (noting the access for the LRU order), or None. """
+        key = self.key(z, x, y)
+        with self.lock:
+            row = self.connection.execute("SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? "
+                                          "AND tile_row=?", key).fetchone()
+            if row is not None:
+                self.accessed[key] = time.time()
+                if time.monotonic() - self.flushed >= access_flush_seconds:
+                    with self.connection:
+                        self._flush_access()
+        return row[0] if row else None
+
+    def _flush_access(self):
+        """ Writes the pending access times (caller holds the lock and a transaction). """
+        self.connection.executemany("UPDATE tile_access SET last_used=? WHERE zoom_level=? AND tile_column=? "
+                                    "AND tile_row=?", [(used, *key) for key, used in self.accessed.items()])
+        self.accessed.clear()
+        self.flushed = time.monotonic()
+
+    def put_many(self, tiles, pinned=False):
+        """
+        Stores [(z, x, y, data)] and evicts the least recently used unpinned tiles beyond the capacity.
+        Pinned tiles (prefetched) are never evicted.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self._flush_access()
+            self.connection.executemany("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                                        [(*self.key(z, x, y), data) for z, x, y, data in tiles])
+            self.connection.executemany("INSERT INTO tile_access VALUES (?, ?, ?, ?, ?) "
+                                        "ON CONFLICT (zoom_level, tile_column, tile_row) DO UPDATE SET "
+                                        "last_used=excluded.last_used, pinned=MAX(pinned, excluded.pinned)",
+                                        [(*self.key(z, x, y), now, int(pinned)) for z, x, y, _ in tiles])
+            unpinned = self.connection.execute("SELECT COUNT(*) FROM tile_access WHERE pinned=0").fetchone()[0]
+            excess = unpinned - self.capacity
+            if excess > 0:
+                with span("evict_tiles", tiles=excess):
+                    self.connection.execute("DELETE FROM tiles WHERE (zoom_level, tile_column, tile_row) IN "
+                                            "(SELECT zoom_level, tile_column, tile_row FROM tile_access "
+                                            "WHERE pinned=0 ORDER BY last_used LIMIT ?)", (excess,))
+                    self.connection.execute("DELETE FROM tile_access WHERE (zoom_level, tile_column, tile_row) "
+                                            "NOT IN (SELECT zoom_level, tile_column, tile_row FROM tiles)")
+
+    def contains(self, z, x, y):
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                                           self.key(z, x, y)).fetchone() is not None
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def tile(self, z, x, y, fetch_missing=True):
+        """ Tile bytes from the store, downloaded (and kept) on a miss; None if unavailable. """
+        if not valid_tile(z, x, y):
+            return None
+        data = self.get(z, x, y)
+        if data is None and fetch_missing and (z, x, y) not in self.failed:
+            try:
+                with span("download_tile", z=z, x=x, y=y):
+                    data = download_tile(z, x, y)
+            except OSError as error:
+                with self.lock:
+                    if not self.failed:
+                        print(f"Basemap tiles unavailable ({error}); failed tiles are not retried until restart")
+                    self.failed.add((z, x, y))
+                return None
+            self.put_many([(z, x, y, data)])
+        return data
+
+    def prefetch(self, bounds=boston_bounds, zooms=default_zooms, workers=prefetch_workers, force=False):
+        """
+        Downloads every tile of the bounds at the zoom levels and pins them (tiles already stored are pinned
+        as well). Returns (downloaded, skipped, failed) counts.
+        """
+        wanted = list(tiles_in(bounds, zooms))
+        missing = wanted if force else [tile for tile in wanted if not self.contains(*tile)]
+        downloaded, failed, batch = 0, [], []
+
+        def fetch(tile):
+            try:
+                return tile, download_tile(*tile)
+            except OSError:
+                return tile, None
+
+        with span("prefetch_tiles", tiles=len(missing)), ThreadPoolExecutor(workers) as pool:
+            for tile, data in pool.map(fetch, missing):
+                if data is None:
+                    failed.append(tile)
+                    continue
+                batch.append((*tile, data))
+                downloaded += 1
+                if len(batch) >= 256:
+                    self.put_many(batch, pinned=True)
+                    batch = []
+            if batch:
+                self.put_many(batch, pinned=True)
+        self.pin(wanted)
+        if failed:
+            print(f"Could not fetch {len(failed)} tiles, e.g. {'/'.join(map(str, failed[0]))}")
+        return downloaded, len(wanted) - len(missing), len(failed)
+
+    def pin(self, tiles):
+        """ Exempts stored tiles [(z, x, y)] from eviction. """
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE tile_access SET pinned=1 WHERE zoom_level=? AND tile_column=? "
+                                        "AND tile_row=?", [self.key(*tile) for tile in tiles])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_tile_store(path=tile_store_path):
+    """ Shared tile store for an MBTiles file. """
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TileStore(path)
+        return _stores[path]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prefetch CartoDB positron basemap tiles for offline use.")
+    parser.add_argument("--store", default=tile_store_path, help="MBTiles file")
+    parser.add_argument("--bounds", nargs=4, type=float, default=boston_bounds, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    parser.add_argument("--zoom", nargs=2, type=int, default=default_zooms, metavar=("MIN", "MAX"))
+    parser.add_argument("--workers", type=int, default=prefetch_workers)
+    parser.add_argument("--force", action="store_true", help="Re-download tiles that are already stored")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the tiles")
+    args = parser.parse_args()
+
+    total = sum(1 for _ in tiles_in(args.bounds, args.zoom))
+    if args.dry_run:
+        print(f"{total} tiles for zoom {args.zoom[0]}-{args.zoom[1]}")
+    else:
+        store = get_tile_store(args.store)
+        downloaded, skipped, failed = store.prefetch(args.bounds, args.zoom, args.workers, args.force)
+        print(f"Downloaded {downloaded}, already stored {skipped}, failed {failed}; "
+              f"{store.count()} tiles in {args.store}")
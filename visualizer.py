@@ -2,11 +2,22 @@ import os
 from xmlrpc.client import boolean
 
 import folium
+import numpy as np
 import pandas as pd
 import networkx as nx
 import branca.colormap as cm
 from folium.plugins import HeatMap
 
+from instrumentation import span, traced
+from map_assets import (
+    create_base_map, save_map, add_facility_cluster,
+    add_title, add_description, add_gradient_legend, add_category_legend, add_ranked_list, gradient_colors
+)
+from page_3_threat_features.facilities import get_registry
+from page_3_threat_features.feature_stats import get_feature_stats
+from page_3_threat_features.ranking_index import get_ranking_index, WindowRanking
+from page_3_threat_features.temporal_analytics import get_temporal_analytics
+
 
 
 # Ensure "outputs" folder exists
@@ -18,8 +29,9 @@ data_folder = "MBTA_graph_data"
 nodes_path = os.path.join(data_folder, "Node_CSV.csv")
 edges_path = os.path.join(data_folder, "Edge_CSV.csv")
 
-nodes_df = pd.read_csv(nodes_path)
-edges_df = pd.read_csv(edges_path)
+with span("load_network"):
+    nodes_df = pd.read_csv(nodes_path)
+    edges_df = pd.read_csv(edges_path)
 
 # Create Graph
 G = nx.Graph()
@@ -41,38 +53,19 @@ color_mapping = {
 }
 
 # Compute centralities
-degree_centrality = nx.degree_centrality(G)
-betweenness_centrality = nx.betweenness_centrality(G)
-eigenvector_centrality = nx.eigenvector_centrality_numpy(G)
-closeness_centrality = nx.closeness_centrality(G)
-
-
-def get_global_min_max(threat_folder, feature_columns):
-    categorical_features = ["Defense_Posture", "Threat_Level", "Basemap"]  # Define categorical features
-    continuous_features = [f for f in feature_columns if f not in categorical_features]  # Exclude categorical features
-
-    global_min = {}
-    global_max = {}
-
-    for feature in continuous_features:
-        all_values = []
-        for filename in os.listdir(threat_folder):
-            if filename.endswith(".csv"):
-                df = pd.read_csv(os.path.join(threat_folder, filename))
-                all_values.extend(df[feature].dropna().tolist())
-        global_min[feature] = min(all_values)
-        global_max[feature] = max(all_values)
-
-    return global_min,global_max
-
-
+with span("compute_centralities"):
+    degree_centrality = nx.degree_centrality(G)
+    betweenness_centrality = nx.betweenness_centrality(G)
+    eigenvector_centrality = nx.eigenvector_centrality_numpy(G)
+    closeness_centrality = nx.closeness_centrality(G)
 
 
+@traced
 def generate_mbta_map_without_features():
     """ Generates a simple MBTA network map without centrality features. """
     center_lat = nodes_df['Lat'].mean()
     center_lon = nodes_df['Lon'].mean()
-    mbta_map = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='CartoDB positron')
+    mbta_map = create_base_map(center_lat, center_lon)
 
     # Add Nodes (Stations)
     for _, row in nodes_df.iterrows():
@@ -105,8 +98,9 @@ def generate_mbta_map_without_features():
         ).add_to(mbta_map)
 
     # Save Map
-    map_path = os.path.join(output_folder, "outputs/mbta_map.html")
-    mbta_map.save(map_path)
+    map_path = os.path.join(output_folder, "mbta_map.html")
+    with span("save"):
+        save_map(mbta_map, map_path)
     return map_path
 
 
@@ -120,7 +114,18 @@ centrality_columns = {
     "Domirank": "Domirank_Centrality"  # Added Domirank centrality
 }
 
+_centrality_ranking = None
+
+
+def centrality_ranking():
+    """ Station orders of the Node_CSV columns, built once (same tie and NaN rules as the Feature_Label rankings). """
+    global _centrality_ranking
+    if _centrality_ranking is None:
+        _centrality_ranking = WindowRanking(nodes_df.rename(columns={"stop_name": "Station_Name"}))
+    return _centrality_ranking
 
+
+@traced
 def generate_mbta_map_with_centrality(selected_centrality="No Centrality", top_k=len(nodes_df)):
     """
     Generates an MBTA map with selectable centrality measures from precomputed values.
@@ -128,25 +133,24 @@ def generate_mbta_map_with_centrality(selected_centrality="No Centrality", top_k
     """
     center_lat = nodes_df['Lat'].mean()
     center_lon = nodes_df['Lon'].mean()
-    mbta_map = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='CartoDB positron')
+    mbta_map = create_base_map(center_lat, center_lon)
 
     centrality_column = centrality_columns[selected_centrality]
 
     # If no centrality, all nodes are black
     if selected_centrality == "No Centrality":
         colormap = None
-        top_k_nodes = []
+        in_top_k = np.zeros(len(nodes_df), dtype=bool)
     else:
         # Get min/max for proper color scaling
         min_val, max_val = nodes_df[centrality_column].min(), nodes_df[centrality_column].max()
         colormap = cm.LinearColormap(["green", "yellow", "red"], vmin=min_val, vmax=max_val)
 
         # Identify top K nodes based on selected centrality
-        top_k_nodes = nodes_df.nlargest(top_k, centrality_column)["ID"].tolist()
+        in_top_k = centrality_ranking().ranks[centrality_column] < top_k
 
     # Add Nodes (Stations)
-    for _, row in nodes_df.iterrows():
-        station_id = row['ID']
+    for top, (_, row) in zip(in_top_k, nodes_df.iterrows()):
         station_name = row["stop_name"]
         lat, lon = row["Lat"], row["Lon"]
 
@@ -156,7 +160,7 @@ def generate_mbta_map_with_centrality(selected_centrality="No Centrality", top_k
         else:
             original_color = colormap(row[centrality_column])
             centrality_text = f"{row[centrality_column]:.3f}"
-            node_color = original_color if station_id in top_k_nodes else "#B0B0B0"
+            node_color = original_color if top else "#B0B0B0"
             tooltip_text = f"{station_name} - {selected_centrality}: {centrality_text}"
 
         folium.CircleMarker(
@@ -196,7 +200,8 @@ def generate_mbta_map_with_centrality(selected_centrality="No Centrality", top_k
 
     # Save Map
     map_path = os.path.join(output_folder, f"mbta_map_with_{selected_centrality.lower()}_top{top_k}.html")
-    mbta_map.save(map_path)
+    with span("save"):
+        save_map(mbta_map, map_path)
     return map_path
 
 
@@ -211,13 +216,25 @@ layer_files = {
     "Hospitals": "Boston_hospital.csv"
 }
 
-# Emoji markers for layers
-layer_icons = {
-    "Police Dept": "access_measures_logos/police.png",
-    "Fire Dept": "access_measures_logos/fire.png",
-    "Hospitals": "access_measures_logos/hospital.png"
+
+# Facility registry layer behind each layer checkbox
+layer_keys = {
+    "Police Dept": "police",
+    "Fire Dept": "fire",
+    "Hospitals": "hospital"
 }
 
+
+def add_facility_layers(mbta_map, active_layers):
+    """ Adds the selected facility layers as clustered marker layers from the preloaded facility registry. """
+    registry = get_registry(layer_folder)
+    for layer_name, layer_key in layer_keys.items():
+        if layer_name in active_layers:
+            facility_layer = registry.get(layer_key)
+            if facility_layer is not None:
+                add_facility_cluster(mbta_map, layer_name, facility_layer.coordinates_json)
+
+
 # Updated feature dropdown options based on new dataset
 # feature_columns = [
 #     "D_nearest_police", "D_nearest_fire", "D_nearest_hospital",
@@ -303,8 +320,7 @@ feature_title = {
 
 crime_folder = "page_3_threat_features/Crime_Data"
 
-global_feature_min, global_feature_max = get_global_min_max(threat_folder, feature_columns)
-
+@traced
 def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, active_layers=None, show_heatmap=False):
     """
     Generates a network map where nodes are colored based on a selected threat feature.
@@ -319,7 +335,8 @@ def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, activ
         return None
 
     # Load the selected CSV file
-    feature_df = pd.read_csv(file_path)
+    with span("read_csv", path=file_path):
+        feature_df = pd.read_csv(file_path)
 
     if selected_feature == "Basemap":
         map_path =generate_basemap_feature(time_of_day,active_layers,show_heatmap)
@@ -331,7 +348,7 @@ def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, activ
 
     center_lat = merged_df['Lat'].mean()
     center_lon = merged_df['Lon'].mean()
-    mbta_map = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='CartoDB positron')
+    mbta_map = create_base_map(center_lat, center_lon)
 
     # Check if the selected feature is categorical (Protection_Level, Threat_Level)
     # is_categorical = selected_feature in ["Protection_Level", "Threat_level"]
@@ -339,78 +356,49 @@ def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, activ
     is_categorical = selected_feature in ["Defense_Posture", "Threat_Level"]
 
     if not is_categorical:
-        # min_val, max_val = merged_df[selected_feature].min(), merged_df[selected_feature].max()
-        min_val = global_feature_min[selected_feature]
-        max_val = global_feature_max[selected_feature]
-
-
-        median_val = merged_df[selected_feature].median()
+        # Scale over all windows (comparable across windows), median of this window
+        global_stats = get_feature_stats(threat_folder).global_stats()[selected_feature]
+        min_val = global_stats["min"]
+        max_val = global_stats["max"]
+        median_val = get_feature_stats(threat_folder).window(time_of_day)[selected_feature]["median"]
         colormap = cm.LinearColormap(["green", "yellow", "red"], vmin=min_val, vmax=max_val)
 
         # Vertical color bar with labels for min, median, max values
-        legend_html = f"""
-        <div style="position: fixed; bottom: 50px; left: 50px; width: 60px; height: 200px; background-color: rgba(255, 255, 255, 0.8); 
-                    z-index:9999; font-size:12px; border: none; padding: 10px; text-align: center;">
-
-            <!-- Color Gradient Bar -->
-            <div style="height: 170px; width: 20px; background: linear-gradient(to top, green, yellow, red); margin: auto;"></div>
-
-            <!-- Min, Median, Max Values -->
-            <div style="position: absolute; bottom: 20px; left: 45px;">{min_val:.2f}</div>
-            <div style="position: absolute; top: 50%; left: 45px; transform: translateY(-50%);">{median_val:.2f}</div>
-            <div style="position: absolute; top: 0; left: 45px;">{max_val:.2f}</div>
-
-            <!-- Label for Normalized Values BELOW the bar -->
-            <div style="position: absolute; bottom: -25px; left: 50%; transform: translateX(-50%); font-weight: bold; font-size: 12px;">
-                Normalized Values
-            </div>
-        </div>
-
-        """
-        mbta_map.get_root().html.add_child(folium.Element(legend_html))
+        add_gradient_legend(mbta_map, min_val, median_val, max_val)
     else:
 
         colormap = None  # No colormap for categorical features
 
 
-    top_k_data = []
-
     # Merge standard and additional feature columns
     display_features = feature_columns + list(additional_fields.keys())
 
     # Calculate padding based on the longest label
     longest_label = max([additional_fields.get(feat, feat) for feat in display_features], key=len)
 
-    ascending_features = {"D_nearest_police", "D_nearest_fire", "D_nearest_hospital","D_police_fire"}
-
-    # Determine if the feature is ascending or descending
-    is_ascending = selected_feature in ascending_features
-
-    if top_k and top_k < len(merged_df):
-        if is_ascending:
-            top_k_nodes = merged_df.nsmallest(top_k, selected_feature)["ID"].tolist()  # Use nsmallest for ascending
-        else:
-            top_k_nodes = merged_df.nlargest(top_k, selected_feature)["ID"].tolist()
+    # Top K from the precomputed rankings (distance features rank ascending); unranked features show all stations
+    ranking = get_ranking_index(threat_folder)
+    if top_k and top_k < len(merged_df) and ranking.is_ranked(time_of_day, selected_feature):
+        in_top_k = ranking.top_k_mask(time_of_day, selected_feature, top_k)
+        top_k_rows = ranking.top_k(time_of_day, selected_feature, top_k)
     else:
-        top_k_nodes = merged_df["ID"].tolist()
+        in_top_k = np.ones(len(merged_df), dtype=bool)
+        top_k_rows = ranking.top_k(time_of_day, selected_feature) if ranking.is_ranked(time_of_day, selected_feature) else []
+    top_k_data = [(merged_df["Station_Name"].iat[row], merged_df[selected_feature].iat[row]) for row in top_k_rows]
 
     # Add Nodes (Stations)
-    for _, row in merged_df.iterrows():
-        station_id = row['ID']
+    for position, (_, row) in enumerate(merged_df.iterrows()):
         station_name = row["Station_Name"]
         lat, lon = row["Lat"], row["Lon"]
         feature_value = row[selected_feature]
 
-        if station_id in top_k_nodes:
-            top_k_data.append((station_name, feature_value))
-
 
         # Apply categorical colors for Protection_Level and Threat_Level
         if is_categorical:
             node_color = category_colors.get(feature_value, "grey")if not selected_feature =="Defense_Posture" else category_colors_defense_posture.get(feature_value, "grey")
             node_radius=5
         else:
-            if station_id in top_k_nodes:
+            if in_top_k[position]:
                 node_radius = 5  # Larger size for top K nodes
                 node_color = colormap(feature_value) if not pd.isna(feature_value) else "grey"
             else:
@@ -451,8 +439,6 @@ def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, activ
 
 
 
-    top_k_data.sort(key=lambda x: x[1], reverse=not is_ascending)
-
 
     # ✅ **Retained Edge Structure**
     edge_width = 1.5 if selected_feature == "No Centrality" else 1.5
@@ -475,28 +461,7 @@ def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, activ
 
     # ✅ **Add External Layers (Police, Fire, Hospital)**
     if active_layers:
-        for layer_name, file_name in layer_files.items():
-            if layer_name in active_layers:
-                layer_path = os.path.join(layer_folder, file_name)
-                if os.path.exists(layer_path):
-                    layer_df = pd.read_csv(layer_path)
-
-                    for _, loc in layer_df.iterrows():
-                        lat, lon = loc["Latitude"], loc["Longitude"]
-                        icon_path = layer_icons[layer_name]
-
-                        # Create a custom icons
-                        custom_icon = folium.CustomIcon(
-                            icon_image=icon_path,
-                            icon_size=(20, 20),  # Set the size of the icons
-                            icon_anchor=(10, 10)  # Anchor the middle-bottom point of the icons
-                        )
-
-                        folium.Marker(
-                            location=[lat, lon],
-                            icon=custom_icon,
-                            tooltip=layer_name
-                        ).add_to(mbta_map)
+        add_facility_layers(mbta_map, active_layers)
 
     # ✅ **Add Crime HeatMap if enabled**
     if show_heatmap:
@@ -504,7 +469,8 @@ def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, activ
         crime_path = os.path.join(crime_folder, crime_file)
 
         if os.path.exists(crime_path):
-            crime_df = pd.read_csv(crime_path)
+            with span("read_csv", path=crime_path):
+                crime_df = pd.read_csv(crime_path)
 
             # ✅ Filter out rows with missing latitude/longitude values
             crime_df = crime_df.dropna(subset=["Lat", "Long"])
@@ -522,144 +488,33 @@ def generate_threat_feature_map(time_of_day, selected_feature, top_k=None, activ
                 ).add_to(mbta_map)
 
     # ✅ **Add Legend for Categorical Features**
-
     if is_categorical and selected_feature != "Attractiveness":
-        if selected_feature=="Defense_Posture":
-            legend_html = """
-                    <div style="
-                        position: fixed; 
-                        bottom: 50px; left: 50px; width: 90px; height: 100px; 
-                        background-color: white; z-index:9999; font-size:14px;
-                        border-radius: 5px; padding: 10px; box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-                        <b>Legend</b><br>
-                        <div style='background-color:Green; width: 15px; height: 15px; display: inline-block;'></div> High <br>
-                        <div style='background-color:yellow; width: 15px; height: 15px; display: inline-block;'></div> Medium <br>
-                        <div style='background-color:Red; width: 15px; height: 15px; display: inline-block;'></div> Low <br>
-                    </div>
-                    """
-        else:
-            legend_html = """
-            <div style="
-                position: fixed; 
-                bottom: 50px; left: 50px; width: 90px; height: 100px; 
-                background-color: white; z-index:9999; font-size:14px;
-                border-radius: 5px; padding: 10px; box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-                <b>Legend</b><br>
-                <div style='background-color:red; width: 15px; height: 15px; display: inline-block;'></div> High <br>
-                <div style='background-color:yellow; width: 15px; height: 15px; display: inline-block;'></div> Medium <br>
-                <div style='background-color:green; width: 15px; height: 15px; display: inline-block;'></div> Low <br>
-            </div>
-            """
-
-
-        mbta_map.get_root().html.add_child(folium.Element(legend_html))
-
-
-
-    elif colormap :
-
-        # HTML for top K nodes overlay layer
+        add_category_legend(mbta_map, category_colors_defense_posture if selected_feature == "Defense_Posture" else category_colors)
 
+    elif colormap:
+        # Top K nodes overlay (first 10 listed)
         remaining_stations = len(top_k_data) - 10
+        add_ranked_list(mbta_map, f"Top {min(len(top_k_data), 10)}: {selected_feature}", top_k_data[:10], remaining_stations)
 
-        # HTML for top K nodes overlay
-
-        top_k_html = f"""
-
-        <div style="position: fixed; top: 20px; right: 20px; width: 230px; height: 250px; 
-
-                    background-color: white; z-index:9999; font-size:14px;
-
-                    border: 2px solid grey; overflow-y: auto;">
-
-            <h4 style="text-align:center;">Top {min(len(top_k_data), 10)}: {selected_feature}</h4>
-
-            <ul>
-
-        """
-
-        for name, value in top_k_data[:10]:  # Limit to top 10 for display
-
-            top_k_html += f"<li>{name}: <b>{value:.2f}</b></li>"
-
-        if remaining_stations > 0:
-            top_k_html += f"<li>... and <b>{remaining_stations}</b> more stations</li>"
-
-        top_k_html += "</ul></div>"
-
-        # Add the overlay to the map
-
-        mbta_map.get_root().html.add_child(folium.Element(top_k_html))
-
-    description_left = "175px" if is_categorical else "150px"
-
-    # description_html = f"""
-    # <div style="position: fixed;
-    #             bottom: 50px;
-    #             left: {description_left};  /* Positioned just to the right of the legend */
-    #             width: 300px;
-    #             background-color: white;
-    #             z-index:9999;
-    #             font-size:14px;
-    #             padding: 10px;
-    #             border-radius: 5px;
-    #             box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-    #      <strong>{selected_feature.replace('_', ' ').capitalize()}:</strong> {feature_descriptions[selected_feature]}
-
-    # </div>
-    # """
-
-    description_html = f"""
-        <div style="position: fixed; 
-                    bottom: 50px; 
-                    left: {description_left};  /* Positioned just to the right of the legend */
-                    width: 300px; 
-                    background-color: white; 
-                    z-index:9999; 
-                    font-size:14px; 
-                    padding: 10px; 
-                    border-radius: 5px; 
-                    box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-                    {feature_descriptions[selected_feature]}
-        </div>
-        """
-
-    mbta_map.get_root().html.add_child(folium.Element(description_html))
-
+    add_description(mbta_map, feature_descriptions[selected_feature])
 
     # Get the appropriate title and description for the selected feature
     raw_name = selected_feature.replace("_", " ").capitalize()
     description = feature_title.get(selected_feature, "No description available.")
-
-    feature_title_html = f"""
-    <div style="position: fixed; 
-                top: 10px; 
-                left: 60px; 
-                background-color: white; 
-                color: black; 
-                padding: 10px 14px; 
-                font-weight: normal; 
-                font-size: 20px; 
-                border-radius: 6px; 
-                z-index: 9999; 
-                max-width: 500px;
-                box-shadow: 2px 2px 5px rgba(0,0,0,0.4);">
-        <b>{raw_name}:</b> {description}
-    </div>
-    """
-
-    mbta_map.get_root().html.add_child(folium.Element(feature_title_html))
+    add_title(mbta_map, f"<b>{raw_name}:</b> {description}")
 
 
     # ✅ **Save the Final Map**
     map_path = os.path.join(output_folder, f"mbta_threat_{time_of_day}_{selected_feature}_top{top_k}.html")
-    mbta_map.save(map_path)
+    with span("save"):
+        save_map(mbta_map, map_path)
     return map_path
 
 
+@traced
 def generate_basemap_feature(time_of_day,active_layers=None, show_heatmap=False):
     center_lat, center_lon = nodes_df['Lat'].mean(), nodes_df['Lon'].mean()
-    mbta_map = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='CartoDB positron')
+    mbta_map = create_base_map(center_lat, center_lon)
 
     # Add Nodes
     for _, row in nodes_df.iterrows():
@@ -696,28 +551,7 @@ def generate_basemap_feature(time_of_day,active_layers=None, show_heatmap=False)
 
     # ✅ **Add External Layers (Police, Fire, Hospital)**
     if active_layers:
-        for layer_name, file_name in layer_files.items():
-            if layer_name in active_layers:
-                layer_path = os.path.join(layer_folder, file_name)
-                if os.path.exists(layer_path):
-                    layer_df = pd.read_csv(layer_path)
-
-                    for _, loc in layer_df.iterrows():
-                        lat, lon = loc["Latitude"], loc["Longitude"]
-                        icon_path = layer_icons[layer_name]
-
-                        # Create a custom icons
-                        custom_icon = folium.CustomIcon(
-                            icon_image=icon_path,
-                            icon_size=(20, 20),  # Set the size of the icons
-                            icon_anchor=(10, 10)  # Anchor the middle-bottom point of the icons
-                        )
-
-                        folium.Marker(
-                            location=[lat, lon],
-                            icon=custom_icon,
-                            tooltip=layer_name
-                        ).add_to(mbta_map)
+        add_facility_layers(mbta_map, active_layers)
 
     # ✅ **Add Crime HeatMap if enabled**
     if show_heatmap:
@@ -725,7 +559,8 @@ def generate_basemap_feature(time_of_day,active_layers=None, show_heatmap=False)
         crime_path = os.path.join(crime_folder, crime_file)
 
         if os.path.exists(crime_path):
-            crime_df = pd.read_csv(crime_path)
+            with span("read_csv", path=crime_path):
+                crime_df = pd.read_csv(crime_path)
 
             # ✅ Filter out rows with missing latitude/longitude values
             crime_df = crime_df.dropna(subset=["Lat", "Long"])
@@ -742,46 +577,23 @@ def generate_basemap_feature(time_of_day,active_layers=None, show_heatmap=False)
                     min_opacity=0.4,
                 ).add_to(mbta_map)
 
-    description_html = f"""
-                <div style="position: fixed; 
-                            bottom: 30px; left: 50px; 
-                            width: 160px; background-color: rgba(255, 255, 255, 0.8); 
-                            z-index:9999; font-size:14px; 
-                            padding: 10px; border-radius: 5px; 
-                            text-align: left ; box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-                    <strong> Network Attributes</strong><br>
-                    Total Nodes: {total_nodes}</strong><br>
-                    Total Edges: {total_edges}</strong><br>
-                    Rail Lines: 4</strong>
-                </div>
-                """
-    mbta_map.get_root().html.add_child(folium.Element(description_html))
-
-    feature_title_html = f"""
-        <div style="position: fixed; 
-                    top: 10px; 
-                    left: 60px; 
-                    background-color: white; 
-                    color: black; 
-                    padding: 8px 14px; 
-                    font-weight: bold; 
-                    font-size: 20px; 
-                    border-radius: 5px; 
-                    z-index: 9999;">
-            Boston Urban Rail Basemap
-        </div>
-        """
-
-    mbta_map.get_root().html.add_child(folium.Element(feature_title_html))
+    add_description(mbta_map, "<strong>Network Attributes</strong><br>"
+                              f"Total Nodes: {total_nodes}<br>"
+                              f"Total Edges: {total_edges}<br>"
+                              "Rail Lines: 4", style="mbta-translucent")
+    add_title(mbta_map, "<b>Boston Urban Rail Basemap</b>")
 
     # ✅ Save the Basemap
     map_path = os.path.join(output_folder, "mbta_basemap.html")
-    mbta_map.save(map_path)
+    with span("save"):
+        save_map(mbta_map, map_path)
     return map_path
 
 
 temp_folder="page_3_threat_features/temp_playground"
+overlay_output_folder = "page_3_threat_features/output_maps"
 
+@traced
 def generate_attractiveness_map(time_of_day):
     csv_file = f"Feature_Label_{time_of_day}.csv"
     file_path = os.path.join(temp_folder, csv_file)
@@ -791,16 +603,16 @@ def generate_attractiveness_map(time_of_day):
         return None
 
     # Load the selected CSV file
-    feature_df = pd.read_csv(file_path)
+    with span("read_csv", path=file_path):
+        feature_df = pd.read_csv(file_path)
 
     center_lat = feature_df['Lat'].mean()
     center_lon = feature_df['Lon'].mean()
-    mbta_map = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='CartoDB positron')
+    mbta_map = create_base_map(center_lat, center_lon)
 
     # Define the colormap for Attractiveness
-    min_val = feature_df["Attractiveness"].min()
-    max_val = feature_df["Attractiveness"].max()
-    median_val = feature_df["Attractiveness"].median()
+    window_stats = get_feature_stats(temp_folder).window(time_of_day)["Attractiveness"]
+    min_val, max_val, median_val = window_stats["min"], window_stats["max"], window_stats["median"]
     colormap = cm.LinearColormap(["green", "yellow", "red"], vmin=min_val, vmax=max_val)
 
     # ✅ **Retained Edge Structure**
@@ -850,73 +662,22 @@ def generate_attractiveness_map(time_of_day):
         ).add_to(mbta_map)
 
     # ✅ **Add Color Bar**
-        # Vertical color bar with labels for min, median, max values
-        legend_html = f"""
-            <div style="position: fixed; bottom: 50px; left: 50px; width: 60px; height: 200px; background-color: rgba(255, 255, 255, 0.8); 
-                        z-index:9999; font-size:12px; border: none; padding: 10px; text-align: center;">
-
-                <!-- Color Gradient Bar -->
-                <div style="height: 170px; width: 20px; background: linear-gradient(to top, green, yellow, red); margin: auto;"></div>
-
-                <!-- Min, Median, Max Values -->
-                <div style="position: absolute; bottom: 20px; left: 45px;">{min_val:.2f}</div>
-                <div style="position: absolute; top: 50%; left: 45px; transform: translateY(-50%);">{median_val:.2f}</div>
-                <div style="position: absolute; top: 0; left: 45px;">{max_val:.2f}</div>
-
-                <!-- Label for Normalized Values BELOW the bar -->
-                <div style="position: absolute; bottom: -25px; left: 50%; transform: translateX(-50%); font-weight: bold; font-size: 12px;">
-                    Normalized Values
-                </div>
-            </div>
-
-            """
-    mbta_map.get_root().html.add_child(folium.Element(legend_html))
-
-    description_html = f"""
-        <div style="position: fixed; 
-                    bottom: 50px; 
-                    left: 130px;  /* Positioned just to the right of the legend */
-                    width: 300px; 
-                    background-color: white; 
-                    z-index:9999; 
-                    font-size:14px; 
-                    padding: 10px; 
-                    border-radius: 5px; 
-                    box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-                    Normalized Composite score based on multiple threat, defense, and network features to represent assumed adversarial preferences. (These scores may be updated based on subject matter expert inputs)
-        </div>
-        """
-
-    mbta_map.get_root().html.add_child(folium.Element(description_html))
-
-    feature_title_html = f"""
-    <div style="position: fixed; 
-                top: 10px; 
-                left: 60px; 
-                background-color: white; 
-                color: black; 
-                padding: 10px 14px; 
-                font-weight: normal; 
-                font-size: 20px; 
-                border-radius: 6px; 
-                z-index: 9999; 
-                max-width: 500px;
-                box-shadow: 2px 2px 5px rgba(0,0,0,0.4);">
-        <b>Attractiveness:</b> normalized composite score from an adversarial perspective.
-    </div>
-    """
-
-    mbta_map.get_root().html.add_child(folium.Element(feature_title_html))
+    # Vertical color bar with labels for min, median, max values
+    add_gradient_legend(mbta_map, min_val, median_val, max_val)
+    add_description(mbta_map, feature_descriptions["Attractiveness"])
+    add_title(mbta_map, f"<b>Attractiveness:</b> {feature_title['Attractiveness']}")
 
     # ✅ **Save the Final Map**
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
     map_path = os.path.join(output_folder, f"mbta_attractiveness_{time_of_day}.html")
-    mbta_map.save(map_path)
+    with span("save"):
+        save_map(mbta_map, map_path)
 
     return map_path
 
 
+@traced
 def generate_overlay_singular_map(time_of_day, feature, top_k, common=False):
     """
     Generates a map overlaying the top K nodes based on a selected feature.
@@ -924,9 +685,6 @@ def generate_overlay_singular_map(time_of_day, feature, top_k, common=False):
     - If `common` is False: Highlights top-K nodes based on the selected feature's colormap.
     """
 
-    temp_folder = "page_3_threat_features/temp_playground"
-    output_folder = "page_3_threat_features/output_maps"
-
     csv_file = f"Feature_Label_{time_of_day}.csv"
     file_path = os.path.join(temp_folder, csv_file)
 
@@ -935,42 +693,29 @@ def generate_overlay_singular_map(time_of_day, feature, top_k, common=False):
         return None
 
     # Load the CSV file
-    feature_df = pd.read_csv(file_path)
+    with span("read_csv", path=file_path):
+        feature_df = pd.read_csv(file_path)
 
     # Compute center for map view
     center_lat = feature_df['Lat'].mean()
     center_lon = feature_df['Lon'].mean()
-    mbta_map = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='CartoDB positron')
+    mbta_map = create_base_map(center_lat, center_lon)
 
     # Define colormap for numerical features (if not in common mode)
     if not common:
-        min_val = feature_df[feature].min()
-        max_val = feature_df[feature].max()
-        median_val = feature_df[feature].median()
+        window_stats = get_feature_stats(temp_folder).window(time_of_day)[feature]
+        min_val, max_val, median_val = window_stats["min"], window_stats["max"], window_stats["median"]
         colormap = cm.LinearColormap(["green", "yellow", "red"], vmin=min_val, vmax=max_val)
     else:
         colormap = None  # No color scheme for common map
 
-    ascending_features = {"D_nearest_police", "D_nearest_fire", "D_nearest_hospital","D_police_fire"}
-
-    # Determine if the feature is ascending or descending
-
-
-
-    # Determine the top K stations based on the feature
+    # Determine the top K stations based on the feature (precomputed rankings, distance features ascending)
+    ranking = get_ranking_index(temp_folder)
     if not common:
-        top_k_nodes = feature_df.nlargest(top_k, feature)["ID"].tolist()
+        in_top_k = ranking.top_k_mask(time_of_day, feature, top_k)
     else:
-        # Collect top_k nodes for each selected feature
-        top_k_sets = [
-            set(feature_df.nlargest(top_k, feat)["ID"].tolist()) for feat in feature
-        ]
-
-        # Count occurrences of each node in multiple features
-        node_counts = {}
-        for feature_set in top_k_sets:
-            for node in feature_set:
-                node_counts[node] = node_counts.get(node, 0) + 1
+        # Count in how many of the selected features' top K each station appears
+        node_counts = ranking.common_counts(time_of_day, feature, top_k)
 
         # Assign colors based on occurrences
         node_color_map = {
@@ -998,21 +743,20 @@ def generate_overlay_singular_map(time_of_day, feature, top_k, common=False):
         ).add_to(mbta_map)
 
     # ✅ **Add Nodes (Stations)**
-    for _, row in feature_df.iterrows():
-        station_id = row['ID']
+    for position, (_, row) in enumerate(feature_df.iterrows()):
         station_name = row["Station_Name"]
         lat, lon = row["Lat"], row["Lon"]
         feature_value = row[feature]
 
         # Coloring logic:
         if common:
-            node_count = node_counts.get(station_id, 0)
+            node_count = node_counts[position]
             node_color = node_color_map.get(node_count, "grey")  # Assign color based on occurrences
             node_radius = 5 if node_count > 0 else 3  # Highlight top nodes3
         else:
             # Top K nodes get color from colormap, others are grey
-            node_color = colormap(feature_value) if station_id in top_k_nodes else "grey"
-            node_radius = 5 if station_id in top_k_nodes else 3
+            node_color = colormap(feature_value) if in_top_k[position] else "grey"
+            node_radius = 5 if in_top_k[position] else 3
 
 
         if not common:
@@ -1033,73 +777,316 @@ def generate_overlay_singular_map(time_of_day, feature, top_k, common=False):
 
     # ✅ **Add Color Bar (Only for Individual Feature Maps)**
     if not common:
-        legend_html = f"""
-        <div style="position: fixed; bottom: 50px; left: 50px; width: 40px; height: 180px; background-color: rgba(255, 255, 255, 0.8); z-index:9999; font-size:12px; border: none; padding: 10px;">
-            <div style="height: 170px; width: 20px; background: linear-gradient(to top, green, yellow, red);"></div>
-            <div style="position: absolute; bottom: 0; left: 35px;">{min_val:.2f}</div>
-            <div style="position: absolute; top: 50%; left: 35px;">{median_val:.2f}</div>
-            <div style="position: absolute; top: 0; left: 35px;">{max_val:.2f}</div>
-        </div>
-        """
-
+        add_gradient_legend(mbta_map, min_val, median_val, max_val, caption=None)
+        add_description(mbta_map, f"The stations are color-coded representing <strong>{feature.replace('_', ' ').capitalize()}</strong>, "
+                                  f"highlighting the top {top_k} stations in this feature.", slot=None, style="mbta-note")
     else:
         # Color legend for common occurrence map
-        legend_html = """
-        <div style="position: fixed; bottom: 50px; left: 50px; width: 150px; height: 100px; background-color: rgba(255, 255, 255, 0.8); z-index:9999; font-size:12px; border: none; padding: 10px;">
-            <b>Common Occurrences</b><br>
-            <div style="height: 15px; width: 15px; background: red; display: inline-block;"></div> Present in all frames<br>
-            <div style="height: 15px; width: 15px; background: orange; display: inline-block;"></div> Present in 2 frames<br>
-            <div style="height: 15px; width: 15px; background: yellow; display: inline-block;"></div> Present in 1 frames<br>
-        </div>
-        """
-    mbta_map.get_root().html.add_child(folium.Element(legend_html))
-
-    # ✅ **Description (Only for Individual Feature Maps)**
-    if not common:
-        description_html = f"""
-        <div style="position: fixed; 
-                    top: 10px; 
-                    left: 10px; 
-                    width: 300px; 
-                    background-color: white; 
-                    z-index:9999; 
-                    font-size:14px; 
-                    padding: 10px; 
-                    border-radius: 5px; 
-                    box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-            The stations are color-coded representing <strong>{feature.replace("_", " ").capitalize()}</strong>, 
-            highlighting the top {top_k} stations in this feature.
-        </div>
-        """
-    else:
-        description_html = f"""
-                <div style="position: fixed; 
-                            top: 10px; 
-                            left: 10px; 
-                            width: 300px; 
-                            background-color: white; 
-                            z-index:9999; 
-                            font-size:14px; 
-                            padding: 10px; 
-                            border-radius: 5px; 
-                            box-shadow: 2px 2px 5px rgba(0,0,0,0.3);">
-                    Represents the common stations which are overlapping in all 3 ranges.
-                </div>
-                """
-    mbta_map.get_root().html.add_child(folium.Element(description_html))
+        add_category_legend(mbta_map, {"Present in all frames": "red", "Present in 2 frames": "orange",
+                                       "Present in 1 frames": "yellow"}, title="Common Occurrences", style="mbta-translucent")
+        add_description(mbta_map, "Represents the common stations which are overlapping in all 3 ranges.",
+                        slot=None, style="mbta-note")
 
     # ✅ **Save the Final Map**
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    if not os.path.exists(overlay_output_folder):
+        os.makedirs(overlay_output_folder)
 
     # Different filenames for individual and common maps
     if common:
-        map_path = os.path.join(output_folder, f"mbta_common_top{top_k}_{time_of_day}.html")
+        map_path = os.path.join(overlay_output_folder, f"mbta_common_top{top_k}_{time_of_day}.html")
+    else:
+        map_path = os.path.join(overlay_output_folder, f"mbta_{feature}_top{top_k}_{time_of_day}.html")
+
+    with span("save"):
+        save_map(mbta_map, map_path)
+
+    return map_path
+
+
+
+
+# Temporal (cross-window) map modes, see page_3_threat_features/temporal_analytics.py
+temporal_metric_titles = {
+    "volatility": "Volatility across the day",
+    "peak_window": "Peak time window",
+    "rank_change": "Rank change",
+}
+rank_change_colors = ["blue", "#d3d3d3", "red"]
+window_colors = ["#313695", "#4575b4", "#74add1", "#abd9e9", "#fee090", "#fdae61", "#f46d43", "#d73027", "#a50026"]
+
+
+@traced
+def generate_temporal_map(feature, metric, time_of_day=None, top_k=None):
+    """
+    Colors every station by how a feature changes across the time windows:
+    - volatility: std / mean of the feature over the 9 windows
+    - peak_window: the window in which the station scores best (lowest for the distance features)
+    - rank_change: rank gained since the previous window (time_of_day is the window moved into)
+    For volatility and rank_change only the top K stations are highlighted.
+    """
+    analytics = get_temporal_analytics(temp_folder)
+    profiles = analytics.profiles
+    if profiles is None or feature not in profiles.values:
+        print(f"No temporal profile for {feature} in {temp_folder}")
+        return None
+
+    stations = profiles.stations
+    values = profiles.values[feature]
+    stats = profiles.stats[feature]
+    mbta_map = create_base_map(stations["Lat"].mean(), stations["Lon"].mean())
+
+    title = f"<b>{feature.replace('_', ' ')}:</b> {temporal_metric_titles[metric]}"
+    if metric == "rank_change":
+        time_of_day = time_of_day or profiles.windows[-1]
+        to_column = profiles.window_index(time_of_day)
+        from_window = profiles.windows[to_column - 1]  # The first window compares with the last one (overnight)
+        scores = analytics.rank_change(feature, from_window, time_of_day).astype(float)
+        title += f" {from_window} → {time_of_day}"
+        spread = max(np.abs(scores).max(), 1)
+        colormap = cm.LinearColormap(rank_change_colors, vmin=-spread, vmax=spread)
+    elif metric == "volatility":
+        scores = stats["volatility"]
+        colormap = cm.LinearColormap(["green", "yellow", "red"], vmin=scores.min(), vmax=scores.max())
+    else:
+        scores = None
+        colormap = None
+
+    if scores is not None and top_k and top_k < len(stations):
+        highlighted = np.zeros(len(stations), dtype=bool)
+        highlighted[np.argsort(-scores, kind="stable")[:top_k]] = True
+    else:
+        highlighted = np.ones(len(stations), dtype=bool)
+
+    # ✅ **Retained Edge Structure**
+    edge_width = 1.5
+    for _, row in edges_df.iterrows():
+        source_id, target_id = row['Source'], row['Target']
+        line = row['Line']
+
+        source_pos = [G.nodes[source_id]['pos'][0], G.nodes[source_id]['pos'][1]]
+        target_pos = [G.nodes[target_id]['pos'][0], G.nodes[target_id]['pos'][1]]
+
+        line_color = color_mapping.get(line, 'gray')
+
+        folium.PolyLine(
+            [source_pos, target_pos],
+            color=line_color,
+            weight=edge_width,
+            opacity=0.8
+        ).add_to(mbta_map)
+
+    # ✅ **Add Nodes (Stations)**
+    for position, row in enumerate(stations.itertuples(index=False)):
+        peak = stats["peak"][position]
+        if metric == "peak_window":
+            node_color = window_colors[peak] if peak >= 0 else "grey"
+        else:
+            node_color = colormap(scores[position]) if highlighted[position] else "#B0B0B0"
+        node_radius = 5 if highlighted[position] else 3
+
+        profile = "<br>".join(f"{window}: {value:.3f}" for window, value in zip(profiles.windows, values[position])
+                              if not np.isnan(value))
+        content = (f"Station: {row.Station_Name}<br>"
+                   f"Peak window: {profiles.windows[peak] if peak >= 0 else '-'}<br>"
+                   f"Volatility: {stats['volatility'][position]:.2f}<br>"
+                   + (f"Rank change: {int(scores[position]):+d}<br>" if metric == "rank_change" else "")
+                   + f"<br>{profile}")
+
+        folium.CircleMarker(
+            location=[row.Lat, row.Lon],
+            radius=node_radius,
+            color=node_color,
+            fill=True,
+            fill_color=node_color,
+            fill_opacity=1.0,
+            tooltip=content,
+            popup=folium.Popup(content, max_width=250),
+        ).add_to(mbta_map)
+
+    # ✅ **Legends**
+    if metric == "peak_window":
+        add_category_legend(mbta_map, dict(zip(profiles.windows, window_colors)), title="Peak window")
     else:
-        map_path = os.path.join(output_folder, f"mbta_{feature}_top{top_k}_{time_of_day}.html")
+        middle = 0 if metric == "rank_change" else np.median(scores)
+        add_gradient_legend(mbta_map, colormap.vmin, middle, colormap.vmax,
+                            caption="Ranks gained" if metric == "rank_change" else "Volatility",
+                            colors=rank_change_colors if metric == "rank_change" else gradient_colors)
+        order = np.argsort(-scores, kind="stable")[:min(top_k or 10, 10)]
+        add_ranked_list(mbta_map, f"Top {len(order)}: {temporal_metric_titles[metric]}",
+                        [(stations["Station_Name"].iat[row], scores[row]) for row in order],
+                        int(highlighted.sum()) - len(order))
+    add_title(mbta_map, title)
+
+    # ✅ **Save the Final Map**
+    if not os.path.exists(overlay_output_folder):
+        os.makedirs(overlay_output_folder)
+    map_path = os.path.join(overlay_output_folder, f"mbta_temporal_{feature}_{metric}_{time_of_day or 'all'}_top{top_k}.html")
+    with span("save"):
+        save_map(mbta_map, map_path)
+
+    return map_path
+
+
+sensitivity_scopes = {"own_effect": "at the edited station", "network_effect": "summed over all stations"}
+
+
+@traced
+def generate_sensitivity_map(time_of_day, feature, level=None, scope="own_effect", top_k=10, model=None):
+    """
+    Colors every station by the estimated change of its Attractiveness in `time_of_day` if `feature` were
+    raised (continuous features) or set to `level` (Threat_Level / Defense_Posture) at that station,
+    from the GCN-LSTM's gradients (`model`, default: the active version). The top K stations by size of the
+    effect are highlighted and listed.
+    """
+    # Imported here so maps that do not need the model do not pay for loading torch
+    from page_3_threat_features.GCN.inference import get_sensitivity, continuous_step
+
+    table = get_sensitivity(temp_folder, model=model)
+    if table is None:
+        return None
+    selection = table[(table["time_of_day"] == time_of_day) & (table["feature"] == feature)]
+    selection = selection[selection["level"].isna()] if level is None else selection[selection["level"] == level]
+    effects = dict(zip(selection["ID"], selection[scope]))
+
+    feature_df = pd.read_csv(os.path.join(temp_folder, f"Feature_Label_{time_of_day}.csv"))
+    mbta_map = create_base_map(feature_df['Lat'].mean(), feature_df['Lon'].mean())
+
+    values = np.array([effects.get(station_id, 0.0) for station_id in feature_df["ID"]])
+    spread = max(np.abs(values).max(), 1e-6)
+    colormap = cm.LinearColormap(rank_change_colors, vmin=-spread, vmax=spread)
+    order = np.argsort(-np.abs(values), kind="stable")
+    highlighted = np.zeros(len(values), dtype=bool)
+    highlighted[order[:top_k]] = True
+
+    # ✅ **Retained Edge Structure**
+    edge_width = 1.5
+    for _, row in edges_df.iterrows():
+        source_id, target_id = row['Source'], row['Target']
+        line = row['Line']
+
+        source_pos = [G.nodes[source_id]['pos'][0], G.nodes[source_id]['pos'][1]]
+        target_pos = [G.nodes[target_id]['pos'][0], G.nodes[target_id]['pos'][1]]
+
+        line_color = color_mapping.get(line, 'gray')
+
+        folium.PolyLine(
+            [source_pos, target_pos],
+            color=line_color,
+            weight=edge_width,
+            opacity=0.8
+        ).add_to(mbta_map)
+
+    # ✅ **Add Nodes (Stations)**
+    edit = f"{feature} → {level}" if level else f"{feature} +{continuous_step}"
+    for position, row in enumerate(feature_df.itertuples(index=False)):
+        station_id = row.ID
+        node_color = colormap(values[position]) if highlighted[position] else "#B0B0B0"
+        if station_id not in effects:
+            node_color = "grey"  # Already at this level in every window
+        content = (f"Station: {row.Station_Name}<br>"
+                   f"{feature}: {getattr(row, feature)}<br>"
+                   f"Attractiveness: {row.Attractiveness:.3f}<br>"
+                   f"Effect of {edit}: {values[position]:+.4f}")
 
-    mbta_map.save(map_path)
+        folium.CircleMarker(
+            location=[row.Lat, row.Lon],
+            radius=5 if highlighted[position] else 3,
+            color=node_color,
+            fill=True,
+            fill_color=node_color,
+            fill_opacity=1.0,
+            tooltip=content,
+            popup=folium.Popup(content, max_width=250),
+        ).add_to(mbta_map)
+
+    add_gradient_legend(mbta_map, -spread, 0, spread, caption="Δ Attractiveness", colors=rank_change_colors)
+    add_ranked_list(mbta_map, f"Top {min(top_k, 10)}: largest effect", [(feature_df["Station_Name"].iat[row], values[row])
+                                                                        for row in order[:min(top_k, 10)]],
+                    max(top_k - 10, 0))
+    add_title(mbta_map, f"<b>Sensitivity:</b> {edit} ({time_of_day}, {sensitivity_scopes[scope]})")
+    add_description(mbta_map, "Linearized estimate from the GCN-LSTM gradients; use Simulate for the exact prediction.",
+                    slot=None, style="mbta-note")
+
+    # ✅ **Save the Final Map**
+    if not os.path.exists(overlay_output_folder):
+        os.makedirs(overlay_output_folder)
+    map_path = os.path.join(overlay_output_folder, f"mbta_sensitivity_{feature}_{level or 'raise'}_{scope}_{time_of_day}.html")
+    with span("save"):
+        save_map(mbta_map, map_path)
 
     return map_path
 
 
+@traced
+def generate_uncertainty_map(time_of_day, samples=100, top_k=10, model=None):
+    """
+    Colors every station by the uncertainty (MC dropout std) of its predicted Attractiveness in `time_of_day`
+    (`model`, default: the active version); the tooltip gives the mean and the 90% interval of the sampled predictions.
+    """
+    # Imported here so maps that do not need the model do not pay for loading torch
+    from page_3_threat_features.GCN.inference import get_uncertainty
+
+    table = get_uncertainty(temp_folder, samples, model=model)
+    if table is None:
+        return None
+    window_table = table[table["time_of_day"] == time_of_day].set_index("ID")
+
+    feature_df = pd.read_csv(os.path.join(temp_folder, f"Feature_Label_{time_of_day}.csv"))
+    mbta_map = create_base_map(feature_df['Lat'].mean(), feature_df['Lon'].mean())
+    estimate = window_table.reindex(feature_df["ID"])
+    std = estimate["std"].to_numpy()
+    colormap = cm.LinearColormap(gradient_colors, vmin=np.nanmin(std), vmax=np.nanmax(std))
+    order = np.argsort(-np.nan_to_num(std), kind="stable")
+
+    # ✅ **Retained Edge Structure**
+    edge_width = 1.5
+    for _, row in edges_df.iterrows():
+        source_id, target_id = row['Source'], row['Target']
+        line = row['Line']
+
+        source_pos = [G.nodes[source_id]['pos'][0], G.nodes[source_id]['pos'][1]]
+        target_pos = [G.nodes[target_id]['pos'][0], G.nodes[target_id]['pos'][1]]
+
+        line_color = color_mapping.get(line, 'gray')
+
+        folium.PolyLine(
+            [source_pos, target_pos],
+            color=line_color,
+            weight=edge_width,
+            opacity=0.8
+        ).add_to(mbta_map)
+
+    # ✅ **Add Nodes (Stations)**, sized by the width of the interval
+    width = (estimate["high"] - estimate["low"]).to_numpy()
+    for position, row in enumerate(feature_df.itertuples(index=False)):
+        if np.isnan(std[position]):
+            continue
+        content = (f"Station: {row.Station_Name}<br>"
+                   f"Attractiveness: {estimate['prediction'].iat[position]:.3f}<br>"
+                   f"MC mean ± std: {estimate['mean'].iat[position]:.3f} ± {std[position]:.3f}<br>"
+                   f"90% interval: {estimate['low'].iat[position]:.3f} – {estimate['high'].iat[position]:.3f}")
+
+        folium.CircleMarker(
+            location=[row.Lat, row.Lon],
+            radius=3 + 6 * width[position] / max(np.nanmax(width), 1e-6),
+            color=colormap(std[position]),
+            fill=True,
+            fill_color=colormap(std[position]),
+            fill_opacity=1.0,
+            tooltip=content,
+            popup=folium.Popup(content, max_width=250),
+        ).add_to(mbta_map)
+
+    add_gradient_legend(mbta_map, np.nanmin(std), np.nanmedian(std), np.nanmax(std), caption="Std of Attractiveness")
+    add_ranked_list(mbta_map, f"Top {top_k}: most uncertain", [(feature_df["Station_Name"].iat[row], std[row])
+                                                                for row in order[:top_k]])
+    add_title(mbta_map, f"<b>Prediction uncertainty:</b> {time_of_day} ({samples} MC dropout samples)")
+
+    # ✅ **Save the Final Map**
+    if not os.path.exists(overlay_output_folder):
+        os.makedirs(overlay_output_folder)
+    map_path = os.path.join(overlay_output_folder, f"mbta_uncertainty_{time_of_day}_{samples}.html")
+    with span("save"):
+        save_map(mbta_map, map_path)
+
+    return map_path